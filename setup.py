@@ -5,7 +5,8 @@ from distutils.core import setup
 setup(name='Splonebox Python Client',
       version='0.1',
       description='A client implementation to communicate with the splonebox core',
-      install_requires=['pycrypto>=2.6.1', 'msgpack-python>=0.4.6'],
+      install_requires=['pycrypto>=2.6.1', 'msgpack-python>=0.5.2'],
+      extras_require={'numpy': ['numpy']},
       author='bontric',
       packages=['splonebox', 'splonebox.api', 'splonebox.rpc', 'splonebox.os'],
       license='GNU Lesser General Public License v3')
@@ -20,6 +20,8 @@ see <http://www.gnu.org/licenses/>.
 from splonebox.api.core import Core, CoreError
 from splonebox.api.plugin import Plugin
 from splonebox.api.result import RunResult
+from splonebox.api.response import wait, as_completed, ALL_COMPLETED, \
+    FIRST_COMPLETED, FIRST_EXCEPTION
 from splonebox.api.apicall import ApiRun
 from splonebox.api.subscription import Subscription
 
@@ -78,7 +80,7 @@ def unsubscribe(event_name: str, blocking=True):
         raise CoreError("Core not inited - You need to call connect(..) first")
 
     rsp = __core.unsubscribe(event_name)
-    rsp.await()
+    rsp.await_response()
 
 
 def send_run(plugin_id: str, function_name: str, args: []) -> RunResult:
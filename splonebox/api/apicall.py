@@ -17,9 +17,87 @@ see <http://www.gnu.org/licenses/>.
 
 """
 
-import copy
-
 from splonebox.rpc.message import MRequest, MNotify, InvalidMessageError
+from splonebox.api.compression import Compression, is_compressed
+from splonebox.api.sharedmem import SharedMemory, attach, is_shared, \
+    release, release_args
+from splonebox.api.arrays import is_array, is_ndarray, pack_array
+
+
+_scalar_types = (str, bytes, int, float, bool)
+_key_types = (str, bytes, int)
+
+
+def _is_valid_value(value) -> bool:
+    """Checks that value is a scalar or a (nested) list or map of valid
+    values. Map keys have to be strings, bytes or integers. Nested values
+    may be None (nil), like the nulls of data converted from JSON.
+    """
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if value is None or isinstance(value, _scalar_types):
+            continue
+        elif isinstance(value, list):
+            stack.extend(value)
+        elif isinstance(value, dict):
+            for key in value:
+                if not isinstance(key, _key_types):
+                    return False
+            stack.extend(value.values())
+        else:
+            return False
+    return True
+
+
+def _is_valid_timeout(timeout) -> bool:
+    return isinstance(timeout, (int, float)) and \
+        not isinstance(timeout, bool) and timeout >= 0
+
+
+def unwrap_value(value, compression: Compression=None,
+                 shared_memory: SharedMemory=None):
+    """Returns the original of a compressed value or the content of a
+    shared memory segment. Other values are returned as they are.
+
+    :param compression: compressed values are only accepted if set, their
+                        size is limited by compression.max_size
+    :param shared_memory: shared memory handles are only attached if set,
+                          otherwise their segments are removed
+    :raises :ValueError if value can't be restored
+    """
+    if is_shared(value):
+        if shared_memory is None:
+            release(value)
+            raise ValueError("Shared memory is not enabled")
+        return attach(value)
+    if is_compressed(value):
+        if compression is None:
+            raise ValueError("Compression is not enabled")
+        return compression.decompress(value)
+    return value
+
+
+def unwrap_args(args: [], compression: Compression=None,
+                shared_memory: SharedMemory=None) -> []:
+    """Returns args with all wrapped values replaced by their originals
+
+    args itself is returned if nothing was wrapped. If a value can't be
+    restored, the segments of all shared arguments are removed.
+
+    :param compression: see unwrap_value
+    :param shared_memory: see unwrap_value
+    :raises :ValueError if a value can't be restored
+    """
+    for arg in args:
+        if is_compressed(arg) or is_shared(arg):
+            try:
+                return [unwrap_value(a, compression, shared_memory)
+                        for a in args]
+            except ValueError:
+                release_args(args)
+                raise
+    return args
 
 
 class ApiCall:
@@ -31,6 +109,10 @@ class ApiCall:
     def __init__(self):
         self.msg = MRequest()
 
+    def release(self):
+        """Removes the shared memory segments of a call that can't be sent"""
+        pass
+
 
 class ApiRegister(ApiCall):
     """Register api call.
@@ -43,7 +125,7 @@ class ApiRegister(ApiCall):
 
         :raises InvalidApiCallError: if the information is invalid
     """
-    _valid_args = ["", 3, -1, False, 2.0, b'']
+    _valid_args = ["", 3, -1, False, 2.0, b'', [], {}]
 
     def __init__(self, metadata: [], functions: []):
         super().__init__()
@@ -80,17 +162,30 @@ class ApiRun(ApiCall):
     """Run api call
     :param plugin_id: plugin identifier of the plugin to be called
     :param function_name: function wto be called
-    :param args: list of arguments for the remote function
+    :param args: list of arguments for the remote function, numpy arrays
+                 are sent as dtype, shape and raw data. Lists and maps may
+                 be nested and contain any valid argument type except
+                 arrays.
+    :param compression: if set, large arguments are compressed
+    :param shared_memory: if set, large bytes arguments are passed through
+                          shared memory
+    :param timeout: seconds the caller waits for the result, sent along so
+                    the called plugin can give up in time
     :raises InvalidApiCallError: if the Information is invalid
     """
-    _valid_types = (str, bytes, int, float, bool)
+    _valid_types = (str, bytes, int, float, bool, list, dict)
 
-    def __init__(self, plugin_id: str, function_name: str, args: []):
+    def __init__(self, plugin_id: str, function_name: str, args: [],
+                 compression: Compression=None,
+                 shared_memory: SharedMemory=None, timeout: float=None):
         super().__init__()
 
         if not isinstance(plugin_id, str):
             raise InvalidApiCallError("plugin identifier has to be a string")
 
+        if timeout is not None and not _is_valid_timeout(timeout):
+            raise InvalidApiCallError("timeout has to be a positive number")
+
         if not isinstance(function_name, str):
             raise InvalidApiCallError("function name has to be a string")
 
@@ -98,30 +193,80 @@ class ApiRun(ApiCall):
             args = []
 
         for arg in args:
-            if not isinstance(arg, ApiRun._valid_types):
+            if isinstance(arg, (list, dict)):
+                if not _is_valid_value(arg):
+                    raise InvalidApiCallError("Invalid Argument type!")
+            elif not isinstance(arg, ApiRun._valid_types) and \
+                    not is_ndarray(arg):
                 raise InvalidApiCallError("Invalid Argument type!")
 
+        if any(is_ndarray(arg) for arg in args):
+            try:
+                args = [pack_array(arg) if is_ndarray(arg) else arg
+                        for arg in args]
+            except ValueError as e:
+                raise InvalidApiCallError(str(e))
+
+        if shared_memory is not None:
+            args = shared_memory.share_args(args)
+
+        if compression is not None:
+            args = compression.compress_args(args)
+
         self.msg = MRequest()
         self.msg.function = "run"
         self.msg.arguments = [[plugin_id, None], function_name, args]
+        if timeout is not None:
+            # only sent if set, the body stays compatible
+            self.msg.arguments.append(timeout)
 
     @staticmethod
-    def from_msgpack_request(msg: MRequest):
+    def from_msgpack_request(msg: MRequest, raw: bool=True,
+                             trusted: bool=False,
+                             compression: Compression=None,
+                             shared_memory: SharedMemory=None):
         """ Generates an ApiRun object from a given MRequest
 
-        :param msg: A Request received and unpacked with MsgpackRpc. It is
-                    assumed, that the strings in msg.body are still in
-                    binary format!
+        :param msg: A Request received and unpacked with MsgpackRpc.
+        :param raw: True if the strings in msg.body are still in binary
+                    format, False if they were decoded by the unpacker
+        :param trusted: skip the type checks, only the form of the body is
+                        verified
+        :param compression: compressed arguments are only accepted if set
+        :param shared_memory: shared memory arguments are only attached if
+                              set
         :return: ApiRun
         :raises  InvalidMessageError: if provided message is
-                    not a valid Run call
+                    not a valid Run call, its shared memory segments are
+                    removed
         """
+        if trusted:
+            return ApiRun._from_trusted_request(msg, raw, compression,
+                                                shared_memory)
+
+        try:
+            return ApiRun._from_request(msg, raw, compression, shared_memory)
+        except InvalidMessageError:
+            ApiRun.release_request(msg)
+            raise
+
+    @staticmethod
+    def release_request(msg: MRequest):
+        """Removes the shared memory segments of a received run request
+        that is rejected before its arguments were attached"""
+        if isinstance(msg.arguments, list) and len(msg.arguments) > 2:
+            release_args(msg.arguments[2])
+
+    @staticmethod
+    def _from_request(msg: MRequest, raw: bool, compression: Compression,
+                      shared_memory: SharedMemory):
 
         if not isinstance(msg.function, str) or msg.function != "run":
             raise InvalidMessageError(
                 "Invalid run Request, specified method is not run")
 
-        if not isinstance(msg.arguments, list) or len(msg.arguments) != 3:
+        if not isinstance(msg.arguments, list) or \
+                len(msg.arguments) not in (3, 4):
             raise InvalidMessageError("Message body is faulty")
 
         if not isinstance(msg.arguments[0],
@@ -134,41 +279,92 @@ class ApiRun(ApiCall):
         if not isinstance(msg.arguments[0][1], int):
             raise InvalidMessageError("Call_id is invaild")
 
-        if not isinstance(msg.arguments[1], bytes):
-            raise InvalidMessageError("Function name is not bytes")
+        if len(msg.arguments) == 4 and msg.arguments[3] is not None and \
+                not _is_valid_timeout(msg.arguments[3]):
+            raise InvalidMessageError("Timeout is invalid")
+
+        if not isinstance(msg.arguments[1], bytes if raw else str):
+            raise InvalidMessageError("Function name is not a string")
 
         if not isinstance(msg.arguments[2], list):
             raise InvalidMessageError("Third element of body has to be a list")
 
-        msg = copy.deepcopy(msg)
-        msg.arguments[1] = msg.arguments[1].decode('ascii')
-
         for arg in msg.arguments[2]:
-            if not isinstance(arg, ApiRun._valid_types):
+            if isinstance(arg, (list, dict)):
+                if not _is_valid_value(arg):
+                    raise InvalidMessageError("Invalid Argument type!")
+            elif not isinstance(arg, ApiRun._valid_types) and \
+                    not is_compressed(arg) and not is_array(arg) and \
+                    not is_shared(arg):
                 raise InvalidMessageError("Invalid Argument type!")
 
-        call = ApiRun("", msg.arguments[1], msg.arguments[2])
-        call.msg._msgid = msg._msgid  # keep the original msg_id
+        name = msg.arguments[1]
+        if raw:
+            name = name.decode('utf-8')
+
+        try:
+            args = unwrap_args(msg.arguments[2], compression, shared_memory)
+        except ValueError as e:
+            raise InvalidMessageError("Invalid argument: " + str(e))
+
+        # the arguments are passed on as they are, they are only copied if
+        # some of them were wrapped
+        call = ApiRun.__new__(ApiRun)
+        call.msg = MRequest._received(msg.get_msgid(), "run",
+                                      [[None, msg.arguments[0][1]], name,
+                                       args] + msg.arguments[3:])
+        return call
 
+    @staticmethod
+    def _from_trusted_request(msg: MRequest, raw: bool,
+                              compression: Compression,
+                              shared_memory: SharedMemory):
+        try:
+            (_, call_id), name, args = msg.arguments[:3]
+            if raw:
+                name = name.decode('utf-8')
+            args = unwrap_args(args, compression, shared_memory)
+        except (TypeError, ValueError, AttributeError):
+            ApiRun.release_request(msg)
+            raise InvalidMessageError("Message body is faulty")
+
+        call = ApiRun.__new__(ApiRun)
+        call.msg = MRequest._received(msg.get_msgid(), "run",
+                                      [[None, call_id], name, args] +
+                                      msg.arguments[3:4])
         return call
 
     def get_method_args(self):
         return self.msg.arguments[2]
 
+    def release(self):
+        release_args(self.msg.arguments[2])
+
     def get_plugin_id(self) -> str:
         return self.msg.arguments[0][0]
 
     def get_method_name(self) -> str:
         return self.msg.arguments[1]
 
+    def get_timeout(self) -> float:
+        """Returns the seconds the caller waits or None"""
+        if len(self.msg.arguments) == 4:
+            return self.msg.arguments[3]
+        return None
+
 
 class ApiResult(ApiCall):
     """Result api call
 
     :param call_id: The result is related to this call id
-    :param result: The call's result (is automatically wrapped in a list)
+    :param result: The call's result (is automatically wrapped in a list),
+                   a numpy array is sent as dtype, shape and raw data
+    :param compression: if set, a large result is compressed
+    :param shared_memory: if set, a large bytes result is passed through
+                          shared memory
     """
-    def __init__(self, call_id: int, result):
+    def __init__(self, call_id: int, result, compression: Compression=None,
+                 shared_memory: SharedMemory=None):
         super().__init__()
 
         if not isinstance(call_id, int):
@@ -177,11 +373,41 @@ class ApiResult(ApiCall):
         if result is None:
             raise InvalidApiCallError("Result can not be none!")
 
+        if is_ndarray(result):
+            try:
+                result = pack_array(result)
+            except ValueError as e:
+                raise InvalidApiCallError(str(e))
+        else:
+            if shared_memory is not None:
+                result = shared_memory.share(result)
+            if compression is not None:
+                result = compression.compress(result)
+
         self.msg.function = "result"
         self.msg.arguments = [[call_id], [result]]
 
     @staticmethod
-    def from_msgpack_request(msg: MRequest):
+    def from_msgpack_request(msg: MRequest, trusted: bool=False):
+        """ Generates an ApiResult object from a given MRequest
+
+        :param msg: A Request received and unpacked with MsgpackRpc.
+        :param trusted: skip the type checks, only the form of the body is
+                        verified
+        :return: ApiResult
+        :raises  InvalidMessageError: if provided message is
+                    not a valid Result call
+        """
+        if trusted:
+            try:
+                (call_id, ), (result, ) = msg.arguments
+            except (TypeError, ValueError):
+                raise InvalidMessageError("Invalid result Request")
+
+            call = ApiResult.__new__(ApiResult)
+            call.msg = MRequest._received(msg.get_msgid(), "result",
+                                          [[call_id], [result]])
+            return call
 
         if not isinstance(msg.function, str) or msg.function != "result":
             raise InvalidMessageError(
@@ -214,6 +440,65 @@ class ApiResult(ApiCall):
     def get_result(self):
         return self.msg.arguments[1][0]
 
+    def release(self):
+        release(self.get_result())
+
+
+class ApiCancel(ApiCall):
+    """Cancel api call, asks a plugin to stop executing a run call
+
+    :param plugin_id: plugin identifier of the called plugin
+    :param call_id: call id of the run call
+    :raises InvalidApiCallError: if the Information is invalid
+    """
+
+    def __init__(self, plugin_id: str, call_id: int):
+        super().__init__()
+
+        if not isinstance(plugin_id, str):
+            raise InvalidApiCallError("plugin identifier has to be a string")
+
+        if not isinstance(call_id, int):
+            raise InvalidApiCallError("call id has to be an integer")
+
+        self.msg.function = "cancel"
+        self.msg.arguments = [[plugin_id, call_id]]
+
+    @staticmethod
+    def from_msgpack_request(msg: MRequest):
+        """ Generates an ApiCancel object from a given MRequest
+
+        :param msg: A Request received and unpacked with MsgpackRpc.
+        :return: ApiCancel
+        :raises  InvalidMessageError: if provided message is
+                    not a valid cancel call
+        """
+        if not isinstance(msg.function, str) or msg.function != "cancel":
+            raise InvalidMessageError(
+                "Invalid cancel Request, specified method is not cancel")
+
+        if not isinstance(msg.arguments, list) or len(msg.arguments) != 1:
+            raise InvalidMessageError("Message body is faulty")
+
+        if not isinstance(msg.arguments[0],
+                          list) or len(msg.arguments[0]) != 2:
+            raise InvalidMessageError("First element of body has to be a list")
+
+        if msg.arguments[0][0] is not None:
+            raise InvalidMessageError("Plugin identifier set on incomming msg")
+
+        if not isinstance(msg.arguments[0][1], int) or \
+                isinstance(msg.arguments[0][1], bool):
+            raise InvalidMessageError("Call_id is invaild")
+
+        call = ApiCancel.__new__(ApiCancel)
+        call.msg = MRequest._received(msg.get_msgid(), "cancel",
+                                      [[None, msg.arguments[0][1]]])
+        return call
+
+    def get_call_id(self) -> int:
+        return self.msg.arguments[0][1]
+
 
 class ApiBroadcast(ApiCall):
     def __init__(self, event_name: str, args: [], as_notification=True):
@@ -0,0 +1,128 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import ctypes
+import struct
+
+import msgpack
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, arrays are unavailable without it
+    numpy = None
+
+# msgpack ExtType code of an array:
+# <1 byte: n> <n bytes: dtype string> <1 byte: ndim> <ndim * 8 bytes: shape>
+# <raw array data in C order>
+ARRAY_EXT = 3
+
+
+def is_array_type(annotation) -> bool:
+    """True if the annotation of a parameter describes an array, i.e. it is
+    a ctypes array (e.g. ctypes.c_double * 3) or a numpy.dtype
+    """
+    if isinstance(annotation, type) and issubclass(annotation, ctypes.Array):
+        return True
+    return numpy is not None and isinstance(annotation, numpy.dtype)
+
+
+def array_spec(annotation):
+    """Returns (dtype, length) of an array annotation, length is None if the
+    number of elements isn't fixed
+
+    :raises :TypeError if numpy is not installed
+    """
+    if numpy is None:
+        raise TypeError("Array arguments require numpy")
+
+    if isinstance(annotation, numpy.dtype):
+        return annotation, None
+
+    return numpy.dtype(annotation._type_), annotation._length_ or None
+
+
+def is_array(value) -> bool:
+    return isinstance(value, msgpack.ExtType) and value.code == ARRAY_EXT
+
+
+def is_ndarray(value) -> bool:
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def pack_array(array) -> msgpack.ExtType:
+    """Wraps a numpy array, so it can be sent as an argument or result
+
+    :raises :ValueError if the array contains python objects
+    """
+    if array.dtype.hasobject:
+        raise ValueError("Arrays of python objects can not be sent")
+
+    dtype = array.dtype.str.encode('ascii')
+    header = struct.pack("<B{}sB{}Q".format(len(dtype), array.ndim),
+                         len(dtype), dtype, array.ndim, *array.shape)
+    return msgpack.ExtType(ARRAY_EXT,
+                           header + numpy.ascontiguousarray(array).tobytes())
+
+
+def unpack_array(value: msgpack.ExtType, dtype=None, length: int=None):
+    """Returns a read only numpy view of the data of a packed array
+
+    The data is not copied.
+
+    :param dtype: expected dtype (optional)
+    :param length: expected number of elements (optional)
+    :raises :ValueError if the array is malformed or doesn't match dtype
+            and length
+    :raises :TypeError if numpy is not installed
+    """
+    if numpy is None:
+        raise TypeError("Array arguments require numpy")
+
+    data = value.data
+    try:
+        n = data[0]
+        received = numpy.dtype(data[1:1 + n].decode('ascii'))
+        ndim = data[1 + n]
+        shape = struct.unpack_from("<{}Q".format(ndim), data, 2 + n)
+    except (IndexError, TypeError, UnicodeDecodeError, struct.error) as e:
+        raise ValueError("Invalid array: " + str(e))
+
+    if received.hasobject:
+        raise ValueError("Invalid array: object dtype")
+
+    if dtype is not None and received != dtype:
+        raise ValueError("Array has dtype {}, expected {}".format(received,
+                                                                  dtype))
+
+    count = 1
+    for dim in shape:
+        count *= dim
+
+    if length is not None and count != length:
+        raise ValueError("Array has {} elements, expected {}".format(count,
+                                                                     length))
+
+    offset = 2 + n + 8 * ndim
+    if len(data) - offset != count * received.itemsize:
+        raise ValueError("Invalid array: size does not match shape")
+
+    if count == 0:
+        return numpy.empty(shape, received)
+
+    return numpy.frombuffer(data, received, count, offset).reshape(shape)
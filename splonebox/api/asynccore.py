@@ -0,0 +1,128 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+import asyncio
+from functools import partial
+
+from splonebox.api.apicall import ApiRun
+from splonebox.api.core import Core
+from splonebox.api.plugin import Plugin
+from splonebox.api.response import Response
+from splonebox.api.subscription import AsyncSubscription
+
+# asyncio.get_running_loop() was added in Python 3.7, get_event_loop()
+# returns the running loop inside coroutines
+_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+
+
+class AsyncCore:
+    """asyncio front end of a :Core
+
+        core = AsyncCore()
+        await core.connect("localhost", 6666)
+        result = await core.run(plugin_id, "add", [1, 2], timeout=5)
+        async for args in await core.subscribe("event"):
+            ...
+
+    Calls are sent right away, their responses and results are resolved on
+    the event loop by the thread dispatching incoming messages. Waiting
+    calls don't occupy a thread, so many of them can be awaited at once.
+    Connecting and disconnecting run in the loop's default executor.
+    """
+    def __init__(self, core: Core=None, **kwargs):
+        """
+        :param core: the Core to use, if None one is created from kwargs
+        :param kwargs: arguments of :Core
+        """
+        self.core = Core(**kwargs) if core is None else core
+
+    async def connect(self, addr: str, port: int):
+        """Connect to the splonebox core
+
+        :param addr: server address
+        :param port: Host's port
+        """
+        loop = _running_loop()
+        await loop.run_in_executor(None, self.core.connect, addr, port)
+
+    async def disconnect(self, drain_timeout: float=None):
+        """Disconnect from server, see :Core.disconnect"""
+        loop = _running_loop()
+        await loop.run_in_executor(
+            None, partial(self.core.disconnect, drain_timeout))
+
+    async def register(self, plugin: Plugin):
+        """Registers the plugin @ the core
+
+        :raises :RemoteError if the register call was invalid
+        """
+        await _resolve(plugin.register(blocking=False))
+
+    async def run(self, plugin_id: str, function: str, args: []=None,
+                  timeout: float=None):
+        """Runs a remote function and returns its result
+
+        The timeout is sent along, the called plugin doesn't execute or
+        finish the call after it expired. If the awaiting task is cancelled
+        or the timeout expires, the run call is cancelled.
+
+        :param plugin_id: plugin identifier of the plugin to be called
+        :param function: name of the function
+        :param args: function arguments | empty list or None for no args
+        :param timeout: seconds to wait for the result
+        :raises :RemoteError if run call failed
+        :raises :asyncio.TimeoutError if the result didn't arrive in time
+        """
+        call = ApiRun(plugin_id, function, args, self.core.compression,
+                      self.core.shared_memory, timeout)
+        result = self.core.send_run(call)
+        result.called_by_id = plugin_id
+        result.called_function = function
+        result.call_arguments = args
+        return await asyncio.wait_for(_resolve(result), timeout)
+
+    async def subscribe(self, event_name: str) -> AsyncSubscription:
+        """Subscribes to an event, the returned subscription is iterated
+        with async for
+
+        :raises :RemoteError if the subscribe call failed
+        """
+        sub = AsyncSubscription(event_name, _running_loop())
+        await _resolve(self.core.send_subscribe(sub))
+        return sub
+
+    async def unsubscribe(self, event_name: str):
+        """:raises :RemoteError if the unsubscribe call failed"""
+        await _resolve(self.core.unsubscribe(event_name))
+
+    async def broadcast(self, event_name: str, args: [],
+                        as_notification=True):
+        """Broadcasts an event, if as_notification is false this waits for
+        the server's response
+
+        :raises :RemoteError if the broadcast call failed
+        """
+        response = self.core.broadcast(event_name, args, as_notification)
+        if response is not None:
+            await _resolve(response)
+
+
+def _resolve(response: Response) -> asyncio.Future:
+    """Returns an asyncio future completed with the response's value,
+    cancelling it cancels the call"""
+    return asyncio.wrap_future(response.future())
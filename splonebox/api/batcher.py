@@ -0,0 +1,128 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+import logging
+import threading
+import time
+
+
+class Batcher:
+    """Collects calls of a function and executes them in batches
+
+    A batch is executed as soon as it reached max_size calls or max_wait
+    seconds passed since its first call arrived. Batches are executed one
+    after another by a thread that is started on demand.
+    """
+
+    def __init__(self, execute, max_size: int, max_wait: float):
+        """
+        :param execute: called with a list of (call id, args) tuples
+        :param max_size: maximum number of calls in a batch (has to be > 0)
+        :param max_wait: maximum time in seconds a call waits for others
+        """
+        if max_size < 1:
+            raise ValueError("A batch needs at least one call")
+
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._execute = execute
+
+        self._cond = threading.Condition()
+        self._calls = []  # (call id, args) of calls waiting for a batch
+        self._running = []  # call ids of the executed batch
+        self._thread = None
+
+    def submit(self, call_id, args):
+        """Adds a call to the next batch
+
+        :param call_id: id used to track the call
+        :param args: arguments of the call
+        """
+        with self._cond:
+            self._calls.append((call_id, args))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work,
+                                                daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _next_batch(self) -> []:
+        """Waits until a batch is complete and removes it from the calls
+        (lock has to be held)
+        """
+        while True:
+            while not self._calls:
+                self._cond.wait()
+
+            deadline = time.monotonic() + self.max_wait
+            while 0 < len(self._calls) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            if self._calls:
+                break  # not all calls were cancelled
+
+        batch = self._calls[:self.max_size]
+        del self._calls[:self.max_size]
+        return batch
+
+    def _work(self):
+        while True:
+            with self._cond:
+                batch = self._next_batch()
+                self._running = [call_id for call_id, _ in batch]
+
+            try:
+                self._execute(batch)
+            except Exception as e:
+                logging.warning("Batch failed!")
+                logging.warning(e.__str__())
+            finally:
+                with self._cond:
+                    self._running = []
+                    self._cond.notify_all()
+
+    def cancel(self, call_id) -> bool:
+        """Removes a call that is still waiting for its batch
+
+        :return: False if the call is executed or unknown
+        """
+        with self._cond:
+            for i, (waiting_id, _) in enumerate(self._calls):
+                if waiting_id == call_id:
+                    del self._calls[i]
+                    self._cond.notify_all()
+                    return True
+            return False
+
+    def active_calls(self) -> []:
+        """Returns the ids of all waiting and running calls"""
+        with self._cond:
+            return self._running + [call_id for call_id, _ in self._calls]
+
+    def wait(self, timeout: float=None) -> bool:
+        """Blocks until all calls were executed
+
+        :param timeout: maximum time to wait in seconds
+        :return: False if the timeout expired
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._calls and not self._running, timeout)
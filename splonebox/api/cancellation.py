@@ -0,0 +1,108 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError
+
+from splonebox.api.response import time_left
+
+
+class CancellationToken:
+    """Tells a remote function that its run call was cancelled
+
+    Long running functions get the token by declaring a keyword only
+    argument annotated with CancellationToken:
+
+        def scan(host: ctypes.c_char_p, *, cancel: CancellationToken):
+            for port in range(1024):
+                cancel.raise_if_cancelled()
+                ...
+
+    Coroutine functions are cancelled at their next await, they don't need
+    a token.
+
+    A call also counts as cancelled once the deadline sent by its caller
+    passed. Callbacks are only called by cancel(). The deadline can be
+    passed on to calls of other plugins:
+
+        other.run("lookup", [host], deadline=cancel.deadline)
+    """
+
+    def __init__(self, deadline: float=None):
+        """
+        :param deadline: time.monotonic() value after which the caller
+                         doesn't wait anymore
+        """
+        self.deadline = deadline
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def cancel(self):
+        """Cancels the call and runs the registered callbacks"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set() or (self.deadline is not None and
+                                        time.monotonic() >= self.deadline)
+
+    def remaining(self) -> float:
+        """Returns the seconds until the deadline or None"""
+        return time_left(None, self.deadline)
+
+    def raise_if_cancelled(self):
+        """:raises :CancelledError if the call was cancelled"""
+        if self.is_cancelled():
+            raise CancelledError()
+
+    def wait(self, timeout: float=None) -> bool:
+        """Sleeps until the call is cancelled or its deadline passed
+
+        :param timeout: maximum time to sleep in seconds
+        :return: True if the call was cancelled
+        """
+        self._event.wait(time_left(timeout, self.deadline))
+        return self.is_cancelled()
+
+    def add_callback(self, callback):
+        """Calls callback() once the call is cancelled, e.g. to close a
+        connection the function is blocked on. If the call already was
+        cancelled, it is called immediately.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    @staticmethod
+    def _run_callback(callback):
+        try:
+            callback()
+        except Exception as e:
+            logging.warning("Cancel callback failed!")
+            logging.warning(e.__str__())
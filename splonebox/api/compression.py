@@ -0,0 +1,141 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import zlib
+
+import msgpack
+
+# msgpack ExtType code of a compressed value:
+# <1 byte: type of the original value> <zlib stream>
+COMPRESSED_EXT = 2
+
+_BYTES = b'\x00'
+_STR = b'\x01'
+
+# maximum size of a decompressed value, a few KB of zlib data can expand to
+# gigabytes
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+class Compression:
+    """Compresses large bytes and str values of run calls and results
+
+    Values are wrapped in a msgpack ExtType, which is unwrapped again by
+    the receiving client (see decompress()). Compression is opt-in: pass an
+    instance to :Core to enable it. Compressed values are only accepted by
+    a Core that enabled it.
+    """
+
+    def __init__(self, threshold: int=64 * 1024, level: int=6,
+                 max_size: int=DEFAULT_MAX_SIZE):
+        """
+        :param threshold: values shorter than this (in bytes) are sent as
+                          they are
+        :param level: zlib compression level (1: fastest, 9: smallest)
+        :param max_size: maximum decompressed size (in bytes) of incoming
+                         values, larger ones are rejected
+        """
+        if not 0 <= level <= 9:
+            raise ValueError("Compression level has to be between 0 and 9")
+
+        self.threshold = threshold
+        self.level = level
+        self.max_size = max_size
+
+    def compress(self, value):
+        """Returns the compressed value or value itself if it is too small,
+        not a bytes or str or does not get smaller
+        """
+        if isinstance(value, bytes):
+            tag = _BYTES
+            data = value
+        elif isinstance(value, str):
+            tag = _STR
+            # len() counts characters, the encoded string is never shorter
+            if len(value) < self.threshold:
+                return value
+            data = value.encode('utf-8')
+        else:
+            return value
+
+        if len(data) < self.threshold:
+            return value
+
+        compressed = zlib.compress(data, self.level)
+        if len(compressed) + 1 >= len(data):
+            return value
+
+        return msgpack.ExtType(COMPRESSED_EXT, tag + compressed)
+
+    def compress_args(self, args: []) -> []:
+        """Returns a list of the compressed arguments"""
+        return [self.compress(arg) for arg in args]
+
+    def decompress(self, value):
+        """decompress() limited to max_size"""
+        return decompress(value, self.max_size)
+
+
+def is_compressed(value) -> bool:
+    return isinstance(value, msgpack.ExtType) and \
+        value.code == COMPRESSED_EXT
+
+
+def decompress(value, max_size: int=DEFAULT_MAX_SIZE):
+    """Returns the original of a value created by Compression.compress
+
+    Other values are returned as they are.
+
+    :param max_size: maximum size of the decompressed value in bytes
+    :raises :ValueError if the compressed data is invalid or too large
+    """
+    if not is_compressed(value):
+        return value
+
+    tag = value.data[:1]
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(value.data[1:], max_size)
+    except zlib.error as e:
+        raise ValueError("Invalid compressed value: " + str(e))
+    if decompressor.unconsumed_tail:
+        raise ValueError("Compressed value is larger than " + str(max_size) +
+                         " bytes")
+    if not decompressor.eof:
+        raise ValueError("Invalid compressed value: incomplete data")
+
+    if tag == _BYTES:
+        return data
+    if tag == _STR:
+        return data.decode('utf-8')
+    raise ValueError("Invalid compressed value")
+
+
+def decompress_args(args: [], max_size: int=DEFAULT_MAX_SIZE) -> []:
+    """Returns args with all compressed values replaced by their originals
+
+    args itself is returned if nothing was compressed.
+
+    :param max_size: maximum size of a decompressed value in bytes
+    :raises :ValueError if a compressed value is invalid or too large
+    """
+    for arg in args:
+        if is_compressed(arg):
+            return [decompress(a, max_size) for a in args]
+    return args
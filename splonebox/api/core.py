@@ -17,26 +17,78 @@ see <http://www.gnu.org/licenses/>.
 
 """
 import logging
+import time
+from functools import partial
 
 from splonebox.rpc.msgpackrpc import MsgpackRpc
 from splonebox.rpc.message import MResponse, MRequest, MNotify
 from splonebox.rpc.message import InvalidMessageError
 from splonebox.api.apicall import ApiRun, ApiResult, ApiBroadcast
 from splonebox.api.apicall import ApiSubscribe, ApiUnsubscribe
-from splonebox.api.apicall import ApiRegister, InvalidApiCallError
-from splonebox.api.response import Response
+from splonebox.api.apicall import ApiRegister, ApiCancel, InvalidApiCallError
+from splonebox.api.apicall import unwrap_value
+from splonebox.api.response import Response, time_left
 from splonebox.api.result import RunResult
+from splonebox.api.resultstore import ResultStore
+from splonebox.api.compression import Compression
+from splonebox.api.sharedmem import SharedMemory, release
+from splonebox.api.arrays import is_array, unpack_array
+from splonebox.api.stream import DEFAULT_CHUNK_SIZE, iter_chunks, \
+    is_chunk, pack_chunk, unpack_chunk, is_item, pack_item, unpack_item
 from splonebox.api.subscription import Subscription
 
 
 class Core():
-    def __init__(self):
-        self._rpc = MsgpackRpc()
-        self._rpc.register_function(self._handle_result, "result")
+    def __init__(self, dispatch_workers: int=0, dispatch_queue_size: int=1024,
+                 raw: bool=True, trusted: bool=False,
+                 compression: Compression=None,
+                 shared_memory: SharedMemory=None,
+                 max_results: int=65536, result_ttl: float=None,
+                 weak_results: bool=False):
+        """
+        :param dispatch_workers: number of threads handling incoming
+                                 messages (0: handle them on the listening
+                                 thread)
+        :param dispatch_queue_size: maximum number of messages waiting for
+                                    each dispatch worker
+        :param raw: if False, strings in incoming messages are decoded
+                    (UTF-8) while unpacking, otherwise they are bytes
+        :param trusted: only verify the form of incoming messages and skip
+                        the type checks of their fields. Use this only if
+                        the server is known to send valid messages.
+        :param compression: if set, large arguments of outgoing run calls
+                            and results are compressed. Compressed incoming
+                            values are only accepted if set and are
+                            limited to compression.max_size.
+        :param shared_memory: if set, large bytes arguments of outgoing run
+                              calls and results are passed through shared
+                              memory. Only use this if all plugins run on
+                              this host. Incoming handles are only
+                              attached if set.
+        :param max_results: maximum number of run calls waiting for their
+                            results, the oldest are evicted
+        :param result_ttl: seconds after which a run call stops waiting for
+                           its result (None: wait forever)
+        :param weak_results: forget run calls whose RunResult was dropped
+                             by the caller
+        """
+        self._rpc = MsgpackRpc(dispatch_workers, dispatch_queue_size, raw,
+                               trusted)
+        self.raw = raw
+        self.trusted = trusted
+        self.compression = compression
+        self.shared_memory = shared_memory
+        # results refer to the call id of a run response, they must not
+        # overtake it on the dispatch workers
+        self._rpc.register_function(self._handle_result, "result",
+                                    with_responses=True)
         self._rpc.register_function(self._handle_broadcast, "broadcast")
-        self._responses_pending = {int: Response()}
-        self._results_pending = {int: RunResult()}  # call_id: result
+        self._responses_pending = {}  # msgid: response
+        # call_id: result of run calls waiting for their results
+        self.result_store = ResultStore(max_results, result_ttl, weak_results)
         self._subscriptions = {}
+        self._drain_handler = None
+        self._drained = False
         self.connected = False
 
     def enable_debugging(self):
@@ -46,7 +98,12 @@ class Core():
         """ Connect to the splonebox core
         :param addr: server address
         :param port: Host's port
+        :raises :CoreError if the core's plugin was drained, draining is
+                terminal
         """
+        if self._drained:
+            raise CoreError("The plugin was drained, it can't be connected "
+                            "again")
         self._rpc.connect(addr, port)
         self.connected = True
 
@@ -54,19 +111,80 @@ class Core():
         """Listen for incoming messages from server"""
         self._rpc.listen()
 
-    def disconnect(self):
-        """Disconnect from server"""
-        self._rpc.disconnect()
+    def disconnect(self, drain_timeout: float=None):
+        """Disconnect from server
+
+        :param drain_timeout: if set, the core is drained for up to
+                              drain_timeout seconds before the connection is
+                              closed: the plugin stops accepting run calls
+                              and waits until its running calls sent their
+                              results, own requests wait for their responses
+                              and results, and sent messages are flushed.
+                              The core can't connect again afterwards if it
+                              drained a plugin.
+                              Otherwise the connection is closed at once.
+        """
+        if drain_timeout is None:
+            self._rpc.disconnect()
+            self._disconnected()
+            return
+
+        deadline = time.monotonic() + drain_timeout
+        if self._drain_handler is not None:
+            self._drained = True
+            self._drain_handler(time_left(None, deadline))
+
+        pending = list(self._responses_pending.values()) + [
+            result for result in self.result_store.values()
+            if not result.has_result()]
+        for response in pending:
+            if not response.wait(time_left(None, deadline)):
+                logging.warning("Disconnecting with pending calls")
+                break
+
+        self._rpc.disconnect(time_left(None, deadline))
+        self._disconnected()
+
+    def _disconnected(self):
+        """Fails the run calls whose results can't arrive anymore, including
+        partially received streams"""
         self.connected = False
+        for result in self.result_store.values():
+            if not result.is_complete():
+                result.abort([503, "Connection was closed"])
+
+    def set_drain_handler(self, function):
+        """ Set the function to be called with the remaining timeout when
+        the core is drained before disconnecting """
+        self._drain_handler = function
 
     def set_run_handler(self, function):
         """ Set the function to be called on incomming run requests """
         self._rpc.register_function(function, "run")
 
+    def set_cancel_handler(self, function):
+        """ Set the function to be called on incomming cancel requests """
+        self._rpc.register_function(function, "cancel")
+
     def send_run(self, call: ApiRun):
-        result = RunResult()
-        self._responses_pending[call.msg.get_msgid()] = result
-        self._rpc.send(call.msg, self._handle_run_response)
+        result = self._run_result(call)
+        self._send_pending(call, result, self._handle_run_response)
+        return result
+
+    def send_run_many(self, calls: [ApiRun]) -> [RunResult]:
+        """Sends all run calls at once
+
+        :param calls: list of :ApiRun
+        :return: list of :RunResult, in the same order as calls
+        """
+        results = [self._run_result(call) for call in calls]
+        self._send_pending_many(calls, results, self._handle_run_response)
+        return results
+
+    def _run_result(self, call: ApiRun) -> RunResult:
+        result = RunResult(partial(self._cancel_run, call.get_plugin_id()))
+        if call.get_timeout() is not None:
+            result.deadline = time.monotonic() + call.get_timeout()
         return result
 
     def _handle_run_response(self, msg: MResponse):
@@ -77,16 +195,71 @@ class Core():
         result = self._responses_pending.pop(msg.get_msgid())
 
         if msg.error is not None:
-            result.set_error([msg.error[0], msg.error[1].decode('ascii')])
+            result.set_error(self._decode_error(msg.error))
         else:
             # we received a response for a run call
+            self.result_store.add(msg.response[0], result)
             result.set_id(msg.response[0])
-            self._results_pending[result.get_id()] = result
+
+    def _cancel_run(self, plugin_id: str, result: RunResult):
+        """Asks the called plugin to stop the run call of a cancelled
+        result. Calls without a response are cancelled once it arrives.
+        """
+        call_id = result.get_id()
+        if call_id is None:
+            return
+
+        # results arriving later are rejected
+        self.result_store.pop(call_id)
+        self.send_cancel(ApiCancel(plugin_id, call_id))
+
+    def send_cancel(self, call: ApiCancel) -> Response:
+        """Send a cancel API call to the server"""
+        response = Response()
+        self._send_pending(call, response, self._handle_response)
+        return response
+
+    def _decode_error(self, error: []) -> []:
+        """Returns the error of a response with a decoded message"""
+        if self.raw:
+            return [error[0], error[1].decode('utf-8')]
+        return error
 
     def send_result(self, call: ApiResult):
         """Send a result API call to the server"""
-        self._rpc.send(call.msg,
-                       response_callback=self._handle_result_response)
+        try:
+            self._rpc.send(call.msg,
+                           response_callback=self._handle_result_response)
+        except Exception:
+            call.release()
+            raise
+
+    def send_result_stream(self, call_id: int, source,
+                           chunk_size: int=DEFAULT_CHUNK_SIZE):
+        """Sends the content of a file-like object as a streamed result
+
+        The content is read and sent in chunks, so it never has to be in
+        memory at once. The receiver gets a :ResultStream.
+
+        :param call_id: The result is related to this call id
+        :param source: object with a read(size) method returning bytes
+        :param chunk_size: maximum size of a chunk
+        """
+        for seq, data, last in iter_chunks(source, chunk_size):
+            self.send_result(ApiResult(call_id, pack_chunk(seq, data, last)))
+
+    def send_result_items(self, call_id: int, items):
+        """Sends every item of an iterable as soon as it is available, the
+        receiver gets :ResultItems
+
+        :param call_id: The result is related to this call id
+        :param items: iterable, e.g. a generator
+        """
+        seq = 0
+        for item in items:
+            self.send_result(ApiResult(call_id, pack_item(seq, item)))
+            seq += 1
+        self.send_result(ApiResult(call_id, pack_item(seq, None, True)))
 
     def _handle_result_response(self, msg: MResponse):
         logging.info("Result request successfull")
@@ -95,14 +268,42 @@ class Core():
     def send_register(self, call: ApiRegister):
         """Send a register API call to the server"""
         response = Response()
-        self._responses_pending[call.msg.get_msgid()] = response
-        self._rpc.send(call.msg, self._handle_response)
+        self._send_pending(call, response, self._handle_response)
         return response
 
+    def _send_pending(self, call, response: Response, response_callback):
+        """Sends a request and stores the given response object until the
+        server answered it. The msgid is reserved before the request is
+        sent, so the response can never arrive before we are waiting for it.
+        """
+        self._send_pending_many([call], [response], response_callback)
+
+    def _send_pending_many(self, calls: [], responses: [Response],
+                           response_callback):
+        """Same as _send_pending for a batch of requests"""
+        msgs = [call.msg for call in calls]
+        msgids = self._rpc.register_response_callbacks(
+            msgs, [response_callback] * len(msgs))
+        for msgid, response in zip(msgids, responses):
+            self._responses_pending[msgid] = response
+
+        try:
+            if len(msgs) == 1:
+                self._rpc.send(msgs[0])
+            else:
+                self._rpc.send_many(msgs)
+        except Exception:
+            self._rpc.unregister_response_callbacks(msgids)
+            for msgid in msgids:
+                self._responses_pending.pop(msgid, None)
+            for call in calls:
+                call.release()
+            raise
+
     def _handle_response(self, msg: MResponse):
         result = self._responses_pending.pop(msg.get_msgid())
         if msg.error is not None:
-            result.set_error([msg.error[0], msg.error[1].decode('ascii')])
+            result.set_error(self._decode_error(msg.error))
         else:
             if msg.error is None and msg.response == []:
                 result.success()
@@ -111,16 +312,43 @@ class Core():
 
     def _handle_result(self, msg: MRequest):
         try:
-            result_call = ApiResult.from_msgpack_request(msg)
+            result_call = ApiResult.from_msgpack_request(msg, self.trusted)
         except (InvalidApiCallError, InvalidMessageError):
             return ([400, "Message is not a valid result call"], None)
         try:
-            self._results_pending[result_call.get_call_id()].set_result(
-                result_call.get_result())
+            pending = self.result_store.get(result_call.get_call_id())
+            result = result_call.get_result()
+            if is_chunk(result):
+                try:
+                    pending.feed_chunk(*unpack_chunk(result))
+                except ValueError:
+                    return ([400, "Invalid stream chunk"], None)
+            elif is_item(result):
+                try:
+                    pending.feed_item(*unpack_item(result, self.raw))
+                except ValueError:
+                    return ([400, "Invalid stream item"], None)
+            elif is_array(result):
+                try:
+                    pending.set_result(unpack_array(result))
+                except (ValueError, TypeError) as e:
+                    return ([400, "Invalid array result: " + str(e)], None)
+            else:
+                try:
+                    pending.set_result(unwrap_value(
+                        result, self.compression, self.shared_memory))
+                except ValueError as e:
+                    return ([400, "Invalid result: " + str(e)], None)
             # TODO: error handling
+            if pending.is_complete():
+                self.result_store.pop(result_call.get_call_id())
+            else:
+                # the caller may only keep the stream
+                self.result_store.keep(result_call.get_call_id())
             return (None, [result_call.get_call_id()])
-            # self._results_pending.pop(result_call.get_call_id())
         except KeyError:
+            # nobody attaches a shared result anymore
+            release(result_call.get_result())
             return ([404, "Call id does not match any call"], None)
 
     def broadcast(self, event_name: str, args: [], as_notification=True):
@@ -131,20 +359,43 @@ class Core():
             return None
         else:
             response = Response()
-            self._responses_pending[call.msg.get_msgid()] = response
-            self._rpc.send(call.msg, response=self._handle_response)
+            self._send_pending(call, response, self._handle_response)
             return response
 
+    def broadcast_many(self, events: [], as_notification=True):
+        """Broadcasts all events at once
+
+        :param events: list of (event_name, args) tuples
+        :return: None if as_notification is true, otherwise a list of
+                 responses in the same order as events
+        """
+        calls = [ApiBroadcast(event_name, args, as_notification)
+                 for event_name, args in events]
+        if as_notification:
+            self._rpc.send_many([call.msg for call in calls])
+            return None
+        else:
+            responses = [Response() for _ in calls]
+            self._send_pending_many(calls, responses, self._handle_response)
+            return responses
+
     def subscribe(self, event_name: str):
         sub = Subscription(event_name)
+        self.send_subscribe(sub).await_response()
+        return sub
+
+    def send_subscribe(self, sub) -> Response:
+        """Sends a subscribe call without waiting for its response
+
+        :param sub: receives the events, anything with a name attribute and
+                    a signal(args) method
+        """
         #  TODO: a subscription for the given event might already exist
-        self._subscriptions[event_name] = sub
-        call = ApiSubscribe(event_name)
+        self._subscriptions[sub.name] = sub
+        call = ApiSubscribe(sub.name)
         response = Response()
-        self._responses_pending[call.msg.get_msgid()] = response
-        self._rpc.send(call.msg, response_callback=self._handle_response)
-        response.await()
-        return sub
+        self._send_pending(call, response, self._handle_response)
+        return response
 
     def unsubscribe(self, event_name: str):
         self._subscriptions.pop(event_name)
@@ -152,9 +403,8 @@ class Core():
         #  TODO: subscirbe callback
         call = ApiUnsubscribe(event_name)
         response = Response()
-        self._responses_pending[call.msg.get_msgid()] = response
         #  TODO: subscirbe callback
-        self._rpc.send(call.msg, response_callback=self._handle_response)
+        self._send_pending(call, response, self._handle_response)
         return response
 
     def _handle_broadcast(self, msg: MNotify):
@@ -16,51 +16,86 @@ along with this splonebox python client library.  If not,
 see <http://www.gnu.org/licenses/>.
 
 """
+import asyncio
+import inspect
 import logging
-from threading import Thread, ThreadError
+import time
+from concurrent.futures import CancelledError
+from functools import partial
 from types import FunctionType
 
 from splonebox.rpc.message import MRequest, InvalidMessageError
-from splonebox.api.apicall import ApiRun, ApiResult, ApiRegister
+from splonebox.api.apicall import ApiRun, ApiResult, ApiRegister, ApiCancel
 from splonebox.api.remotefunction import RemoteFunction
 from splonebox.api.core import Core
+from splonebox.api.stream import DEFAULT_CHUNK_SIZE
+from splonebox.api.runpool import RunPool
+from splonebox.api.runloop import RunLoop
+from splonebox.api.batcher import Batcher
+from splonebox.api.cancellation import CancellationToken
 
 
 class Plugin:
     def __init__(self, name: str, desc: str, author: str, licence: str, core:
-                 Core):
+                 Core, stream_chunk_size: int=DEFAULT_CHUNK_SIZE,
+                 max_workers: int=16, queue_size: int=1024,
+                 function_limits: dict=None):
         """
         :param name: Name of the plugin
         :param desc: Description of the plugin
         :param author: Author of the plugin
         :param licence: License of the plugin
         :param core: Core instance
+        :param stream_chunk_size: chunk size used for results returned as
+                                  file-like objects
+        :param max_workers: maximum number of functions executed at once
+                            (coroutine functions don't need a worker)
+        :param queue_size: maximum number of run calls waiting for a worker,
+                           further calls are rejected
+        :param function_limits: {function name: maximum number of concurrent
+                                executions of this function}
         """
         # [<name>, <description>, <author>, <license>]
         self._metadata = [name, desc, author, licence]
         self.function_meta = {}
+        self.stream_chunk_size = stream_chunk_size
 
-        # active threads
-        self._active_threads = {int: Thread()}
+        # executes the run calls, coroutine functions are executed on an
+        # event loop
+        self._pool = RunPool(max_workers, queue_size, function_limits)
+        self._loop = RunLoop(function_limits)
+        self._batchers = {}  # function name: Batcher of batched functions
+        # call id: CancellationToken of pending and running calls
+        self._tokens = {}
+        self._draining = False
 
         core.set_run_handler(self._handle_run)
+        core.set_cancel_handler(self._handle_cancel)
+        core.set_drain_handler(self.drain)
         self.core = core
 
         # A dict containing all functions this plugin wants to register
         self.functions = {}
 
         for f in RemoteFunction.remote_functions:
-            self.functions[f.__name__] = f
-            self.function_meta[f.__name__] = [f.__doc__, f.args]
+            self._add(f)
 
     def add_function(self, func: FunctionType):
         """ Manually add a function to the plugin
         (Note: Functions with the @RemoteFunction decorator are
         added automatically)
         """
-        f = RemoteFunction(func)
+        self._add(RemoteFunction(func))
+
+    def _add(self, f: RemoteFunction):
         self.functions[f.__name__] = f
         self.function_meta[f.__name__] = [f.__doc__, f.args]
+        if f.batch_size is not None:
+            self._batchers[f.__name__] = Batcher(
+                partial(self._execute_batch, f), f.batch_size, f.batch_wait)
+        if f.process_pool:
+            # workers are forked before the plugin's threads are started
+            f.start_pool()
 
     def register(self, blocking=True):
         """Registers the Plugin @ the core.
@@ -77,7 +112,7 @@ class Plugin:
         result = self.core.send_register(reg_call)
 
         if blocking:
-            result.await()
+            result.await_response()
             return
         else:
             return result
@@ -87,9 +122,15 @@ class Plugin:
 
         :param msg: Message containing run Request (MRequest)
         """
+        if self._draining:
+            ApiRun.release_request(msg)
+            return [503, "Plugin is shutting down"], None
 
         try:
-            call = ApiRun.from_msgpack_request(msg)
+            call = ApiRun.from_msgpack_request(msg, self.core.raw,
+                                               self.core.trusted,
+                                               self.core.compression,
+                                               self.core.shared_memory)
         except InvalidMessageError:
             return [400, "Message is not a valid run call"], None
 
@@ -98,38 +139,217 @@ class Plugin:
         except KeyError:
             return [404, "Function does not exist!"], None
 
-        # start new thread for call. TODO: Implement stop API call
+        # the arguments are checked now, so type errors are reported to the
+        # caller (and a batch can't fail for a single call)
+        try:
+            args = fun.convert(call.get_method_args())
+        except TypeError as e:
+            return [400, str(e)], None
+
+        call_id = msg.arguments[0][1]
+        name = call.get_method_name()
+        timeout = call.get_timeout()
+        token = CancellationToken(
+            None if timeout is None else time.monotonic() + timeout)
+        if fun.batch_size is not None:
+            self._tokens[call_id] = token
+            self._batchers[name].submit(call_id, args)
+        elif fun.is_coroutine:
+            self._tokens[call_id] = token
+            self._loop.submit(call_id, name, self._execute_coroutine, fun,
+                              args, call_id, token)
+        else:
+            self._tokens[call_id] = token
+            if not self._pool.submit(call_id, name, self._execute_function,
+                                     fun, args, call_id, token):
+                del self._tokens[call_id]
+                return [503, "Too many pending run calls"], None
+
+        return None, [call_id]
+
+    def _handle_cancel(self, msg: MRequest):
+        """Callback to handle cancel requests
+
+        Calls that didn't start are dropped, running functions are told by
+        their CancellationToken (coroutines are cancelled). No result is
+        sent for a cancelled call.
+
+        :param msg: Message containing cancel Request (MRequest)
+        """
         try:
-            t = Thread(target=self._execute_function,
-                       args=(fun,
-                             call.get_method_args(),
-                             msg.arguments[0][1], ))
-            t.start()
-            # store active process
-            self._active_threads[msg.arguments[0][1]] = t
+            call_id = ApiCancel.from_msgpack_request(msg).get_call_id()
+        except InvalidMessageError:
+            return [400, "Message is not a valid cancel call"], None
+
+        token = self._tokens.pop(call_id, None)
+        if token is None:
+            return [404, "Call id does not match any call"], None
+
+        token.cancel()
+        for executor in self._executors():
+            if executor.cancel(call_id):
+                break
+
+        return None, []
+
+    def drain(self, timeout: float=None) -> bool:
+        """Stops accepting run calls and waits until the pending and
+        running calls sent their results. Process pools are stopped once all
+        calls finished. Called by Core.disconnect(drain_timeout).
+
+        Draining is terminal: the plugin rejects run calls from then on and
+        its core refuses to connect again.
+
+        :param timeout: maximum time to wait in seconds
+        :return: False if calls were still running when the timeout expired
+        """
+        self._draining = True
+        if not self.wait_for_calls(timeout):
+            logging.warning("Calls still running after draining: " +
+                            str(self.active_calls()))
+            return False
+
+        for fun in self.functions.values():
+            if isinstance(fun, RemoteFunction) and fun.process_pool:
+                fun.close_pool()
+        return True
+
+    def _executors(self) -> []:
+        return [self._pool, self._loop] + list(self._batchers.values())
+
+    def active_calls(self) -> []:
+        """Returns the call ids of all pending and running run calls"""
+        return [call_id for executor in self._executors()
+                for call_id in executor.active_calls()]
+
+    def wait_for_calls(self, timeout: float=None) -> bool:
+        """Blocks until all run calls were executed
+
+        :param timeout: maximum time to wait in seconds
+        :return: False if the timeout expired
+        """
+        if timeout is None:
+            return all(executor.wait() for executor in self._executors())
+
+        deadline = time.monotonic() + timeout
+        return all(executor.wait(max(0, deadline - time.monotonic()))
+                   for executor in self._executors())
+
+    def _send_result(self, call_id, result, token: CancellationToken=None):
+        if result is None:
+            return
+
+        if token is not None and token.is_cancelled():
+            # the caller doesn't wait for the result anymore
+            if hasattr(result, "close"):
+                result.close()
+            return
 
-        except ThreadError as e:
-            return [420, "Thread error:"+e.__str__()]
+        if hasattr(result, "read"):
+            # file-like results are streamed in chunks
+            try:
+                self.core.send_result_stream(call_id, result,
+                                             self.stream_chunk_size)
+            finally:
+                result.close()
+            return
+
+        if inspect.isgenerator(result):
+            # yielded items are sent one by one
+            if token is not None:
+                result = self._until_cancelled(result, token)
+            self.core.send_result_items(call_id, result)
+            return
 
-        return None, [msg.arguments[0][1]]
+        result_call = ApiResult(call_id, result, self.core.compression,
+                                self.core.shared_memory)
+        self.core.send_result(result_call)
 
-    def _execute_function(self, fun, args, call_id):
+    @staticmethod
+    def _until_cancelled(items, token: CancellationToken):
+        """Stops a generator once its call was cancelled"""
         try:
-            result = fun(args)
-            if result is None:
+            for item in items:
+                token.raise_if_cancelled()
+                yield item
+        finally:
+            items.close()
+
+    async def _execute_coroutine(self, fun, args, call_id, token):
+        try:
+            token.raise_if_cancelled()
+            if token.deadline is None:
+                result = await fun.call_converted(args, token=token)
+            else:
+                # the coroutine is cancelled at the deadline
+                result = await asyncio.wait_for(
+                    fun.call_converted(args, token=token), token.remaining())
+            # packing, compressing and writing the result (or reading a
+            # stream or generator) would block the other coroutines
+            loop = self._loop.get_loop()
+            await loop.run_in_executor(None, self._send_result, call_id,
+                                       result, token)
+        except (CancelledError, asyncio.TimeoutError):
+            logging.info("Run call " + str(call_id) + " was cancelled")
+        except Exception as e:
+            logging.error("ERROR: " + e.__str__())
+        finally:
+            self._tokens.pop(call_id, None)
+
+    def _execute_batch(self, fun, batch: []):
+        """Calls a batched function and sends a result for every call
+
+        :param batch: list of (call id, converted args)
+        """
+        # calls that were cancelled or whose caller stopped waiting are
+        # skipped
+        expired = set()
+        for call_id, _ in batch:
+            token = self._tokens.get(call_id)
+            if token is None or token.is_cancelled():
+                expired.add(call_id)
+                self._tokens.pop(call_id, None)
+        if expired:
+            batch = [call for call in batch if call[0] not in expired]
+            if not batch:
                 return
 
-            result_call = ApiResult(call_id, result)
-            self.core.send_result(result_call)
+        try:
+            results = fun.call_batch([args for _, args in batch])
+        except Exception as e:
+            logging.error("ERROR: " + e.__str__())
+            for call_id, _ in batch:
+                self._tokens.pop(call_id, None)
+            return
+
+        for (call_id, _), result in zip(batch, results):
+            token = self._tokens.pop(call_id, None)
+            if token is None:
+                continue  # cancelled
+            try:
+                self._send_result(call_id, result, token)
+            except Exception as e:
+                logging.error("ERROR: " + e.__str__())
+
+    def _execute_function(self, fun, args, call_id, token):
+        try:
+            # the call may have waited for a worker until its deadline
+            token.raise_if_cancelled()
+            self._send_result(call_id, fun.call_converted(args, token=token),
+                              token)
 
             # TODO: Error handling on API-level (not discussed yet -
             # errors will be ignored)!
+        except CancelledError:
+            logging.info("Run call " + str(call_id) + " was cancelled")
         except TypeError as e:
             logging.error("ERROR: " + e.__str__())
             pass
         except Exception as e:
             logging.error("ERROR: " + e.__str__())
             pass
+        finally:
+            self._tokens.pop(call_id, None)
 
 
 class PluginError(Exception):
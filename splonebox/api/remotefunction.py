@@ -18,8 +18,147 @@ see <http://www.gnu.org/licenses/>.
 """
 
 import ctypes
+import importlib
+import inspect
+import itertools
+import logging
+import multiprocessing
+import threading
 from types import FunctionType
 
+from splonebox.api.arrays import is_array_type, array_spec, is_array, \
+    is_ndarray, unpack_array
+from splonebox.api.cancellation import CancellationToken
+
+
+# functions executed by process pools, workers are forked and look them up
+# by their token, so the functions don't have to be picklable
+_process_functions = {}
+_process_tokens = itertools.count()
+
+
+def _run_in_process(token: int, args: tuple):
+    return _process_functions[token].fun(*args)
+
+
+def _run_imported(module: str, qualname: str, args: tuple):
+    """Entry point of spawned workers (where fork isn't available), they
+    import the function"""
+    function = importlib.import_module(module)
+    for name in qualname.split("."):
+        function = getattr(function, name)
+    if isinstance(function, RemoteFunction):
+        function = function.fun
+    return function(*args)
+
+
+def _can_fork() -> bool:
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def _picklable(args: tuple) -> tuple:
+    """Copies the arguments attached from shared memory, memoryviews can't
+    be pickled to a process pool"""
+    if not any(isinstance(arg, memoryview) for arg in args):
+        return args
+    return tuple(arg.tobytes() if isinstance(arg, memoryview) else arg
+                 for arg in args)
+
+
+def _checker(types: tuple):
+    """Returns a function checking that an argument is one of the given
+    types. Subclasses are accepted, except bool for numbers.
+    """
+    def check(arg):
+        if isinstance(arg, types) and (bool in types or
+                                       not isinstance(arg, bool)):
+            return arg
+        raise TypeError("has to be " + " or ".join(t.__name__ for t in types)
+                        + ", got " + type(arg).__name__)
+    return check
+
+
+def _check_string(arg):
+    """Decodes strings that were unpacked as bytes"""
+    if isinstance(arg, str):
+        return arg
+    if isinstance(arg, bytes):
+        try:
+            return arg.decode('utf-8')
+        except UnicodeDecodeError:
+            raise TypeError("is not valid UTF-8")
+    raise TypeError("has to be str, got " + type(arg).__name__)
+
+
+def _check_float(arg):
+    """Accepts integers for floats, msgpack packs 2.0 as float but 2 not"""
+    if isinstance(arg, float):
+        return arg
+    if isinstance(arg, int) and not isinstance(arg, bool):
+        return float(arg)
+    raise TypeError("has to be float, got " + type(arg).__name__)
+
+
+def _array_checker(dtype, length):
+    def check(arg):
+        if is_ndarray(arg):
+            return arg  # local call
+        if not is_array(arg):
+            raise TypeError("has to be an array, got " + type(arg).__name__)
+        try:
+            return unpack_array(arg, dtype, length)
+        except ValueError as e:
+            raise TypeError(str(e))
+    return check
+
+
+def _compile_converter(name: str, argnames: [], checks: []):
+    """Builds the function converting the arguments of a call
+
+    The function is generated for the signature: every argument is unpacked
+    into a local variable and only compared to its expected class. The
+    check function is only called if the class differs.
+
+    :param checks: (expected class or None, check function) for every
+                   argument. The check function returns the converted
+                   argument or raises a TypeError.
+    :return: function returning a tuple of the converted arguments
+    """
+    argc = len(checks)
+    names = ["a{}".format(i) for i in range(argc)]
+
+    def wrong_count(args):
+        return TypeError("{}() takes {} arguments ({} given)".format(
+            name, argc, len(args)))
+
+    def wrong_type(i: int, e: TypeError):
+        return TypeError("{}() argument {} ({}) {}".format(
+            name, i, argnames[i], e))
+
+    namespace = {"wrong_count": wrong_count, "wrong_type": wrong_type}
+    lines = ["def convert(args):",
+             "    if len(args) != {}:".format(argc),
+             "        raise wrong_count(args)"]
+    if argc:
+        lines.append("    {}, = args".format(", ".join(names)))
+
+    for i, (expected, check) in enumerate(checks):
+        namespace["c{}".format(i)] = check
+        indent = "    "
+        if expected is not None:
+            namespace["t{}".format(i)] = expected
+            lines.append("    if a{0}.__class__ is not t{0}:".format(i))
+            indent += "    "
+        lines += [indent + "try:",
+                  indent + "    a{0} = c{0}(a{0})".format(i),
+                  indent + "except TypeError as e:",
+                  indent + "    raise wrong_type({}, e)".format(i)]
+
+    lines.append("    return ({})".format("".join(n + ", " for n in names)))
+
+    exec("\n".join(lines), namespace)
+    return namespace["convert"]
+
 
 class RemoteFunction():
     """Wrapper class for remote functions
@@ -28,7 +167,41 @@ class RemoteFunction():
 
     Valid choices:
     ctypes.c_bool, ctypes.c_byte, ctypes.c_uint64,
-    ctypes.c_int64, ctypes.c_double, ctypes.c_char_p
+    ctypes.c_int64, ctypes.c_double, ctypes.c_char_p, list, dict
+
+    Lists and maps are passed as they were unpacked. If the core was
+    created with raw=True, strings within them are bytes.
+
+    Arrays (requires numpy): a ctypes array like ctypes.c_double * 3 (a
+    length of 0 accepts any number of elements) or a numpy.dtype. The
+    argument is passed as a read only numpy array.
+
+    Coroutine functions (async def) are executed on the plugin's event
+    loop, calling the RemoteFunction returns the coroutine.
+
+    Items yielded by generator functions are sent one by one, the caller
+    iterates over them with RunResult.items().
+
+    Long running functions can check whether their call was cancelled with
+    a keyword only argument annotated with CancellationToken:
+
+        def scan(host: ctypes.c_char_p, *, cancel: CancellationToken):
+            ...
+
+    Functions that are cheaper per call in batches can collect calls.
+    Every argument is a list with the values of all calls in the batch and
+    a list with a result for every call has to be returned:
+
+        @RemoteFunction.batched(max_size=64, max_wait=0.005)
+        def lookup(key: ctypes.c_char_p):
+            return db.get_many(key)
+
+    CPU bound functions can be executed by a pool of processes, the
+    arguments and the result have to be picklable:
+
+        @RemoteFunction.in_process(initializer=load_model)
+        def classify(image: ctypes.c_byte):
+            ...
 
     GOOD:
         foo(x: ctypes._uint64, p: ctypes.c_char_p)
@@ -45,9 +218,37 @@ class RemoteFunction():
                            ctypes.c_int64: -1,  # msgpack packs an int
                            ctypes.c_double: 2.0,  # msgpack packs float
                            ctypes.c_char_p: "",  # msgpack packs bytes
-                           ctypes.c_long: -1}  # msgpack packs an int
+                           ctypes.c_long: -1,  # msgpack packs an int
+                           list: [],  # msgpack packs an array
+                           dict: {}}  # msgpack packs a map
+
+    # (expected class, check function) of the arguments
+    _arg_checks = {ctypes.c_bool: (bool, _checker((bool, ))),
+                   ctypes.c_byte: (bytes, _checker((bytes, bytearray,
+                                                    memoryview))),
+                   ctypes.c_uint64: (int, _checker((int, ))),
+                   ctypes.c_int64: (int, _checker((int, ))),
+                   ctypes.c_double: (float, _check_float),
+                   ctypes.c_char_p: (str, _check_string),
+                   ctypes.c_long: (int, _checker((int, ))),
+                   list: (list, _checker((list, ))),
+                   dict: (dict, _checker((dict, )))}
 
-    def __init__(self, function: FunctionType):
+    def __init__(self, function: FunctionType, process_pool: bool=False,
+                 processes: int=None, initializer=None, initargs: tuple=(),
+                 batch_size: int=None, batch_wait: float=0.01):
+        """
+        :param function: the annotated function
+        :param process_pool: execute the function in a pool of processes
+                             instead of the calling thread
+        :param processes: number of processes (default: number of cpus)
+        :param initializer: called with initargs by every process when it
+                            starts, e.g. to load data used by the function
+        :param batch_size: if set, run calls are collected and the function
+                           is called with batches of up to batch_size calls
+        :param batch_wait: maximum time in seconds a call waits for others
+                           to fill its batch
+        """
         # Make sure we don't loose valuable information
         self.fun = function
         self.__name__ = function.__name__
@@ -56,31 +257,194 @@ class RemoteFunction():
         self.__annotations__ = function.__annotations__
         self.args = []
         argc = function.__code__.co_argcount  # number of arguments
+        argnames = function.__code__.co_varnames[:argc]
+        checks = []
 
-        argtypes = function.__annotations__
+        # the keyword only argument receiving the cancellation token
+        kwonly = function.__code__.co_varnames[
+            argc:argc + function.__code__.co_kwonlyargcount]
+        self._cancel_arg = next(
+            (n for n in kwonly
+             if function.__annotations__.get(n) is CancellationToken), None)
+
+        argtypes = {n: t for n, t in function.__annotations__.items()
+                    if n != self._cancel_arg}
         if len(argtypes) != argc and argc != 0:
             raise TypeError("Function arguments not annotated properly")
 
         if len(argtypes) != 0:
-            argnames = function.__code__.co_varnames[:argc]
             for n in argnames:
+                if is_array_type(argtypes[n]):
+                    # arrays are registered as binary data
+                    self.args.append(b'')
+                    checks.append(
+                        (None, _array_checker(*array_spec(argtypes[n]))))
+                    continue
+
                 arg = self._default_arg_values.get(argtypes[n])
                 if arg is None:
                     raise TypeError("Function arguments not annotated properly")
                 self.args.append(arg)
 
+                checks.append(self._arg_checks[argtypes[n]])
+
+        # the arguments are checked and converted by a function generated
+        # once for this signature
+        self._convert = _compile_converter(self.__name__, argnames, checks)
+
         if self.__doc__ is None:
             self.__doc__ = ""
 
+        self.is_coroutine = inspect.iscoroutinefunction(function)
+        if self.is_coroutine and process_pool:
+            raise TypeError("Coroutine functions can't be executed by a "
+                            "process pool")
+        if self.is_coroutine and batch_size is not None:
+            raise TypeError("Coroutine functions can't be batched")
+        if batch_size is not None and batch_size < 1:
+            raise ValueError("batch_size has to be at least 1")
+        if self._cancel_arg is not None and (process_pool or
+                                             batch_size is not None):
+            raise TypeError("Only functions executed by the plugin's threads "
+                            "can get a CancellationToken")
+
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+
+        self.process_pool = process_pool
+        self._processes = processes
+        self._initializer = initializer
+        self._initargs = initargs
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        if process_pool:
+            if _can_fork():
+                self._token = next(_process_tokens)
+                _process_functions[self._token] = self
+                self._target = (_run_in_process, (self._token, ))
+            elif "<locals>" in function.__qualname__:
+                raise TypeError("Functions executed by a process pool have "
+                                "to be defined at module level on this "
+                                "platform")
+            else:
+                self._target = (_run_imported, (function.__module__,
+                                                function.__qualname__))
+
         RemoteFunction.remote_functions.append(self)
 
-    def __call__(self, *args, **kwargs):
-        args = args[0]
-        if len(self.args) != len(args):
-            raise TypeError()
+    @staticmethod
+    def in_process(processes: int=None, initializer=None, initargs: tuple=()):
+        """Decorator for functions executed in a pool of processes
+
+        :param processes: number of processes (default: number of cpus)
+        :param initializer: called with initargs by every process when it
+                            starts
+        """
+        def decorator(function: FunctionType):
+            return RemoteFunction(function, True, processes, initializer,
+                                  initargs)
+        return decorator
+
+    @staticmethod
+    def batched(max_size: int, max_wait: float=0.01):
+        """Decorator for functions called with batches of run calls
+
+        :param max_size: maximum number of calls in a batch
+        :param max_wait: maximum time in seconds a call waits for others
+        """
+        def decorator(function: FunctionType):
+            return RemoteFunction(function, batch_size=max_size,
+                                  batch_wait=max_wait)
+        return decorator
+
+    def convert(self, args: []) -> tuple:
+        """Returns the checked and converted arguments of a run call
+
+        :raises :TypeError if the number or types of the arguments don't
+                match the annotations
+        """
+        return self._convert(args)
+
+    def call_batch(self, calls: [tuple]) -> []:
+        """Calls a batched function with the converted arguments of
+        several run calls
+
+        :param calls: arguments of every call, as returned by convert()
+        :return: list with the result of every call
+        :raises :ValueError if the function didn't return a result for
+                every call
+        """
+        if self.process_pool:
+            calls = [_picklable(args) for args in calls]
+        columns = tuple(map(list, zip(*calls))) if calls else ()
+        if self.process_pool:
+            results = self._apply(columns)
+        else:
+            results = self.fun(*columns)
 
-        for i in range(len(self.args)):
-            if self.args[i] == "":
-                args[i] = args[i].decode('ascii')
+        if not isinstance(results, (list, tuple)) or \
+                len(results) != len(calls):
+            raise ValueError("{}() has to return a list with {} results"
+                             .format(self.__name__, len(calls)))
+        return results
 
+    def __call__(self, *args, token: CancellationToken=None, **kwargs):
+        """Calls the function with the arguments of a run call
+
+        The given list is not modified.
+
+        :param token: passed to functions taking a CancellationToken, they
+                      get a new token if it isn't set
+        :raises :TypeError if the number or types of the arguments don't
+                match the annotations
+        """
+        return self.call_converted(self._convert(args[0]), token)
+
+    def call_converted(self, args: tuple, token: CancellationToken=None):
+        """Calls the function with arguments returned by convert()
+
+        :param token: see __call__
+        """
+        if self.process_pool:
+            return self._apply(_picklable(args))
+        if self._cancel_arg is not None:
+            if token is None:
+                token = CancellationToken()
+            return self.fun(*args, **{self._cancel_arg: token})
         return self.fun(*args)
+
+    def _apply(self, args: tuple):
+        function, target = self._target
+        return self.start_pool().apply(function, target + (args, ))
+
+    def start_pool(self):
+        """Starts the process pool if it isn't running and returns it
+
+        Workers are forked and find the function by its token, so it
+        doesn't have to be picklable. Forking is only safe while no other
+        thread is running, so a :Plugin starts the pools of its functions
+        when it is created: create it before connecting. Where fork isn't
+        available, workers are spawned and import the function.
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                if not _can_fork():
+                    context = multiprocessing.get_context("spawn")
+                else:
+                    if threading.active_count() > 1:
+                        logging.warning(
+                            "Forking the process pool of " + self.__name__ +
+                            "() while other threads are running, create "
+                            "the plugin before connecting")
+                    context = multiprocessing.get_context("fork")
+                self._pool = context.Pool(self._processes, self._initializer,
+                                          self._initargs)
+            return self._pool
+
+    def close_pool(self):
+        """Stops the process pool after all pending calls finished"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
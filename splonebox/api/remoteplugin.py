@@ -18,9 +18,11 @@ see <http://www.gnu.org/licenses/>.
 """
 from splonebox.api.apicall import ApiRun
 from splonebox.api.result import RunResult
+from splonebox.api.response import time_left
 from splonebox.api.core import Core
 
 import logging
+from collections import deque
 
 
 class RemotePlugin:
@@ -31,7 +33,11 @@ class RemotePlugin:
                  desc: str,
                  author: str,
                  licence: str,
-                 core: Core):
+                 core: Core,
+                 max_results: int=1024):
+        """
+        :param max_results: number of recent results kept in self.results
+        """
         self.id = id
         self.name = name
         self.desc = desc
@@ -39,17 +45,27 @@ class RemotePlugin:
         self.licence = licence
         self.core = core
         self.function_meta = {}
-        self.results = []
+        self.results = deque(maxlen=max_results)
 
-    def run(self, function: str, arguments: []) -> RunResult:
+    def run(self, function: str, arguments: [], timeout: float=None,
+            deadline: float=None) -> RunResult:
         """Run a remote function and return a :Result
 
+        The remaining time is sent along, the called plugin doesn't execute
+        or finish the call after it expired. Pass the deadline of a
+        CancellationToken to propagate the deadline of the current call.
+
         :param function: name of the function
         :param arguments: function arguments | empty list or None for no args
+        :param timeout: seconds to wait for the result
+        :param deadline: time.monotonic() value after which the result
+                         isn't needed anymore
         :return: :RunResult
         :raises :RemoteRunError if run call failed
         """
-        run_call = ApiRun(self.id, function, arguments)
+        run_call = ApiRun(self.id, function, arguments,
+                          self.core.compression, self.core.shared_memory,
+                          time_left(timeout, deadline))
         result = self.core.send_run(run_call)
 
         result.called_by_id = self.id
@@ -17,11 +17,55 @@ see <http://www.gnu.org/licenses/>.
 
 """
 
+import concurrent.futures
 import logging
-from threading import Event
+import time
+# the return_when values of wait() are importable from here
+from concurrent.futures import Future, ALL_COMPLETED, FIRST_COMPLETED, \
+    FIRST_EXCEPTION
+from threading import Event, Lock
 import datetime
 
 
+def time_left(timeout: float=None, deadline: float=None) -> float:
+    """Returns the time until the earlier of a timeout and a deadline
+
+    :param timeout: relative timeout in seconds
+    :param deadline: absolute deadline (time.monotonic())
+    :return: seconds (never negative) or None if both are None
+    """
+    if deadline is not None:
+        remaining = max(0.0, deadline - time.monotonic())
+        if timeout is None or remaining < timeout:
+            return remaining
+    return timeout
+
+
+def wait(responses: [], timeout: float=None,
+         return_when: str=ALL_COMPLETED) -> (set, set):
+    """Waits for many responses or run results at once, see
+    concurrent.futures.wait
+
+    :param return_when: ALL_COMPLETED, FIRST_COMPLETED or FIRST_EXCEPTION
+                        (a failed call)
+    :return: (done, not done) sets of the given responses
+    """
+    futures = {response.future(): response for response in responses}
+    done, not_done = concurrent.futures.wait(futures, timeout, return_when)
+    return {futures[f] for f in done}, {futures[f] for f in not_done}
+
+
+def as_completed(responses: [], timeout: float=None):
+    """Yields the given responses or run results as they complete
+
+    :raises :concurrent.futures.TimeoutError if they didn't complete within
+            timeout seconds
+    """
+    futures = {response.future(): response for response in responses}
+    for future in concurrent.futures.as_completed(futures, timeout):
+        yield futures[future]
+
+
 class Response():
     """An object representing the Response to a call."""
     def __init__(self):
@@ -32,6 +76,9 @@ class Response():
         self.called_function = None
         self.called_by_id = None
         self.call_arguments = None
+        self._done_lock = Lock()
+        self._callbacks = []
+        self._future = None
 
     def set_error(self, error: []):
         if not isinstance(error,
@@ -40,7 +87,7 @@ class Response():
             raise RemoteError(400, "Invalid error result!")
         self._error = error
         self.fin_ts = datetime.datetime.now().strftime("%I:%M%p on %B %d, %Y")
-        self._event.set()
+        self._finish()
 
     def get_status(self) -> int:
         """ Get call status
@@ -56,24 +103,108 @@ class Response():
         else:
             return 0  # no response yet
 
-    def await(self):
+    def await_response(self, timeout: float=None, deadline: float=None):
         """Blocking call to wait for register response.
+        (Formerly await(), which is a reserved word since Python 3.7)
 
+        :param timeout: maximum time to wait in seconds
+        :param deadline: time.monotonic() value after which waiting stops
         :raises :RemoteError if register call fails
+        :raises :TimeoutError if there was no response in time
         """
-        self._event.wait()
+        if not self._event.wait(time_left(timeout, deadline)):
+            raise TimeoutError("No response received in time")
         if self._error is not None:
             logging.warning("Call failed!\n" + self._error[0].__str__() +
                             " : " + self._error[1])
             raise RemoteError(self._error[0], self._error[1])
 
+    def wait(self, timeout: float=None) -> bool:
+        """Blocks until the call succeeded or failed, without raising
+
+        :param timeout: maximum time to wait in seconds
+        :return: False if the timeout expired
+        """
+        return self._event.wait(timeout)
+
     def success(self):
         """Signal successful call
 
         This will is called when a valid response has been received
         """
         self.fin_ts = datetime.datetime.now().strftime("%I:%M%p on %B %d, %Y")
-        self._event.set()
+        self._finish()
+
+    def _finish(self):
+        """Wakes up everybody waiting and runs the done callbacks, only the
+        first call has an effect"""
+        with self._done_lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def done(self) -> bool:
+        """True if the call succeeded or failed"""
+        return self._event.is_set()
+
+    def cancel(self) -> bool:
+        """Only run calls can be cancelled"""
+        return False
+
+    def add_done_callback(self, callback):
+        """Calls callback(response) once the call succeeded or failed. If
+        it already did, the callback is called immediately.
+        """
+        with self._done_lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        self._run_callback(callback)
+
+    def _run_callback(self, callback):
+        try:
+            callback(self)
+        except Exception as e:
+            logging.warning("Done callback failed!")
+            logging.warning(e.__str__())
+
+    def future(self) -> Future:
+        """Returns a concurrent.futures.Future completed with the result of
+        the call or a :RemoteError. Cancelling the future cancels the call.
+        """
+        with self._done_lock:
+            created = self._future is None
+            if created:
+                self._future = Future()
+        if created:
+            self._future.add_done_callback(self._future_done)
+            self.add_done_callback(self._complete_future)
+        return self._future
+
+    def _future_done(self, future: Future):
+        if future.cancelled():
+            self.cancel()
+
+    def _complete_future(self, response):
+        if not self._future.set_running_or_notify_cancel():
+            return  # cancelled
+        if self._error is not None:
+            self._future.set_exception(RemoteError(*self._error))
+        else:
+            self._future.set_result(self._value())
+
+    def _value(self):
+        """The value of a completed future"""
+        return None
+
+
+# the old name of await_response(), it can't be used as attribute name in
+# Python >= 3.7 code
+setattr(Response, "await", Response.await_response)
 
 
 class RemoteError(Exception):
@@ -19,16 +19,27 @@ see <http://www.gnu.org/licenses/>.
 
 import logging
 import datetime
+from threading import Lock
 
-from splonebox.api.response import Response, RemoteError
+from splonebox.api.response import Response, RemoteError, time_left
+from splonebox.api.stream import ResultStream, ResultItems
 
 
 class RunResult(Response):
     """A Result returned by a run call"""
-    def __init__(self):
+    def __init__(self, canceller=None):
+        """
+        :param canceller: called with this result when it was cancelled and
+                          its call id is known
+        """
         super().__init__()
         self._id = None
         self._result = None
+        self._lock = Lock()
+        self._canceller = canceller
+        self._cancelled = False
+        # time.monotonic() value at which the called plugin gives up
+        self.deadline = None
 
     def was_exec(self) -> bool:
         return self._id is not None and self._error is None
@@ -57,15 +68,25 @@ class RunResult(Response):
             # Execution was successful
             return 2
 
-    def get_result(self, blocking=True) -> []:
+    def get_result(self, blocking=True, timeout: float=None,
+                   deadline: float=None) -> []:
         """ Returns the actual result of the function
 
+        If the call was sent with a timeout, waiting ends at its deadline.
+
         :param blocking: wait for result
+        :param timeout: maximum time to wait in seconds
+        :param deadline: time.monotonic() value after which waiting stops
         :returns  Result
         :raises :RemoteError if call failed
+        :raises :TimeoutError if the result didn't arrive in time
         """
         if blocking:
-            self._event.wait()
+            if self.deadline is not None and (deadline is None or
+                                              self.deadline < deadline):
+                deadline = self.deadline
+            if not self._event.wait(time_left(timeout, deadline)):
+                raise TimeoutError("No result received in time")
         if self._error is None:
             return self._result
         else:
@@ -76,10 +97,100 @@ class RunResult(Response):
     def set_result(self, result):
         self._result = result
         self.fin_ts = datetime.datetime.now().strftime("%I:%M%p on %B %d, %Y")
-        self._event.set()
+        self._finish()
+
+    def _value(self):
+        return self._result
+
+    def feed_chunk(self, seq: int, data: bytes, last: bool):
+        """Adds a chunk of a streamed result
+
+        The first chunk sets the result to a :ResultStream, so get_result()
+        returns before the whole result was received.
+        """
+        with self._lock:
+            first = not isinstance(self._result, ResultStream)
+            if first:
+                self._result = ResultStream(self.deadline)
+        self._result.feed(seq, data, last)
+        if first:
+            self.set_result(self._result)
+
+    def feed_item(self, seq: int, item, last: bool, empty: bool=False):
+        """Adds an item yielded by a remote generator function
+
+        The first item sets the result to :ResultItems, so get_result()
+        returns before the generator finished.
+        """
+        with self._lock:
+            first = not isinstance(self._result, ResultItems)
+            if first:
+                self._result = ResultItems(self.deadline)
+        self._result.feed(seq, item, last, empty)
+        if first:
+            self.set_result(self._result)
+
+    def is_complete(self) -> bool:
+        """True if the result was received completely, streamed results
+        are complete once their last part arrived"""
+        if not self._event.is_set():
+            return False
+        if isinstance(self._result, (ResultStream, ResultItems)):
+            return self._result.finished()
+        return True
+
+    def items(self):
+        """Iterates over the items of a remote generator function as they
+        arrive. A function that returned a single value yields it once.
+
+        :raises :RemoteError if call failed
+        """
+        result = self.get_result()
+        if isinstance(result, ResultItems):
+            yield from result
+        else:
+            yield result
+
+    def abort(self, error: []):
+        """Fails the call, e.g. because the connection was closed. A
+        partially received stream or generator fails too, its readers
+        get a :RemoteError instead of waiting for the rest.
+
+        :param error: [error code, message]
+        """
+        with self._lock:
+            partial = self._result
+        if isinstance(partial, (ResultStream, ResultItems)):
+            partial.fail(RemoteError(error[0], error[1]))
+        elif not self.has_result():
+            self.set_error(error)
+
+    def cancel(self) -> bool:
+        """Cancels the run call, the called plugin stops executing it
+
+        get_result() raises a :RemoteError (499) afterwards, results
+        arriving later are dropped.
+
+        :return: False if the result already arrived or the call failed
+        """
+        with self._lock:
+            if self.has_result() or self._cancelled:
+                return False
+            self._cancelled = True
+        self.set_error([499, "Call was cancelled"])
+
+        if self._canceller is not None:
+            self._canceller(self)
+        return True
+
+    def cancelled(self) -> bool:
+        return self._cancelled
 
     def get_id(self) -> int:
         return self._id
 
     def set_id(self, call_id: int):
         self._id = call_id
+        if self._cancelled and self._canceller is not None:
+            # cancelled before the response arrived
+            self._canceller(self)
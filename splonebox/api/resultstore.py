@@ -0,0 +1,210 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from splonebox.api.result import RunResult
+
+
+class ResultStore:
+    """Run results waiting for their result calls, by call id
+
+    The store is bounded: results are evicted once they are older than the
+    ttl (checked by a sweeper thread) or when the store is full (oldest
+    first).
+    Results that didn't arrive completely fail with error 408 when they are
+    evicted, including partially received streams, so nobody waits for
+    them forever.
+
+    With weak=True only weak references are kept, results the caller
+    dropped are forgotten. Results whose stream is being received are
+    kept until it is complete, the caller may only hold the stream.
+    """
+
+    def __init__(self, max_size: int=65536, ttl: float=None,
+                 weak: bool=False):
+        """
+        :param max_size: maximum number of stored results
+        :param ttl: seconds after which a result is evicted (None: never)
+        :param weak: keep weak references to the results
+        """
+        if max_size < 1:
+            raise ValueError("A result store has to hold at least one result")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.weak = weak
+
+        self._lock = threading.Lock()
+        # notifies the sweeper if the oldest result changed
+        self._expiry = threading.Condition(self._lock)
+        # call id: (expiry time or None, result or weak reference), oldest
+        # first. All entries have the same ttl, so they expire in order.
+        self._entries = OrderedDict()
+        self._sweeper = None  # thread evicting the expired results
+
+        self.evicted_expired = 0
+        self.evicted_full = 0
+        self.collected = 0  # dropped by the caller (weak references)
+
+    def add(self, call_id: int, result: RunResult):
+        """Stores the result of a call and evicts old results"""
+        now = time.monotonic()
+        expires = None if self.ttl is None else now + self.ttl
+        with self._lock:
+            self._entries.pop(call_id, None)
+            self._entries[call_id] = (
+                expires, weakref.ref(result) if self.weak else result)
+            evicted = self._evict(now)
+            if self.ttl is not None:
+                self._wake_sweeper(call_id)
+        self._fail(evicted)
+
+    def keep(self, call_id: int):
+        """Keeps a strong reference to a stored result, e.g. once its
+        stream is being received"""
+        if not self.weak:
+            return
+        with self._lock:
+            entry = self._entries.get(call_id)
+            if entry is not None:
+                result = self._resolve(entry[1])
+                if result is not None:
+                    self._entries[call_id] = (entry[0], result)
+
+    def sweep(self):
+        """Evicts the expired results"""
+        with self._lock:
+            evicted = self._evict(time.monotonic())
+        self._fail(evicted)
+
+    def _wake_sweeper(self, call_id: int):
+        """Starts the sweeper or tells it about a new oldest result (lock
+        has to be held)"""
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep_expired,
+                                             daemon=True)
+            self._sweeper.start()
+        elif next(iter(self._entries)) == call_id:
+            # the store was empty, the sweeper waits without timeout
+            self._expiry.notify()
+
+    def _sweep_expired(self):
+        """Sweeper thread: waits until the oldest result expired and
+        evicts it"""
+        while True:
+            with self._lock:
+                while True:
+                    now = time.monotonic()
+                    if not self._entries:
+                        self._expiry.wait()
+                        continue
+                    expires = next(iter(self._entries.values()))[0]
+                    if expires <= now:
+                        break
+                    self._expiry.wait(expires - now)
+                evicted = self._evict(now)
+            self._fail(evicted)
+
+    def get(self, call_id: int) -> RunResult:
+        """Returns the stored result of a call
+
+        :raises :KeyError if the call id is unknown or the result was
+                evicted
+        """
+        now = time.monotonic()
+        with self._lock:
+            expires, ref = self._entries[call_id]
+            result = self._resolve(ref)
+            if result is None:
+                del self._entries[call_id]
+                self.collected += 1
+                raise KeyError(call_id)
+            if expires is not None and expires <= now:
+                del self._entries[call_id]
+                self.evicted_expired += 1
+                evicted = [result]
+            else:
+                return result
+        self._fail(evicted)
+        raise KeyError(call_id)
+
+    def pop(self, call_id: int) -> RunResult:
+        """Removes the result of a call
+
+        :return: the result or None if it isn't stored
+        """
+        with self._lock:
+            entry = self._entries.pop(call_id, None)
+        return None if entry is None else self._resolve(entry[1])
+
+    def values(self) -> [RunResult]:
+        """Returns all stored results"""
+        with self._lock:
+            results = [self._resolve(ref) for _, ref in self._entries.values()]
+        return [result for result in results if result is not None]
+
+    def stats(self) -> dict:
+        """Returns the number of stored and evicted results"""
+        with self._lock:
+            return {"size": len(self._entries),
+                    "evicted_expired": self.evicted_expired,
+                    "evicted_full": self.evicted_full,
+                    "collected": self.collected}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _resolve(ref) -> RunResult:
+        # kept results are stored without weak reference
+        return ref() if isinstance(ref, weakref.ref) else ref
+
+    def _evict(self, now: float) -> [RunResult]:
+        """Removes expired, collected and surplus results (lock has to be
+        held)
+
+        :return: the evicted results
+        """
+        evicted = []
+        while self._entries:
+            call_id, (expires, ref) = next(iter(self._entries.items()))
+            result = self._resolve(ref)
+            if result is None:
+                self.collected += 1
+            elif expires is not None and expires <= now:
+                self.evicted_expired += 1
+                evicted.append(result)
+            elif len(self._entries) > self.max_size:
+                self.evicted_full += 1
+                evicted.append(result)
+            else:
+                break
+            del self._entries[call_id]
+        return evicted
+
+    @staticmethod
+    def _fail(evicted: [RunResult]):
+        """Releases everybody waiting for an evicted result or the rest of
+        its stream"""
+        for result in evicted:
+            if not result.is_complete():
+                result.abort([408, "Result was evicted"])
@@ -0,0 +1,145 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import asyncio
+import logging
+import threading
+
+# asyncio.Task.current_task() was removed in Python 3.9
+_current_task = getattr(asyncio, "current_task", None) or \
+    asyncio.Task.current_task
+
+
+class RunLoop:
+    """Executes coroutine run calls on an asyncio event loop
+
+    The loop runs on its own thread, which is started with the first call.
+    Waiting calls don't occupy a thread, so many of them can be in flight
+    at once. Functions may be limited to a number of concurrent executions.
+
+    Only pending and running calls are tracked, finished calls are
+    forgotten.
+    """
+
+    def __init__(self, function_limits: dict=None):
+        """
+        :param function_limits: {function name: maximum number of concurrent
+                                executions}
+        """
+        self.function_limits = function_limits or {}
+        self._loop = None
+        self._thread = None
+        self._limits = {}  # function name: asyncio.Semaphore
+        self._lock = threading.Lock()
+        self._all_done = threading.Condition(self._lock)
+        self._calls = {}  # call id: concurrent.futures.Future
+        # only accessed by the loop's thread
+        self._tasks = {}  # call id: asyncio.Task of running calls
+        self._cancelled = set()  # ids of calls cancelled before they ran
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """Returns the event loop, it is started if it isn't running"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, call_id, name: str, function, *args):
+        """Schedules the coroutine function(*args) on the loop
+
+        :param call_id: id used to track the call
+        :param name: name of the remote function (for function_limits)
+        """
+        loop = self.get_loop()
+        with self._lock:
+            future = asyncio.run_coroutine_threadsafe(
+                self._run(call_id, name, function, args), loop)
+            self._calls[call_id] = future
+        future.add_done_callback(lambda f: self._finished(call_id, f))
+
+    async def _run(self, call_id, name: str, function, args: tuple):
+        if call_id in self._cancelled:
+            self._cancelled.discard(call_id)
+            raise asyncio.CancelledError()
+
+        self._tasks[call_id] = _current_task()
+        try:
+            limit = self.function_limits.get(name)
+            if limit is None:
+                return await function(*args)
+
+            semaphore = self._limits.get(name)
+            if semaphore is None:
+                semaphore = self._limits[name] = asyncio.Semaphore(limit)
+            async with semaphore:
+                return await function(*args)
+        finally:
+            del self._tasks[call_id]
+
+    def _finished(self, call_id, future):
+        if not future.cancelled() and future.exception() is not None:
+            logging.warning("Run call failed!")
+            logging.warning(future.exception().__str__())
+
+        with self._lock:
+            if self._calls.get(call_id) is future:
+                del self._calls[call_id]
+            if not self._calls:
+                self._all_done.notify_all()
+
+    def cancel(self, call_id) -> bool:
+        """Cancels a call, a running coroutine gets a CancelledError at its
+        next await
+
+        :return: False if the call is unknown
+        """
+        with self._lock:
+            if call_id not in self._calls:
+                return False
+            loop = self._loop
+        # the call is tracked until its task finished
+        loop.call_soon_threadsafe(self._cancel_task, call_id)
+        return True
+
+    def _cancel_task(self, call_id):
+        task = self._tasks.get(call_id)
+        if task is not None:
+            task.cancel()
+        else:
+            # the task was created but didn't start yet
+            with self._lock:
+                if call_id in self._calls:
+                    self._cancelled.add(call_id)
+
+    def active_calls(self) -> []:
+        """Returns the ids of all pending and running calls"""
+        with self._lock:
+            return list(self._calls)
+
+    def wait(self, timeout: float=None) -> bool:
+        """Blocks until all calls finished
+
+        :param timeout: maximum time to wait in seconds
+        :return: False if the timeout expired
+        """
+        with self._lock:
+            return self._all_done.wait_for(lambda: not self._calls, timeout)
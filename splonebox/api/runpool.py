@@ -0,0 +1,178 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import logging
+import threading
+from collections import deque
+
+
+class RunPool:
+    """Executes run calls on a bounded number of worker threads
+
+    Calls wait in a bounded queue until a worker is free. Functions may be
+    limited to a number of concurrent executions, further calls of such a
+    function are held back until one of its executions finished. Workers
+    are started on demand.
+
+    Only pending and running calls are tracked, finished calls are
+    forgotten.
+    """
+
+    def __init__(self, max_workers: int=16, queue_size: int=1024,
+                 function_limits: dict=None):
+        """
+        :param max_workers: maximum number of worker threads (has to be > 0)
+        :param queue_size: maximum number of calls waiting for a worker
+        :param function_limits: {function name: maximum number of concurrent
+                                executions}
+        """
+        if max_workers < 1:
+            raise ValueError("A run pool needs at least one worker")
+
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.function_limits = function_limits or {}
+
+        self._lock = threading.Lock()
+        self._work_available = threading.Condition(self._lock)
+        self._all_done = threading.Condition(self._lock)
+        self._queue = deque()  # calls ready to be executed
+        self._held = {}  # function name: deque of held back calls
+        self._scheduled = {}  # function name: number of queued/running calls
+        self._calls = {}  # call id: function name
+        self._threads = []
+        self._idle = 0  # number of workers waiting for a call
+        self._running = 0
+
+    def submit(self, call_id, name: str, function, *args) -> bool:
+        """Schedules function(*args)
+
+        :param call_id: id used to track the call
+        :param name: name of the remote function (for function_limits)
+        :return: False if the queue is full and the call was rejected
+        """
+        with self._lock:
+            if len(self._calls) - self._running >= self.queue_size:
+                return False
+
+            self._calls[call_id] = name
+            job = (call_id, name, function, args)
+
+            limit = self.function_limits.get(name)
+            if limit is not None and self._scheduled.get(name, 0) >= limit:
+                self._held.setdefault(name, deque()).append(job)
+                return True
+
+            self._schedule(job)
+            return True
+
+    def _schedule(self, job):
+        """Moves a call to the queue (lock has to be held)"""
+        name = job[1]
+        self._scheduled[name] = self._scheduled.get(name, 0) + 1
+        self._queue.append(job)
+
+        if len(self._queue) <= self._idle:
+            self._work_available.notify()
+        elif len(self._threads) < self.max_workers:
+            t = threading.Thread(target=self._work, daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _finished(self, call_id, name: str):
+        """Forgets a scheduled call and releases held back calls (lock has
+        to be held)
+        """
+        self._calls.pop(call_id, None)
+
+        self._scheduled[name] -= 1
+        if not self._scheduled[name]:
+            del self._scheduled[name]
+
+        held = self._held.get(name)
+        if held:
+            self._schedule(held.popleft())
+            if not held:
+                del self._held[name]
+
+        if not self._calls:
+            self._all_done.notify_all()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._idle += 1
+                    self._work_available.wait()
+                    self._idle -= 1
+                call_id, name, function, args = self._queue.popleft()
+                self._running += 1
+
+            try:
+                function(*args)
+            except Exception as e:
+                logging.warning("Run call failed!")
+                logging.warning(e.__str__())
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._finished(call_id, name)
+
+    def cancel(self, call_id) -> bool:
+        """Removes a call that didn't start yet
+
+        :return: False if the call is running or unknown
+        """
+        with self._lock:
+            name = self._calls.get(call_id)
+            if name is None:
+                return False
+
+            for job in self._queue:
+                if job[0] == call_id:
+                    self._queue.remove(job)
+                    self._finished(call_id, name)
+                    return True
+
+            held = self._held.get(name, ())
+            for job in held:
+                if job[0] == call_id:
+                    held.remove(job)
+                    if not held:
+                        del self._held[name]
+                    del self._calls[call_id]
+                    if not self._calls:
+                        self._all_done.notify_all()
+                    return True
+
+            return False
+
+    def active_calls(self) -> []:
+        """Returns the ids of all pending and running calls"""
+        with self._lock:
+            return list(self._calls)
+
+    def wait(self, timeout: float=None) -> bool:
+        """Blocks until all calls finished
+
+        :param timeout: maximum time to wait in seconds
+        :return: False if the timeout expired
+        """
+        with self._lock:
+            return self._all_done.wait_for(lambda: not self._calls, timeout)
@@ -0,0 +1,228 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import binascii
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+
+import msgpack
+
+# msgpack ExtType code of a shared memory handle:
+# <8 bytes: size> <4 bytes: crc32> <name of the segment>
+SHARED_EXT = 4
+
+_handle = struct.Struct("<QI")
+_name_re = re.compile(r"^splonebox-[0-9a-f]{32}$")
+
+
+# segments are files on a memory backed file system if there is one
+DIRECTORY = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class SharedMemory:
+    """Passes large bytes values of run calls and results through shared
+    memory instead of the connection
+
+    The value is written to a segment (a file on a memory backed file
+    system) and only a handle containing the segment's name, size and
+    checksum is sent. This only works if the receiving plugin runs on the
+    same host and can access the directory, so it is opt-in: pass an
+    instance to :Core to enable it. Handles are only attached by a Core
+    that enabled it.
+
+    The receiver removes a segment when it attaches or rejects it. Segments
+    that are never received (e.g. because the receiver went away) are
+    removed by the sender after ttl seconds.
+    """
+
+    def __init__(self, threshold: int=1024 * 1024, mode: int=0o600,
+                 ttl: float=60.0):
+        """
+        :param threshold: values shorter than this (in bytes) are sent as
+                          they are
+        :param mode: permissions of the segments, the receiving plugin
+                     has to be able to read them
+        :param ttl: seconds after which segments that weren't attached are
+                    removed (None: never)
+        """
+        self.threshold = threshold
+        self.mode = mode
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # notifies the sweeper if the oldest segment changed
+        self._expiry = threading.Condition(self._lock)
+        # (expiry time, path) of the shared segments, oldest first
+        self._segments = deque()
+        self._sweeper = None  # thread removing the expired segments
+
+    def share(self, value):
+        """Returns a handle to a new segment containing value, or value
+        itself if it is too small or not bytes
+        """
+        if not isinstance(value, bytes) or len(value) < self.threshold:
+            return value
+
+        name = "splonebox-" + binascii.hexlify(os.urandom(16)).decode()
+        path = os.path.join(DIRECTORY, name)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, self.mode)
+        try:
+            with open(fd, "wb", closefd=False) as f:
+                f.write(value)
+        except Exception:
+            os.unlink(path)
+            raise
+        finally:
+            os.close(fd)
+
+        if self.ttl is not None:
+            self._track(path)
+        return msgpack.ExtType(
+            SHARED_EXT,
+            _handle.pack(len(value), zlib.crc32(value)) + name.encode())
+
+    def share_args(self, args: []) -> []:
+        """Returns a list of the arguments, large ones replaced by handles"""
+        return [self.share(arg) for arg in args]
+
+    def _track(self, path: str):
+        with self._lock:
+            self._segments.append((time.monotonic() + self.ttl, path))
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_expired,
+                                                 daemon=True)
+                self._sweeper.start()
+            elif len(self._segments) == 1:
+                # the sweeper waits without timeout
+                self._expiry.notify()
+
+    def _sweep_expired(self):
+        """Sweeper thread: waits until the oldest segment expired and
+        removes it"""
+        while True:
+            with self._lock:
+                while True:
+                    if not self._segments:
+                        self._expiry.wait()
+                        continue
+                    delay = self._segments[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._expiry.wait(delay)
+            self.cleanup()
+
+    def cleanup(self, expired_only: bool=True) -> int:
+        """Removes the segments that weren't attached within ttl seconds
+        (called by the sweeper)
+
+        :param expired_only: if False, all segments that weren't attached
+                             yet are removed
+        :return: number of removed segments
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = []
+            while self._segments and (not expired_only or
+                                      self._segments[0][0] <= now):
+                expired.append(self._segments.popleft()[1])
+
+        return sum(_unlink(path) for path in expired)
+
+
+def is_shared(value) -> bool:
+    return isinstance(value, msgpack.ExtType) and value.code == SHARED_EXT
+
+
+def _unlink(path: str) -> bool:
+    try:
+        os.unlink(path)
+        return True
+    except FileNotFoundError:
+        return False  # attached or removed by the receiver
+
+
+def _segment_path(value: msgpack.ExtType) -> str:
+    """Returns the path of a handle's segment
+
+    :raises :ValueError if the handle is invalid
+    """
+    if len(value.data) <= _handle.size:
+        raise ValueError("Invalid shared memory handle")
+
+    name = value.data[_handle.size:].decode('ascii', 'replace')
+    if not _name_re.match(name):
+        raise ValueError("Invalid shared memory segment name")
+    return os.path.join(DIRECTORY, name)
+
+
+def release(value):
+    """Removes the segment of a handle that is rejected or can't be sent,
+    without attaching it. Other values are ignored.
+    """
+    if not is_shared(value):
+        return
+    try:
+        _unlink(_segment_path(value))
+    except (ValueError, OSError):
+        pass
+
+
+def release_args(args):
+    """Calls release() for every argument"""
+    if isinstance(args, list):
+        for arg in args:
+            release(arg)
+
+
+def attach(value: msgpack.ExtType) -> memoryview:
+    """Maps the segment of a handle created by SharedMemory.share
+
+    The segment is removed from the file system right away, the memory is
+    released when the returned view (and every object referencing it) is
+    garbage collected.
+
+    :return: read only memoryview of the segment, nothing is copied
+    :raises :ValueError if the handle is invalid, the segment doesn't exist
+            or its content doesn't match the checksum
+    """
+    path = _segment_path(value)
+    size, crc = _handle.unpack_from(value.data)
+    try:
+        with open(path, "rb") as f:
+            os.unlink(path)
+            if os.fstat(f.fileno()).st_size != size:
+                raise ValueError("Shared memory segment has a wrong size")
+            segment = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    except OSError as e:
+        raise ValueError("Unable to attach shared memory: " + str(e))
+
+    view = memoryview(segment)
+    if zlib.crc32(view) != crc:
+        view.release()
+        segment.close()
+        raise ValueError("Shared memory segment is corrupted")
+
+    return view
@@ -0,0 +1,257 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import io
+import struct
+import threading
+from collections import deque
+
+import msgpack
+
+from splonebox.api.response import time_left
+
+# msgpack ExtType code of a chunk:
+# <4 bytes: sequence number> <1 byte: last chunk flag> <data>
+STREAM_CHUNK_EXT = 1
+
+# msgpack ExtType code of an item yielded by a generator function:
+# <4 bytes: sequence number> <1 byte: flags> <msgpack packed item>
+# The generator's end is sent as an empty item with the last flag.
+STREAM_ITEM_EXT = 5
+
+_LAST = 1
+_EMPTY = 2
+
+DEFAULT_CHUNK_SIZE = 512 * 1024
+
+_chunk_header = struct.Struct("<IB")
+
+
+def pack_chunk(seq: int, data: bytes, last: bool) -> msgpack.ExtType:
+    """Wraps a chunk of a stream, so it can be sent as a result"""
+    return msgpack.ExtType(STREAM_CHUNK_EXT,
+                           _chunk_header.pack(seq, last) + data)
+
+
+def is_chunk(value) -> bool:
+    return isinstance(value, msgpack.ExtType) and \
+        value.code == STREAM_CHUNK_EXT
+
+
+def unpack_chunk(value: msgpack.ExtType):
+    """Returns (seq, data, last) of a chunk created by pack_chunk
+
+    :raises :ValueError if the chunk is malformed
+    """
+    if not is_chunk(value) or len(value.data) < _chunk_header.size:
+        raise ValueError("Invalid stream chunk")
+
+    seq, last = _chunk_header.unpack_from(value.data)
+    return seq, value.data[_chunk_header.size:], bool(last)
+
+
+def iter_chunks(source, chunk_size: int=DEFAULT_CHUNK_SIZE):
+    """Splits a file-like object into chunks without reading it at once
+
+    :param source: object with a read(size) method
+    :param chunk_size: maximum size of a chunk
+    :return: generator of (seq, data, last)
+    """
+    seq = 0
+    data = source.read(chunk_size)
+    while True:
+        following = source.read(chunk_size) if data else b''
+        last = not following
+        yield seq, data, last
+        if last:
+            return
+        seq += 1
+        data = following
+
+
+def pack_item(seq: int, item, last: bool=False) -> msgpack.ExtType:
+    """Wraps an item yielded by a generator, so it can be sent as a result.
+    pack_item(seq, None, True) marks the end of the generator.
+    """
+    if last:
+        return msgpack.ExtType(STREAM_ITEM_EXT,
+                               _chunk_header.pack(seq, _LAST | _EMPTY))
+    return msgpack.ExtType(STREAM_ITEM_EXT,
+                           _chunk_header.pack(seq, 0) +
+                           msgpack.packb(item, use_bin_type=True))
+
+
+def is_item(value) -> bool:
+    return isinstance(value, msgpack.ExtType) and \
+        value.code == STREAM_ITEM_EXT
+
+
+def unpack_item(value: msgpack.ExtType, raw: bool=True):
+    """Returns (seq, item, last, empty) of an item created by pack_item
+
+    :param raw: unpack strings as bytes
+    :raises :ValueError if the item is malformed
+    """
+    if not is_item(value) or len(value.data) < _chunk_header.size:
+        raise ValueError("Invalid stream item")
+
+    seq, flags = _chunk_header.unpack_from(value.data)
+    if flags & _EMPTY:
+        return seq, None, bool(flags & _LAST), True
+
+    try:
+        item = msgpack.unpackb(value.data[_chunk_header.size:], raw=raw,
+                               unicode_errors='replace')
+    except Exception as e:
+        raise ValueError("Invalid stream item: " + str(e))
+    return seq, item, bool(flags & _LAST), False
+
+
+class _Sequence:
+    """Passes on values received with a sequence number in order"""
+
+    def __init__(self, deadline: float=None):
+        """
+        :param deadline: time.monotonic() value after which readers stop
+                         waiting for further values
+        """
+        self._cond = threading.Condition()
+        self._values = deque()  # values that can be consumed, in order
+        self._pending = {}  # seq: (value, last, empty) of out of order ones
+        self._next_seq = 0
+        self._finished = False
+        self._error = None
+        self.deadline = deadline
+
+    def _feed(self, seq: int, value, last: bool, empty: bool):
+        with self._cond:
+            if seq < self._next_seq or self._finished:
+                return  # duplicate
+
+            self._pending[seq] = (value, last, empty)
+            while self._next_seq in self._pending:
+                value, last, empty = self._pending.pop(self._next_seq)
+                self._next_seq += 1
+                if not empty:
+                    self._values.append(value)
+                if last:
+                    self._finished = True
+                    self._pending.clear()
+                    break
+
+            self._cond.notify_all()
+
+    def fail(self, error: Exception):
+        """Aborts the sequence, e.g. because the connection was closed.
+        Readers get the values received so far, then error is raised.
+        """
+        with self._cond:
+            if self._finished:
+                return
+            self._error = error
+            self._finished = True
+            self._pending.clear()
+            self._cond.notify_all()
+
+    def _wait(self) -> bool:
+        """Waits until a value can be consumed or the sequence ended (lock
+        has to be held)
+
+        :return: False if there are no more values
+        :raises :TimeoutError if nothing arrived until the deadline
+        :raises the error of a failed sequence
+        """
+        while not self._values and not self._finished:
+            if not self._cond.wait(time_left(None, self.deadline)):
+                raise TimeoutError("No stream data received in time")
+
+        if not self._values and self._error is not None:
+            raise self._error
+        return bool(self._values)
+
+    def finished(self) -> bool:
+        """True if the last value was received or the sequence failed"""
+        return self._finished
+
+
+class ResultItems(_Sequence):
+    """Iterator over the items yielded by a remote generator function
+
+    Items are passed on as soon as they arrive, iterating blocks until the
+    next item is available.
+    """
+
+    def feed(self, seq: int, item, last: bool, empty: bool=False):
+        """Adds a received item (called by :RunResult)"""
+        self._feed(seq, item, last, empty)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._cond:
+            if not self._wait():
+                raise StopIteration
+            return self._values.popleft()
+
+
+class ResultStream(_Sequence, io.RawIOBase):
+    """File-like object receiving a streamed result
+
+    Chunks are passed on as soon as they arrive, read() blocks until data
+    is available. Iterating over the stream yields the received chunks.
+    """
+
+    def __init__(self, deadline: float=None):
+        _Sequence.__init__(self, deadline)
+        io.RawIOBase.__init__(self)
+        self._offset = 0  # read position in self._values[0]
+
+    def readable(self) -> bool:
+        return True
+
+    def feed(self, seq: int, data: bytes, last: bool):
+        """Adds a received chunk (called by :RunResult)"""
+        self._feed(seq, data, last, not data)
+
+    def readinto(self, b) -> int:
+        with self._cond:
+            if not self._wait():
+                return 0  # EOF
+
+            chunk = self._values[0]
+            n = min(len(b), len(chunk) - self._offset)
+            b[:n] = chunk[self._offset:self._offset + n]
+            self._offset += n
+            if self._offset == len(chunk):
+                self._values.popleft()
+                self._offset = 0
+            return n
+
+    def __iter__(self):
+        while True:
+            with self._cond:
+                if not self._wait():
+                    return
+
+                chunk = self._values.popleft()
+                if self._offset:
+                    chunk = chunk[self._offset:]
+                    self._offset = 0
+            yield chunk
@@ -16,6 +16,7 @@ along with this splonebox python client library.  If not,
 see <http://www.gnu.org/licenses/>.
 
 """
+import asyncio
 from queue import Queue
 
 
@@ -30,3 +31,34 @@ class Subscription():
 
     def signal(self, val: []):
         self._evt_queue.put(val)
+
+
+class AsyncSubscription():
+    """Subscription whose events are awaited on an asyncio event loop
+
+        async for args in subscription:
+            ...
+
+    Events are signalled by the thread dispatching the broadcasts and
+    handed to the loop, which must be running while they arrive.
+    """
+    def __init__(self, name: str, loop: asyncio.AbstractEventLoop):
+        self.name = name
+        self._loop = loop
+        self._evt_queue = asyncio.Queue()
+
+    async def wait(self, timeout: float=None):
+        """Returns the arguments of the next event
+
+        :raises :asyncio.TimeoutError if no event arrived in time
+        """
+        return await asyncio.wait_for(self._evt_queue.get(), timeout)
+
+    def signal(self, val: []):
+        self._loop.call_soon_threadsafe(self._evt_queue.put_nowait, val)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._evt_queue.get()
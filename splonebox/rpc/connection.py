@@ -35,6 +35,7 @@ class Connection:
         self._socket = None
         self._disconnected = threading.Event()
         self._disconnected.set()
+        self._flushing = False  # no more messages are sent
         self.crypto_context = Crypto.by_path()
         self.crypto_lock = threading.Lock()
 
@@ -69,6 +70,7 @@ class Connection:
         self._init_crypto()
         logging.debug("Encryption initialized!")
 
+        self._flushing = False
         self._disconnected.clear()
         if listen:
             self.listen(msg_callback, new_thread=listen_on_new_thread)
@@ -115,12 +117,33 @@ class Connection:
             logging.debug("Start listening..")
             self._listen(msg_callback)
 
-    def disconnect(self):
-        """Closes the connection"""
+    def disconnect(self, flush_timeout: float=None):
+        """Closes the connection
+
+        :param flush_timeout: if set, sending is stopped and the connection
+                              is closed once the server received all sent
+                              messages and closed its side, or after
+                              flush_timeout seconds. Incoming messages are
+                              handled until then.
+        """
+        if flush_timeout is not None and not self._disconnected.is_set():
+            with self.crypto_lock:  # waits for messages being sent
+                self._flushing = True
+                try:
+                    self._socket.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+            # the listener stops when the server closed the connection
+            self._disconnected.wait(flush_timeout)
+
         self._disconnected.set()
-        self._socket.shutdown(socket.SHUT_RDWR)
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed by the server
         self._socket.close()
-        if self._listen_thread is not None:
+        if self._listen_thread is not None and \
+                self._listen_thread is not threading.current_thread():
             self._listen_thread.join()
 
     def send_message(self, msg: bytes):
@@ -134,14 +157,39 @@ class Connection:
         self.crypto_context.crypto_established.wait()
 
         with self.crypto_lock:
+            if self._flushing:
+                raise BrokenPipeError("Connection is closing")
             boxed = self.crypto_context.crypto_write(msg)
             self._socket.sendall(boxed)
 
+    def send_messages(self, msgs: [bytes]):
+        """Sends given messages to server if connected
+
+        Every message is boxed on its own, but all packets are written to
+        the socket at once.
+
+        :param msgs: list of messages to be sent
+        """
+        if self._disconnected.is_set():
+            raise BrokenPipeError("Connection has been closed")
+
+        self.crypto_context.crypto_established.wait()
+
+        with self.crypto_lock:
+            if self._flushing:
+                raise BrokenPipeError("Connection is closing")
+            boxed = [self.crypto_context.crypto_write(msg) for msg in msgs]
+            self._socket.sendall(b"".join(boxed))
+
     def _listen(self, msg_callback):
         """Listens for incoming messages.
         :param msg_callback callback function with one argument (:Message)
         """
-        recv_buffer = b''
+        # Received data is only joined once a whole packet is available,
+        # large packets would be copied for every recv() otherwise
+        chunks = []
+        buffered = 0
+        msg_length = None
 
         while not self._disconnected.is_set():
             try:
@@ -151,7 +199,8 @@ class Connection:
                     if self._disconnected.is_set():
                         break  # Connection was closed by user
                     self._disconnected.set()
-                    logging.warning("Connection was closed by the server!")
+                    if not self._flushing:
+                        logging.warning("Connection was closed by the server!")
                     return
             except:
                 if not self._disconnected.is_set():
@@ -159,19 +208,40 @@ class Connection:
                     raise
                 return
 
-            recv_buffer += data
+            chunks.append(data)
+            buffered += len(data)
+
+            if msg_length is not None and buffered < msg_length:
+                continue
+
+            recv_buffer = b''.join(chunks)
+            view = memoryview(recv_buffer)
+            offset = 0
+            msg_length = None
 
             try:
-                msg_length = self.crypto_context.crypto_verify_length(recv_buffer)
-                while (msg_length <= len(recv_buffer) and
-                       len(recv_buffer) > 0):
+                while offset < len(recv_buffer):
+                    msg_length = self.crypto_context.crypto_verify_length(
+                        view[offset:])
+                    if msg_length > len(recv_buffer) - offset:
+                        break
+
                     plain = self.crypto_context.crypto_read(
-                        recv_buffer[:msg_length])
+                        view[offset:offset + msg_length])
+                    offset += msg_length
+                    msg_length = None
                     msg_callback(plain)
-
-                    recv_buffer = recv_buffer[msg_length:]
             except PacketTooShortException:
-                continue
+                pass
             except InvalidPacketException as e:
                 logging.warning(e)
-                recv_buffer = b''
+                offset = len(recv_buffer)
+                msg_length = None
+
+            if offset == 0:
+                chunks = [recv_buffer]
+            elif offset < len(recv_buffer):
+                chunks = [recv_buffer[offset:]]
+            else:
+                chunks = []
+            buffered = len(recv_buffer) - offset
@@ -0,0 +1,103 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import logging
+import threading
+from queue import Queue, Full
+
+
+class DispatchPool:
+    """Runs message handlers on a fixed number of worker threads
+
+    Every worker owns a bounded queue. Jobs are assigned to a worker by
+    hashing their key, so all jobs with the same key are executed in the
+    order they were submitted. If a queue is full, submit() blocks until
+    the worker caught up.
+    """
+
+    _stop = object()
+
+    def __init__(self, workers: int, queue_size: int=1024):
+        """
+        :param workers: number of worker threads (has to be > 0)
+        :param queue_size: maximum number of pending jobs per worker
+        """
+        if workers < 1:
+            raise ValueError("A dispatch pool needs at least one worker")
+
+        self._queues = [Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = []
+        self._finishing = set()  # queues whose worker stops once empty
+
+    def start(self):
+        """Starts the worker threads"""
+        if self._threads:
+            return
+
+        self._finishing.clear()
+        for q in self._queues:
+            t = threading.Thread(target=self._work, args=(q, ), daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        """Lets the workers finish all pending jobs and stops them
+
+        May be called by a job, its worker stops after its pending jobs.
+        """
+        for q, t in zip(self._queues, self._threads):
+            if t is not threading.current_thread():
+                q.put(DispatchPool._stop)
+                continue
+            # the calling worker can't wait for room in its own queue
+            try:
+                q.put_nowait(DispatchPool._stop)
+            except Full:
+                self._finishing.add(q)
+
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join()
+
+        self._threads = []
+
+    def submit(self, key, function, *args):
+        """Schedules function(*args)
+
+        :param key: jobs with the same key are executed in order
+        :param function: the function to be called by a worker
+        """
+        q = self._queues[hash(key) % len(self._queues)]
+        q.put((function, args))
+
+    def _work(self, q: Queue):
+        while True:
+            job = q.get()
+            if job is DispatchPool._stop:
+                return
+
+            function, args = job
+            try:
+                function(*args)
+            except Exception as e:
+                logging.warning("Dispatched handler failed!")
+                logging.warning(e.__str__())
+
+            if q in self._finishing and q.empty():
+                return
@@ -17,10 +17,34 @@ see <http://www.gnu.org/licenses/>.
 
 """
 
-from uuid import uuid4
+import itertools
+import threading
+
 import msgpack
 
 
+# provisional ids for requests, the connection assigns the final msgid
+_request_ids = itertools.count()
+
+# msgpack.Packer is not thread safe, every thread gets its own
+_local = threading.local()
+
+
+def _pack(obj) -> bytes:
+    """Packs obj using the Packer of the current thread"""
+    try:
+        packer = _local.packer
+    except AttributeError:
+        packer = _local.packer = msgpack.Packer(use_bin_type=True)
+
+    try:
+        return packer.pack(obj)
+    except Exception:
+        # don't leave a partially packed object in the buffer
+        packer.reset()
+        raise
+
+
 class Message:
     """Mother of all messages. May be a register, request, response
     or notification message. See here for specs:
@@ -29,6 +53,9 @@ class Message:
 
     _max_message_id = pow(2, 32) - 1
 
+    # Messages are created for every packet, slots keep them small
+    __slots__ = ('_type', '_msgid')
+
     def __init__(self):
         self._type = None
         self._msgid = None
@@ -55,65 +82,21 @@ class Message:
         pass
 
     @staticmethod
-    def from_unpacked(unpacked):
+    def from_unpacked(unpacked, raw: bool=True, trusted: bool=False):
         """Returns a Request, MResponse or MNotify depending on the type of
         the unpacked message
 
         :param unpacked: A message unpacked by :msgpack
+        :param raw: True if the message was unpacked with raw=True (strings
+                    are bytes and have to be decoded), False if the unpacker
+                    already decoded them
+        :param trusted: only check the message's form and skip the type
+                        checks of its fields. Use this only for peers that
+                        are known to send valid messages.
         :return: :MRequest , :MResponse or MNotify
         :raises :InvalidMessageError if message is not a valid request
         """
-
-        if not isinstance(unpacked, list) or not 2 < len(unpacked) < 5:
-            raise InvalidMessageError("Invalid form")
-
-        if not isinstance(unpacked[0], int) or unpacked[0] not in (0, 1, 2):
-            raise InvalidMessageError("Invalid type")
-
-        t = unpacked[0]
-
-        if t == 0:
-            if not isinstance(unpacked[1], int) or (
-                    unpacked[1] < 0 or unpacked[1] > Message._max_message_id):
-                raise InvalidMessageError("Invalid Message Id")
-
-            if not isinstance(unpacked[2], bytes):
-                raise InvalidMessageError("Invalid method")
-
-            if not isinstance(unpacked[3], list):
-                raise InvalidMessageError("Invalid body")
-
-            msg = MRequest()
-            msg._msgid = unpacked[1]
-            msg.function = unpacked[2].decode('ascii')
-            msg.arguments = unpacked[3]
-            return msg
-
-        elif t == 1:
-            if not isinstance(unpacked[1], int) or (
-                    unpacked[1] < 0 or unpacked[1] > Message._max_message_id):
-                raise InvalidMessageError("Invalid Message Id")
-
-            if unpacked[2] is None and unpacked[3] is None:
-                raise InvalidMessageError("error and result are both None")
-
-            if not isinstance(unpacked[2], (list, type(None))):
-                raise InvalidMessageError("Invalid Error")
-
-            if not isinstance(unpacked[3], (list, type(None))):
-                raise InvalidMessageError("Invalid Result")
-
-            msg = MResponse(unpacked[1])
-            msg.error = unpacked[2]
-            msg.response = unpacked[3]
-            return msg
-
-        elif t == 2:
-            if not isinstance(unpacked[1], bytes):
-                raise InvalidMessageError("Invalid method")
-            if not isinstance(unpacked[2], list):
-                raise InvalidMessageError("Notification body is invalid")
-            return MNotify(unpacked[1].decode('ascii'), unpacked[2])
+        return _parsers[raw, trusted](unpacked)
 
 
 class MRequest(Message):
@@ -121,13 +104,25 @@ class MRequest(Message):
     [<message id>, <message type>, <function name>, <Arguments>[]]
     """
 
+    __slots__ = ('function', 'arguments')
+
     def __init__(self):
         super().__init__()
         self.function = None
         self.arguments = None
-        self._msgid = uuid4().int % Message._max_message_id
+        self._msgid = next(_request_ids) & Message._max_message_id
         self._type = 0
 
+    @staticmethod
+    def _received(msgid: int, function: str, arguments: []):
+        """Creates a request from already validated fields"""
+        msg = MRequest.__new__(MRequest)
+        msg._type = 0
+        msg._msgid = msgid
+        msg.function = function
+        msg.arguments = arguments
+        return msg
+
     def __eq__(self, other) -> bool:
         return self._msgid == other.get_msgid() and \
             self.function == other.function and \
@@ -147,9 +142,8 @@ class MRequest(Message):
             raise InvalidMessageError("Unable to pack Request message:\n" +
                                       self.__str__())
         else:
-            return msgpack.packb(
-                [self._type, self._msgid, self.function, self.arguments],
-                use_bin_type=True)
+            return _pack(
+                [self._type, self._msgid, self.function, self.arguments])
 
 
 class MResponse(Message):
@@ -157,6 +151,8 @@ class MResponse(Message):
     [<message id>, <message type>, <error>, <response>]
     """
 
+    __slots__ = ('error', 'response')
+
     def __init__(self, msgid: int):
         """
         :param msgid: msgid of the request this message is responding to
@@ -169,6 +165,16 @@ class MResponse(Message):
         self.response = None
         self._type = 1
 
+    @staticmethod
+    def _received(msgid: int, error: [], response: []):
+        """Creates a response from already validated fields"""
+        msg = MResponse.__new__(MResponse)
+        msg._type = 1
+        msg._msgid = msgid
+        msg.error = error
+        msg.response = response
+        return msg
+
     def __eq__(self, other) -> bool:
         return self._msgid == other.get_msgid() \
             and self.error == other.error and self.response == other.response
@@ -187,9 +193,8 @@ class MResponse(Message):
             raise InvalidMessageError("Unable to pack Response message:\n" +
                                       self.__str__())
         else:
-            return msgpack.packb(
-                [self._type, self._msgid, self.error, self.response],
-                use_bin_type=True)
+            return _pack(
+                [self._type, self._msgid, self.error, self.response])
 
 
 class MNotify(Message):
@@ -197,12 +202,24 @@ class MNotify(Message):
     [<message type>, <Method> , <Message params>[]]
     """
 
+    __slots__ = ('function', 'arguments')
+
     def __init__(self, method, params):
         super().__init__()
         self.arguments = params
         self.function = method
         self._type = 2
 
+    @staticmethod
+    def _received(method: str, params: []):
+        """Creates a notification from already validated fields"""
+        msg = MNotify.__new__(MNotify)
+        msg._type = 2
+        msg._msgid = None
+        msg.function = method
+        msg.arguments = params
+        return msg
+
     def __eq__(self, other) -> bool:
         return (self._msgid == other.get_msgid() and
                 self.arguments == other.arguments and
@@ -224,9 +241,137 @@ class MNotify(Message):
             raise InvalidMessageError("Unable to pack Notification message:\n"
                                       + self.__str__())
         else:
-            return msgpack.packb(
-                [self._type, self.function, self.arguments],
-                use_bin_type=True)
+            return _pack([self._type, self.function, self.arguments])
+
+
+def _compile_parser(raw: bool, trusted: bool):
+    """Builds the function used by Message.from_unpacked for the given
+    options, so they don't have to be checked for every message
+    """
+    text_type = bytes if raw else str
+    max_id = Message._max_message_id
+
+    def request(unpacked):
+        if len(unpacked) != 4:
+            raise InvalidMessageError("Invalid form")
+        _, msgid, method, arguments = unpacked
+
+        if not isinstance(msgid, int) or msgid < 0 or msgid > max_id:
+            raise InvalidMessageError("Invalid Message Id")
+
+        if not isinstance(method, text_type):
+            raise InvalidMessageError("Invalid method")
+
+        if not isinstance(arguments, list):
+            raise InvalidMessageError("Invalid body")
+
+        return MRequest._received(
+            msgid, method.decode('utf-8') if raw else method, arguments)
+
+    def response(unpacked):
+        if len(unpacked) != 4:
+            raise InvalidMessageError("Invalid form")
+        _, msgid, error, result = unpacked
+
+        if not isinstance(msgid, int) or msgid < 0 or msgid > max_id:
+            raise InvalidMessageError("Invalid Message Id")
+
+        if error is None and result is None:
+            raise InvalidMessageError("error and result are both None")
+
+        if not isinstance(error, (list, type(None))):
+            raise InvalidMessageError("Invalid Error")
+
+        if not isinstance(result, (list, type(None))):
+            raise InvalidMessageError("Invalid Result")
+
+        return MResponse._received(msgid, error, result)
+
+    def notify(unpacked):
+        if len(unpacked) != 3:
+            raise InvalidMessageError("Invalid form")
+        _, method, params = unpacked
+
+        if not isinstance(method, text_type):
+            raise InvalidMessageError("Invalid method")
+
+        if not isinstance(params, list):
+            raise InvalidMessageError("Notification body is invalid")
+
+        return MNotify._received(
+            method.decode('utf-8') if raw else method, params)
+
+    def trusted_request(unpacked):
+        _, msgid, method, arguments = unpacked
+        return MRequest._received(
+            msgid, method.decode('utf-8') if raw else method, arguments)
+
+    def trusted_response(unpacked):
+        _, msgid, error, result = unpacked
+        return MResponse._received(msgid, error, result)
+
+    def trusted_notify(unpacked):
+        _, method, params = unpacked
+        return MNotify._received(
+            method.decode('utf-8') if raw else method, params)
+
+    if trusted:
+        handlers = {0: trusted_request, 1: trusted_response,
+                    2: trusted_notify}
+
+        def parse(unpacked):
+            try:
+                return handlers[unpacked[0]](unpacked)
+            except (KeyError, IndexError, TypeError, ValueError,
+                    AttributeError):
+                raise InvalidMessageError("Invalid message")
+    else:
+        handlers = {0: request, 1: response, 2: notify}
+
+        def parse(unpacked):
+            if not isinstance(unpacked, list) or not 2 < len(unpacked) < 5:
+                raise InvalidMessageError("Invalid form")
+
+            if not isinstance(unpacked[0], int) or unpacked[0] not in handlers:
+                raise InvalidMessageError("Invalid type")
+
+            return handlers[unpacked[0]](unpacked)
+
+    return parse
+
+
+class MessageIdAllocator:
+    """Hands out message ids for outgoing requests
+
+    Ids are taken from a counter which wraps around at
+    Message._max_message_id. Ids which are still in flight (i.e. we are
+    still waiting for a response) are skipped, so two pending requests
+    never share an id.
+
+    NOTE: This class is NOT thread safe, the caller has to hold a lock.
+    """
+
+    def __init__(self, start: int=0):
+        self._next = start
+
+    def allocate(self, in_flight) -> int:
+        """Returns the next free message id
+
+        :param in_flight: container of message ids that are still in use
+        :return: msgid
+        :raises :InvalidMessageError if every message id is in flight
+        """
+        for _ in range(len(in_flight) + 1):
+            msgid = self._next
+            if msgid >= Message._max_message_id:
+                self._next = 0
+            else:
+                self._next = msgid + 1
+
+            if msgid not in in_flight:
+                return msgid
+
+        raise InvalidMessageError("No free message id available")
 
 
 class InvalidMessageError(Exception):
@@ -235,3 +380,7 @@ class InvalidMessageError(Exception):
 
     def __str__(self) -> str:
         return self.name
+
+
+_parsers = {(raw, trusted): _compile_parser(raw, trusted)
+            for raw in (True, False) for trusted in (True, False)}
@@ -18,20 +18,48 @@ see <http://www.gnu.org/licenses/>.
 """
 
 import logging
+import threading
 
 import msgpack
 
 from splonebox.rpc.connection import Connection
-from splonebox.rpc.message import Message, InvalidMessageError, MResponse, MNotify
+from splonebox.rpc.dispatchpool import DispatchPool
+from splonebox.rpc.message import Message, InvalidMessageError, MResponse, \
+    MNotify, MessageIdAllocator
 
 
 class MsgpackRpc:
-    def __init__(self):
+    # dispatch key of the responses, see _dispatch_key
+    _response_lane = object()
+
+    def __init__(self, dispatch_workers: int=0, dispatch_queue_size: int=1024,
+                 raw: bool=True, trusted: bool=False):
+        """
+        :param dispatch_workers: number of threads handling incoming
+                                 messages. If 0, messages are handled on the
+                                 thread listening on the socket.
+        :param dispatch_queue_size: maximum number of messages waiting for
+                                    each dispatch worker
+        :param raw: if False, strings are decoded (UTF-8) by the unpacker,
+                    otherwise they are passed on as bytes
+        :param trusted: skip the type checks of incoming messages, see
+                        Message.from_unpacked
+        """
         self._connection = Connection()
+        self._dispatch_pool = None
+        if dispatch_workers > 0:
+            self._dispatch_pool = DispatchPool(dispatch_workers,
+                                               dispatch_queue_size)
 
         self._dispatcher = {}
+        self._with_responses = set()  # functions ordered with responses
         self._response_callbacks = {}
-        self._unpacker = msgpack.Unpacker()
+        self._callbacks_lock = threading.Lock()
+        self._msgids = MessageIdAllocator()
+        self._raw = raw
+        self._trusted = trusted
+        # invalid UTF-8 must not break the stream, it gets replaced
+        self._unpacker = msgpack.Unpacker(raw=raw, unicode_errors='replace')
 
     def connect(self, host: str, port: int):
         """Connect to given host
@@ -42,6 +70,8 @@ class MsgpackRpc:
         :raises: :socket.gaierror if Host unknown
         :raises: :ConnectionError if hostname or port are invalid types
         """
+        if self._dispatch_pool is not None:
+            self._dispatch_pool.start()
         self._connection.connect(host, port, self._message_callback)
 
     def send(self, msg: Message, response_callback=None):
@@ -57,18 +87,110 @@ class MsgpackRpc:
         if not isinstance(msg, Message):
             raise InvalidMessageError("Unable to send None!")
 
+        msgid = None
         if response_callback is not None:
-            if msg.get_msgid() is None:
-                raise InvalidMessageError(
-                    "Notify message does not support responses")
+            msgid = self.register_response_callback(msg, response_callback)
 
-            self._response_callbacks[msg.get_msgid()] = response_callback
+        try:
+            packed = msg.pack()
+        except InvalidMessageError:
+            if msgid is not None:
+                self.unregister_response_callbacks([msgid])
+            raise
 
         logging.info("sending: \n" + msg.__str__())
-        self._connection.send_message(msg.pack())
+        self._connection.send_message(packed)
 
         # if response callback is None we don't expect a response
 
+    def send_many(self, messages: [Message], response_callbacks=None):
+        """Sends the given messages to the server in one go
+
+        :param messages: list of messages to send
+        :param response_callbacks: list of functions (or None) that will be
+                                   called on the response to the message
+                                   with the same index
+        :raises :InvalidMessageError if msg.pack() is not possible
+        :raises :BrokenPipeError if connection is not established
+        :return: None
+        """
+        for msg in messages:
+            if not isinstance(msg, Message):
+                raise InvalidMessageError("Unable to send None!")
+
+        if len(messages) == 0:
+            return
+
+        registered = []
+        if response_callbacks is not None:
+            if len(response_callbacks) != len(messages):
+                raise InvalidMessageError(
+                    "Number of callbacks does not match number of messages")
+
+            registered = [(m, c) for m, c in zip(messages, response_callbacks)
+                          if c is not None]
+            self.register_response_callbacks([m for m, _ in registered],
+                                             [c for _, c in registered])
+
+        try:
+            packed = [msg.pack() for msg in messages]
+        except InvalidMessageError:
+            self.unregister_response_callbacks(
+                [msg.get_msgid() for msg, _ in registered])
+            raise
+
+        logging.info("sending " + str(len(messages)) + " messages")
+        self._connection.send_messages(packed)
+
+    def register_response_callback(self, msg: Message, response_callback):
+        """Assigns a free message id to the given request and registers a
+        callback for its response. Use this (and send the message without
+        callback afterwards) if the msgid has to be known before the
+        message is sent.
+
+        :param msg: request message
+        :param response_callback: a function that will be called on response
+        :raises :InvalidMessageError if msg is not a request
+        :return: msgid of the request
+        """
+        return self.register_response_callbacks([msg],
+                                                [response_callback])[0]
+
+    def register_response_callbacks(self, messages: [Message],
+                                    response_callbacks: []):
+        """Same as register_response_callback, but registers all callbacks
+        at once
+
+        :param messages: list of request messages
+        :param response_callbacks: list of callbacks, one per message
+        :raises :InvalidMessageError if a message is not a request
+        :return: list of msgids
+        """
+        for msg in messages:
+            if msg.get_type() != 0:
+                raise InvalidMessageError(
+                    "Only request messages support responses")
+
+        msgids = []
+        with self._callbacks_lock:
+            for msg, response_callback in zip(messages, response_callbacks):
+                msgid = self._msgids.allocate(self._response_callbacks)
+                msg._msgid = msgid
+                self._response_callbacks[msgid] = response_callback
+                msgids.append(msgid)
+
+        return msgids
+
+    def unregister_response_callbacks(self, msgids: [int]):
+        """Drops the callbacks of requests which will not be answered (e.g.
+        because sending them failed)
+
+        :param msgids: list of msgids
+        """
+        with self._callbacks_lock:
+            for msgid in msgids:
+                self._response_callbacks.pop(msgid, None)
+
     def _message_callback(self, data: bytes):
         """Handles incoming Messages, is called by :Connection
 
@@ -79,11 +201,12 @@ class MsgpackRpc:
         messages = []
         for unpacked in self._unpacker:
             try:
-                messages.append(Message.from_unpacked(unpacked))
+                messages.append(Message.from_unpacked(unpacked, self._raw,
+                                                      self._trusted))
             except InvalidMessageError as e:
                 m = MResponse(0)
                 m.error = [400, "Invalid Message Format" + e.__str__()]
-                self.send(m)
+                self._reply(m)
 
         if len(messages) == 0:
             logging.info("Received incomplete message from Server: \n" +
@@ -91,51 +214,100 @@ class MsgpackRpc:
             return
 
         for msg in messages:
-            try:
-                logging.info('Received this message: \n' + msg.__str__())
-                if msg.get_type() == 0:
-                    # type == 0  => Message is request
-                    error, response = self._dispatcher[msg.function](msg)
-                    rsp = MResponse(msg.get_msgid())
-                    rsp.error = error
-                    rsp.response = response
-                    self.send(rsp)
-                elif msg.get_type() == 1:
-                    self._handle_response(msg)
-                elif msg.get_type() == 2:
-                    self._handle_notify(msg)
+            if self._dispatch_pool is None:
+                self._handle_message(msg)
+            else:
+                self._dispatch_pool.submit(self._dispatch_key(msg),
+                                           self._handle_message, msg)
+
+    def _dispatch_key(self, msg: Message):
+        """Messages with the same key are handled in order. Responses and
+        requests of functions registered with_responses share one lane,
+        other requests are ordered per msgid, notifications per event name
+        (the function of the notification, like the broadcast handler
+        routes them).
+        """
+        if msg.get_type() == 2:
+            return msg.function
 
-            except InvalidMessageError as e:
-                logging.info(e.name)
-                logging.info("\n Unable to handle Message\n")
-                if msg.get_type() != 0:
-                    return
-
-                m = MResponse(msg.get_msgid())
-                m.error = [400, "Could not handle request! " + e.name]
-                self.send(m)
-
-            except Exception as e:
-                logging.warning("Unexpected exception occurred!")
-                logging.warning(e.__str__())
-                if msg.get_type() != 0:
-                    return
-                m = MResponse(msg.get_msgid())
-                m.error = [418, "Unexpected exception occurred!"]
-                self.send(m)
-
-    def register_function(self, foo, name: str):
+        if msg.get_type() == 1 or msg.function in self._with_responses:
+            return MsgpackRpc._response_lane
+
+        return msg.get_msgid()
+
+    def _handle_message(self, msg: Message):
+        """Calls the handler for a single incoming message
+
+        :param msg: message received by _message_callback
+        """
+        try:
+            logging.info('Received this message: \n' + msg.__str__())
+            if msg.get_type() == 0:
+                # type == 0  => Message is request
+                error, response = self._dispatcher[msg.function](msg)
+                rsp = MResponse(msg.get_msgid())
+                rsp.error = error
+                rsp.response = response
+                self._reply(rsp)
+            elif msg.get_type() == 1:
+                self._handle_response(msg)
+            elif msg.get_type() == 2:
+                self._handle_notify(msg)
+
+        except InvalidMessageError as e:
+            logging.info(e.name)
+            logging.info("\n Unable to handle Message\n")
+            if msg.get_type() != 0:
+                return
+
+            m = MResponse(msg.get_msgid())
+            m.error = [400, "Could not handle request! " + e.name]
+            self._reply(m)
+
+        except Exception as e:
+            logging.warning("Unexpected exception occurred!")
+            logging.warning(e.__str__())
+            if msg.get_type() != 0:
+                return
+            m = MResponse(msg.get_msgid())
+            m.error = [418, "Unexpected exception occurred!"]
+            self._reply(m)
+
+    def _reply(self, rsp: MResponse):
+        """Sends a response to an incoming message. It is dropped if the
+        connection is closing, the listener has to keep running until the
+        server closed its side.
+        """
+        try:
+            self.send(rsp)
+        except BrokenPipeError:
+            logging.info("Connection is closing, response dropped")
+
+    def register_function(self, foo, name: str, with_responses: bool=False):
         """Register a function at msgpack rpc dispatcher
 
         :param name: Name of the function
         :param foo: A function reference
+        :param with_responses: handle requests to this function in order
+                               with the responses, e.g. if they refer to
+                               something a response brought
         :raises DispatcherError
         """
         self._dispatcher[name] = foo
+        if with_responses:
+            self._with_responses.add(name)
+        else:
+            self._with_responses.discard(name)
+
+    def disconnect(self, flush_timeout: float=None):
+        """Disconnect from server
 
-    def disconnect(self):
-        """Disconnect from server"""
-        self._connection.disconnect()
+        :param flush_timeout: if set, wait up to flush_timeout seconds until
+                              the server received all sent messages
+        """
+        self._connection.disconnect(flush_timeout)
+        if self._dispatch_pool is not None:
+            self._dispatch_pool.stop()
 
     def listen(self):
         """Blocks until connection is closed"""
@@ -148,7 +320,9 @@ class MsgpackRpc:
         :return:
         """
         try:
-            self._response_callbacks.pop(msg.get_msgid())(msg)
+            with self._callbacks_lock:
+                callback = self._response_callbacks.pop(msg.get_msgid())
+            callback(msg)
         except Exception:
             if msg.error is not None:
                 logging.warning("Received error unrelated to any message!\n" +
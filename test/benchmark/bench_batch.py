@@ -0,0 +1,78 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+Throughput of run calls of a function with a fixed cost per invocation
+(1 ms, like a round trip to a database or a model inference) and a small
+cost per item, executed call by call on the run pool and in batches of
+increasing size.
+
+Run with: python -m test.benchmark.bench_batch
+"""
+
+import ctypes
+import time
+
+from splonebox.api.core import Core
+from splonebox.api.plugin import Plugin
+from splonebox.api.remotefunction import RemoteFunction
+from splonebox.rpc.message import MRequest
+
+CALLS = 5000
+BATCH_SIZES = [8, 64, 256]
+
+
+def lookup(key: ctypes.c_int64):
+    time.sleep(0.001 + 0.00001)
+    return key
+
+
+def lookup_many(key: ctypes.c_int64):
+    time.sleep(0.001 + 0.00001 * len(key))
+    return key
+
+
+def make_plugin(function, batch_size: int=None) -> Plugin:
+    RemoteFunction.remote_functions = []
+    RemoteFunction(function, batch_size=batch_size, batch_wait=0.002)
+    core = Core()
+    core.send_result = lambda call: None
+    return Plugin("bench", "", "", "", core, queue_size=CALLS)
+
+
+def run(plug: Plugin, name: bytes) -> float:
+    msg = MRequest()
+    msg.function = "run"
+    start = time.perf_counter()
+    for i in range(CALLS):
+        msg.arguments = [[None, i], name, [i]]
+        plug._handle_run(msg)
+    plug.wait_for_calls()
+    return time.perf_counter() - start
+
+
+def main():
+    duration = run(make_plugin(lookup), b"lookup")
+    print("{:<12} {:>8.0f} calls/s".format("pool(16)", CALLS / duration))
+
+    for size in BATCH_SIZES:
+        duration = run(make_plugin(lookup_many, size), b"lookup_many")
+        print("{:<12} {:>8.0f} calls/s".format("batch({})".format(size),
+                                               CALLS / duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+Bandwidth against CPU time of payload compression: wire size, ratio and
+compress/decompress throughput of a log-like payload for several zlib
+levels.
+
+Run with: python -m test.benchmark.bench_compression
+"""
+
+import random
+import timeit
+
+from splonebox.api.apicall import ApiRun
+from splonebox.api.compression import Compression, decompress_args
+
+SIZE = 4 * 1024 * 1024
+REPEAT = 3
+LEVELS = [1, 3, 6, 9]
+
+
+def make_payload() -> bytes:
+    rnd = random.Random(0)
+    levels = ["DEBUG", "INFO", "WARNING", "ERROR"]
+    lines = []
+    size = 0
+    while size < SIZE:
+        line = "2017-03-{:02d} 12:{:02d}:{:02d} {} worker-{} request {} took " \
+               "{} ms\n".format(rnd.randint(1, 31), rnd.randint(0, 59),
+                                rnd.randint(0, 59), rnd.choice(levels),
+                                rnd.randint(0, 16), rnd.getrandbits(32),
+                                rnd.randint(0, 5000))
+        lines.append(line)
+        size += len(line)
+    return "".join(lines).encode()[:SIZE]
+
+
+def main():
+    payload = make_payload()
+    mb = len(payload) / 1024 / 1024
+
+    plain = len(ApiRun("id", "fun", [payload]).msg.pack())
+    print("{:<6} {:>10} bytes".format("none", plain))
+
+    for level in LEVELS:
+        compression = Compression(level=level)
+        call = ApiRun("id", "fun", [payload], compression)
+        size = len(call.msg.pack())
+        args = call.get_method_args()
+
+        t_comp = min(timeit.repeat(lambda: compression.compress(payload),
+                                   number=1, repeat=REPEAT))
+        t_decomp = min(timeit.repeat(lambda: decompress_args(args),
+                                     number=1, repeat=REPEAT))
+        print("level={} {:>8} bytes  ratio {:5.1f}  compress {:6.1f} MB/s  "
+              "decompress {:6.1f} MB/s".format(level, size, plain / size,
+                                               mb / t_comp, mb / t_decomp))
+
+
+if __name__ == "__main__":
+    main()
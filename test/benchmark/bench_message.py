@@ -0,0 +1,79 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+
+Microbenchmarks for packing messages.
+
+Run with: python -m test.benchmark.bench_message
+"""
+
+import timeit
+
+import msgpack
+
+from splonebox.rpc.message import MRequest, MResponse, MNotify, _pack
+
+ROUNDS = 100000
+REPEAT = 5
+
+
+def request_body(msg: MRequest) -> []:
+    return [msg._type, msg._msgid, msg.function, msg.arguments]
+
+
+def response_body(msg: MResponse) -> []:
+    return [msg._type, msg._msgid, msg.error, msg.response]
+
+
+def notify_body(msg: MNotify) -> []:
+    return [msg._type, msg.function, msg.arguments]
+
+
+def measure(function) -> float:
+    """Returns messages per second"""
+    return ROUNDS / min(timeit.repeat(function, number=ROUNDS, repeat=REPEAT))
+
+
+def main():
+    request = MRequest()
+    request.function = "run"
+    request.arguments = [["plugin_id", None], "function", [1, 2.0, "three"]]
+
+    response = MResponse(1234)
+    response.response = [42]
+
+    notify = MNotify("broadcast", ["event", [1, 2, 3]])
+
+    print("{:<10} {:>14} {:>14} {:>14}".format(
+        "", "packb()", "shared Packer", "msg.pack()"))
+
+    for name, msg, body in [("request", request, request_body),
+                            ("response", response, response_body),
+                            ("notify", notify, notify_body)]:
+        assert msg.pack() == msgpack.packb(body(msg), use_bin_type=True)
+
+        packb = measure(
+            lambda: msgpack.packb(body(msg), use_bin_type=True))
+        shared = measure(lambda: _pack(body(msg)))
+        full = measure(msg.pack)
+
+        print("{:<10} {:>10.0f}/s {:>10.0f}/s {:>10.0f}/s".format(
+            name, packb, shared, full))
+
+
+if __name__ == "__main__":
+    main()
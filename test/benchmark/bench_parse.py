@@ -0,0 +1,79 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+
+Per message parse cost of Message.from_unpacked and
+ApiRun/ApiResult.from_msgpack_request in strict and trusted mode.
+
+Run with: python -m test.benchmark.bench_parse
+"""
+
+import timeit
+
+import msgpack
+
+from splonebox.api.apicall import ApiRun, ApiResult
+from splonebox.rpc.message import Message, MResponse, MNotify
+
+ROUNDS = 50000
+REPEAT = 5
+
+
+def measure(function) -> float:
+    """Returns microseconds per call"""
+    t = min(timeit.repeat(function, number=ROUNDS, repeat=REPEAT))
+    return t / ROUNDS * 1e6
+
+
+def main():
+    run = ApiRun("id", "fun", [b'x' * 64, "string", 42, 1.5])
+    run.msg.arguments[0] = [None, 123]
+    run = msgpack.unpackb(run.msg.pack(), raw=True)
+
+    result = msgpack.unpackb(ApiResult(123, [b"x" * 64, 42]).msg.pack(),
+                             raw=True)
+
+    response = MResponse(1234)
+    response.response = [42]
+    response = msgpack.unpackb(response.pack(), raw=True)
+
+    notify = msgpack.unpackb(MNotify("broadcast", ["event", [1]]).pack(),
+                             raw=True)
+
+    print("{:<20} {:>10} {:>10}".format("", "strict", "trusted"))
+    for name, unpacked in [("response", response), ("notify", notify)]:
+        print("{:<20} {:>8.2f}us {:>8.2f}us".format(
+            name,
+            measure(lambda: Message.from_unpacked(unpacked)),
+            measure(lambda: Message.from_unpacked(unpacked, trusted=True))))
+
+    for name, unpacked, call in [("run request", run, ApiRun),
+                                 ("result request", result, ApiResult)]:
+        def strict():
+            msg = Message.from_unpacked(unpacked)
+            call.from_msgpack_request(msg)
+
+        def trusted():
+            msg = Message.from_unpacked(unpacked, trusted=True)
+            call.from_msgpack_request(msg, trusted=True)
+
+        print("{:<20} {:>8.2f}us {:>8.2f}us".format(
+            name, measure(strict), measure(trusted)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+Throughput of a CPU bound remote function executed by the plugin's
+worker threads and by a process pool.
+
+Run with: python -m test.benchmark.bench_process_pool
+"""
+
+import ctypes
+import multiprocessing
+import time
+
+from splonebox.api.core import Core
+from splonebox.api.plugin import Plugin
+from splonebox.api.remotefunction import RemoteFunction
+from splonebox.rpc.message import MRequest
+
+CALLS = 64
+
+
+def burn(n: ctypes.c_int64):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+def run(function: RemoteFunction) -> float:
+    core = Core()
+    core.send_result = lambda call: None
+    plug = Plugin("bench", "", "", "", core)
+    plug.functions["burn"] = function
+
+    start = time.perf_counter()
+    for i in range(CALLS):
+        msg = MRequest()
+        msg.function = "run"
+        msg.arguments = [[None, i], b"burn", [200000]]
+        plug._handle_run(msg)
+    plug.wait_for_calls()
+    return time.perf_counter() - start
+
+
+def main():
+    print("{} cpus".format(multiprocessing.cpu_count()))
+
+    threads = RemoteFunction(burn)
+    print("threads   {:>6.1f} calls/s".format(CALLS / run(threads)))
+
+    processes = RemoteFunction(burn, process_pool=True)
+    processes([1])  # start the pool
+    print("processes {:>6.1f} calls/s".format(CALLS / run(processes)))
+    processes.close_pool()
+
+
+if __name__ == "__main__":
+    main()
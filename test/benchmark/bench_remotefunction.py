@@ -0,0 +1,66 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+Argument conversion overhead of RemoteFunction calls for functions with
+few and many parameters.
+
+Run with: python -m test.benchmark.bench_remotefunction
+"""
+
+import ctypes
+import timeit
+
+from splonebox.api.remotefunction import RemoteFunction
+
+CALLS = 100000
+REPEAT = 5
+
+
+def noop(*args):
+    pass
+
+
+def main():
+    def small(a: ctypes.c_int64, b: ctypes.c_char_p):
+        pass
+
+    def large(a: ctypes.c_int64, b: ctypes.c_int64, c: ctypes.c_double,
+              d: ctypes.c_double, e: ctypes.c_bool, f: ctypes.c_byte,
+              g: ctypes.c_byte, h: ctypes.c_uint64, i: ctypes.c_char_p,
+              j: ctypes.c_char_p, k: ctypes.c_int64, l: ctypes.c_double):
+        pass
+
+    cases = [("2 args", small, [1, b"foo"]),
+             ("12 args", large, [1, 2, 1.0, 2.0, True, b"a", b"b", 3, b"x",
+                                 b"y", 4, 5.0]),
+             ("12 args, decoded", large, [1, 2, 1.0, 2.0, True, b"a", b"b",
+                                          3, "x", "y", 4, 5.0])]
+
+    for name, fun, args in cases:
+        function = RemoteFunction(fun)
+        RemoteFunction.remote_functions.remove(function)
+        function.fun = noop
+
+        # fresh lists, older versions modified the arguments in place
+        calls = [list(args) for _ in range(CALLS)]
+        t = min(timeit.repeat(lambda: [function(c) for c in calls],
+                              number=1, repeat=REPEAT))
+        print("{:<18} {:>8.0f} ns/call".format(name, t / CALLS * 1e9))
+
+
+if __name__ == "__main__":
+    main()
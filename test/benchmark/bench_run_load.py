@@ -0,0 +1,110 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+Load test of run call execution: bursts of increasing size are handed to
+Plugin._handle_run, the called function blocks for 1 ms (like a function
+doing I/O). Reports throughput, peak memory and the number of threads
+used by the bounded run pool and, for comparison, by a thread per call
+(threads still alive after the burst was submitted).
+
+Run with: python -m test.benchmark.bench_run_load
+"""
+
+import ctypes
+import threading
+import time
+import tracemalloc
+
+from splonebox.api.core import Core
+from splonebox.api.plugin import Plugin
+from splonebox.api.remotefunction import RemoteFunction
+from splonebox.rpc.message import MRequest
+
+BURSTS = [1000, 5000, 10000, 20000]
+
+
+def io_bound(x: ctypes.c_int64):
+    time.sleep(0.001)
+
+
+def make_plugin(max_workers: int) -> Plugin:
+    RemoteFunction.remote_functions = []
+    RemoteFunction(io_bound)
+    core = Core()
+    core.send_result = lambda call: None
+    return Plugin("bench", "", "", "", core, max_workers=max_workers,
+                  queue_size=max(BURSTS))
+
+
+def make_requests(n: int) -> [MRequest]:
+    requests = []
+    for i in range(n):
+        msg = MRequest()
+        msg.function = "run"
+        msg.arguments = [[None, i], b"io_bound", [i]]
+        requests.append(msg)
+    return requests
+
+
+def thread_per_call(plug: Plugin, msg: MRequest):
+    """Execution as it was done before the run pool"""
+    t = threading.Thread(target=plug.functions["io_bound"],
+                         args=(msg.arguments[2], ))
+    t.start()
+    return t
+
+
+def run_pool(requests: [MRequest], workers: int):
+    plug = make_plugin(workers)
+    start = time.perf_counter()
+    for msg in requests:
+        plug._handle_run(msg)
+    plug.wait_for_calls()
+    return time.perf_counter() - start, len(plug._pool._threads)
+
+
+def run_threads(requests: [MRequest]):
+    plug = make_plugin(1)
+    before = threading.active_count()
+    start = time.perf_counter()
+    threads = [thread_per_call(plug, msg) for msg in requests]
+    peak = threading.active_count() - before
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, peak
+
+
+def measure(name: str, n: int, fun):
+    tracemalloc.start()
+    duration, threads = fun()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("{:<16} {:>6} calls {:>8.0f} calls/s {:>8.1f} MiB {:>6} threads"
+          .format(name, n, n / duration, peak / 1024 / 1024, threads))
+
+
+def main():
+    for n in BURSTS:
+        requests = make_requests(n)
+        measure("thread per call", n, lambda: run_threads(requests))
+        for workers in [16, 64]:
+            measure("pool({})".format(workers), n,
+                    lambda: run_pool(requests, workers))
+
+
+if __name__ == "__main__":
+    main()
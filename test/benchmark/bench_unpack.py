@@ -0,0 +1,84 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+
+Inbound message rate: unpacking, parsing and argument conversion of run
+requests, with strings decoded per field (raw=True) or by the unpacker
+(raw=False). Also reports the memory held by received notifications.
+
+Run with: python -m test.benchmark.bench_unpack
+"""
+
+import ctypes
+import timeit
+import tracemalloc
+
+import msgpack
+
+from splonebox.api.apicall import ApiRun
+from splonebox.api.remotefunction import RemoteFunction
+from splonebox.rpc.message import Message, MNotify
+from splonebox.rpc.msgpackrpc import MsgpackRpc
+
+MESSAGES = 20000
+REPEAT = 5
+
+
+def make_rpc(raw: bool) -> MsgpackRpc:
+    def fun(a: ctypes.c_char_p, b: ctypes.c_char_p, c: ctypes.c_int64):
+        pass
+
+    function = RemoteFunction(fun)
+    RemoteFunction.remote_functions.remove(function)
+
+    rpc = MsgpackRpc(raw=raw)
+
+    def handle_run(msg):
+        call = ApiRun.from_msgpack_request(msg, raw)
+        function(call.get_method_args())
+        return None, [123]
+
+    rpc.register_function(handle_run, "run")
+    rpc.send = lambda msg, response_callback=None: None
+    return rpc
+
+
+def main():
+    call = ApiRun("id", "fun", ["some string argument", "äöü", 42])
+    call.msg.arguments[0][0] = None
+    call.msg.arguments[0][1] = 123
+    data = call.msg.pack() * MESSAGES
+
+    for raw in [True, False]:
+        rpc = make_rpc(raw)
+        t = min(timeit.repeat(lambda: rpc._message_callback(data), number=1,
+                              repeat=REPEAT))
+        print("raw={!s:<6} {:>10.0f} msg/s".format(raw, MESSAGES / t))
+
+    unpacked = msgpack.unpackb(MNotify("broadcast", ["event", [1]]).pack(),
+                               raw=True)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    received = [Message.from_unpacked(unpacked) for _ in range(MESSAGES)]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print("{:.0f} bytes per received notification (without payload)"
+          .format(size / len(received)))
+
+
+if __name__ == "__main__":
+    main()
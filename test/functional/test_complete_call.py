@@ -18,15 +18,23 @@ see <http://www.gnu.org/licenses/>.
 """
 
 import ctypes
+import io
+import time
 import unittest
 import msgpack
 from splonebox.api.plugin import Plugin
 from splonebox.api.remoteplugin import RemotePlugin
 from splonebox.api.core import Core
+from splonebox.api.compression import Compression
+from splonebox.api.apicall import ApiRun
 from splonebox.api.remotefunction import RemoteFunction
+from splonebox.api.cancellation import CancellationToken
+from splonebox.api.response import RemoteError
 from splonebox.rpc.message import MRequest, MResponse
 
+import threading
 from threading import Lock
+from unittest.mock import Mock
 from test import mocks
 
 
@@ -58,7 +66,7 @@ class CompleteCall(unittest.TestCase):
 
         # receive request
         msg = MRequest.from_unpacked(msgpack.unpackb(mock_send.call_args[0][
-            0]))
+            0], raw=True))
         msg.arguments[0][0] = None  # remove plugin id
         msg.arguments[0][1] = 123  # set call id
         core._rpc._message_callback(msg.pack())
@@ -70,7 +78,7 @@ class CompleteCall(unittest.TestCase):
         # start execution
         called_lock.release()
         # wait for execution to finish
-        plug._active_threads[123].join()
+        plug.wait_for_calls()
         # receive result
         data = mock_send.call_args_list[2][0][0]
         core._rpc._message_callback(data)
@@ -80,6 +88,248 @@ class CompleteCall(unittest.TestCase):
         self.assertEqual(result._error, None)
         self.assertEqual(result.get_id(), 123)
 
+    def test_complete_run_many(self):
+        core = Core()
+        core._rpc._connection.send_messages = Mock()
+        send_many = core._rpc._connection.send_messages
+        mock_send = mocks.rpc_connection_send(core._rpc)
+
+        calls = [ApiRun("plugin_id", "add", [i, i]) for i in range(5)]
+        results = core.send_run_many(calls)
+        self.assertEqual(send_many.call_count, 1)
+
+        # answer the requests in reverse order
+        for i, data in reversed(list(enumerate(send_many.call_args[0][0]))):
+            request = msgpack.unpackb(data, raw=True)
+            self.assertEqual(request[3][2], [i, i])
+            response = MResponse(request[1])
+            response.response = [100 + i]
+            core._rpc._message_callback(response.pack())
+
+            result = MRequest()
+            result.function = "result"
+            result.arguments = [[100 + i], [2 * i]]
+            core._rpc._message_callback(result.pack())
+
+        # 5 responses to the result calls
+        self.assertEqual(mock_send.call_count, 5)
+
+        for i, result in enumerate(results):
+            self.assertEqual(result.get_id(), 100 + i)
+            self.assertEqual(result.get_result(blocking=False), 2 * i)
+
+    def test_complete_run_stream(self):
+        # A plugin returning a file-like object is calling itself, the
+        # result is received as a stream
+        def read_data():
+            "returns a file"
+            return io.BytesIO(b"0123456789")
+
+        RemoteFunction(read_data)
+
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core, stream_chunk_size=4)
+        rplug = RemotePlugin("plugin_id", "foo", "bar", "bob", "alice", core)
+
+        mock_send = mocks.rpc_connection_send(core._rpc)
+        result = rplug.run("read_data", [])
+
+        # receive request
+        msg = MRequest.from_unpacked(msgpack.unpackb(mock_send.call_args[0][
+            0], raw=True))
+        msg.arguments[0][0] = None  # remove plugin id
+        msg.arguments[0][1] = 123  # set call id
+        core._rpc._message_callback(msg.pack())
+        plug.wait_for_calls()
+
+        # response to the run call and three chunks (in any order)
+        sent = [c[0][0] for c in mock_send.call_args_list[1:]]
+        self.assertEqual(len(sent), 4)
+        responses = [d for d in sent if msgpack.unpackb(d, raw=True)[0] == 1]
+        chunks = [d for d in sent if msgpack.unpackb(d, raw=True)[0] == 0]
+        self.assertEqual(len(chunks), 3)
+        core._rpc._message_callback(responses[0])
+
+        # deliver chunks out of order
+        for data in (chunks[2], chunks[0], chunks[1]):
+            core._rpc._message_callback(data)
+
+        stream = result.get_result(blocking=False)
+        self.assertEqual(stream.read(), b"0123456789")
+
+    def test_complete_run_generator(self):
+        # A plugin calling a generator function of itself receives the
+        # items while the generator is still running
+        next_item = Lock()
+        next_item.acquire()
+
+        def scan(n: ctypes.c_int64):
+            "yields n items"
+            for i in range(n):
+                yield {"port": i}
+                next_item.acquire()
+
+        RemoteFunction(scan)
+
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core)
+        rplug = RemotePlugin("plugin_id", "foo", "bar", "bob", "alice", core)
+
+        mock_send = mocks.rpc_connection_send(core._rpc)
+        result = rplug.run("scan", [3])
+
+        # receive request
+        request = msgpack.unpackb(mock_send.call_args[0][0], raw=True)
+        msg = MRequest.from_unpacked(request)
+        msg.arguments[0][0] = None  # remove plugin id
+        msg.arguments[0][1] = 123  # set call id
+        core._rpc._message_callback(msg.pack())
+
+        delivered = set()
+
+        def deliver():
+            # the response to the run call and the result calls are
+            # delivered, responses to the result calls are dropped
+            for i, c in enumerate(mock_send.call_args_list):
+                data = msgpack.unpackb(c[0][0], raw=True)
+                if i in delivered or not (
+                        data[0] == 1 and data[1] == request[1] or
+                        data[0] == 0 and data[2] == b"result"):
+                    continue
+                delivered.add(i)
+                core._rpc._message_callback(c[0][0])
+
+        items = result.items()
+        for i in range(3):
+            while len(delivered) < i + 2:
+                deliver()
+            self.assertEqual(next(items), {b"port": i})
+            next_item.release()
+
+        plug.wait_for_calls()
+        deliver()
+        self.assertEqual(list(items), [])
+
+    def test_complete_run_cancel(self):
+        # A plugin calling itself cancels the call, the function stops and
+        # no result is sent
+        started = threading.Event()
+        stopped = threading.Event()
+
+        def wait(*, cancel: CancellationToken):
+            "waits until it is cancelled"
+            started.set()
+            cancel.wait(10)
+            stopped.set()
+            return "too late"
+
+        RemoteFunction(wait)
+
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core)
+        rplug = RemotePlugin("plugin_id", "foo", "bar", "bob", "alice", core)
+
+        mock_send = mocks.rpc_connection_send(core._rpc)
+        result = rplug.run("wait", [])
+
+        # receive request
+        msg = MRequest.from_unpacked(msgpack.unpackb(mock_send.call_args[0][
+            0], raw=True))
+        msg.arguments[0][0] = None  # remove plugin id
+        msg.arguments[0][1] = 123  # set call id
+        core._rpc._message_callback(msg.pack())
+        self.assertTrue(started.wait(5))
+
+        # receive response
+        core._rpc._message_callback(mock_send.call_args[0][0])
+        self.assertEqual(result.get_id(), 123)
+
+        self.assertTrue(result.cancel())
+        cancel = MRequest.from_unpacked(msgpack.unpackb(
+            mock_send.call_args[0][0], raw=True))
+        self.assertEqual(cancel.function, "cancel")
+        self.assertEqual(cancel.arguments, [[b"plugin_id", 123]])
+
+        # receive cancel request
+        cancel.arguments[0][0] = None  # remove plugin id
+        core._rpc._message_callback(cancel.pack())
+        self.assertTrue(plug.wait_for_calls(5))
+        self.assertTrue(stopped.is_set())
+
+        # the last message is the response to the cancel request
+        response = MResponse.from_unpacked(msgpack.unpackb(
+            mock_send.call_args[0][0], raw=True))
+        self.assertEqual(response.get_msgid(), cancel.get_msgid())
+        self.assertIsNone(response.error)
+        with self.assertRaises(RemoteError):
+            result.get_result()
+
+    def test_complete_run_deadline(self):
+        # The remaining time of the caller is passed on to the function
+        remaining = []
+
+        def fun(*, cancel: CancellationToken):
+            "returns the remaining time"
+            remaining.append(cancel.remaining())
+            return 1
+
+        RemoteFunction(fun)
+
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core)
+        rplug = RemotePlugin("plugin_id", "foo", "bar", "bob", "alice", core)
+
+        mock_send = mocks.rpc_connection_send(core._rpc)
+        result = rplug.run("fun", [], timeout=30)
+        self.assertLessEqual(result.deadline, time.monotonic() + 30)
+
+        # receive request
+        msg = MRequest.from_unpacked(msgpack.unpackb(mock_send.call_args[0][
+            0], raw=True))
+        self.assertEqual(msg.arguments[3], 30)
+        msg.arguments[0][0] = None  # remove plugin id
+        msg.arguments[0][1] = 123  # set call id
+        core._rpc._message_callback(msg.pack())
+        self.assertTrue(plug.wait_for_calls(5))
+        self.assertTrue(0 < remaining[0] <= 30)
+
+        # no response and result, waiting ends at the deadline
+        result.deadline = time.monotonic() + 0.01
+        with self.assertRaises(TimeoutError):
+            result.get_result()
+
+    def test_complete_run_compressed(self):
+        def echo(data: ctypes.c_byte):
+            "returns its argument"
+            return data
+
+        RemoteFunction(echo)
+        blob = b"log line\n" * 10000
+
+        core = Core(compression=Compression(threshold=1024))
+        plug = Plugin("foo", "bar", "bob", "alice", core)
+        rplug = RemotePlugin("plugin_id", "foo", "bar", "bob", "alice", core)
+
+        mock_send = mocks.rpc_connection_send(core._rpc)
+        result = rplug.run("echo", [blob])
+        self.assertLess(len(mock_send.call_args[0][0]), len(blob) / 10)
+
+        # receive request
+        msg = MRequest.from_unpacked(msgpack.unpackb(mock_send.call_args[0][
+            0], raw=True))
+        msg.arguments[0][0] = None  # remove plugin id
+        msg.arguments[0][1] = 123  # set call id
+        core._rpc._message_callback(msg.pack())
+        plug.wait_for_calls()
+
+        sent = [c[0][0] for c in mock_send.call_args_list[1:]]
+        self.assertTrue(all(len(d) < len(blob) / 10 for d in sent))
+        for data in sorted(sent, key=lambda d: msgpack.unpackb(d, raw=True)[0],
+                           reverse=True):
+            core._rpc._message_callback(data)
+
+        self.assertEqual(result.get_result(blocking=False), blob)
+
     def test_complete_register(self):
         def fun():
             pass
@@ -90,7 +340,8 @@ class CompleteCall(unittest.TestCase):
         mock_send = mocks.rpc_connection_send(core._rpc)
 
         result = plug.register(blocking=False)
-        outgoing = msgpack.unpackb(mock_send.call_args_list[0][0][0])
+        outgoing = msgpack.unpackb(mock_send.call_args_list[0][0][0],
+                                   raw=True)
 
         # validate outgoing
         self.assertEqual(0, outgoing[0])
@@ -113,7 +364,8 @@ class CompleteCall(unittest.TestCase):
 
         # test valid response
         result = plug.register(blocking=False)
-        outgoing = msgpack.unpackb(mock_send.call_args_list[1][0][0])
+        outgoing = msgpack.unpackb(mock_send.call_args_list[1][0][0],
+                                   raw=True)
         response = MResponse(outgoing[1])
         response.response = []
         core._rpc._handle_response(response)
@@ -54,7 +54,7 @@ class LocalCall(unittest.TestCase):
         core._rpc._message_callback(call.msg.pack())
 
         # wait for execution to finish
-        plug._active_threads[123].join()
+        plug.wait_for_calls()
         mock_foo.assert_called_with(True, b'hi', 5, -82, 7.23, "hi", 64)
 
         # check response
@@ -69,3 +69,23 @@ class LocalCall(unittest.TestCase):
         # self.assertEqual(msg.get_type(), 0)
         # self.assertEqual(msg.function, "result")
         # self.assertEqual(msg.arguments[0][0], 123)
+
+    def test_run_incoming_decoded(self):
+        mock_foo = Mock()
+
+        def foo(a: ctypes.c_char_p, b: ctypes.c_byte):
+            mock_foo(a, b)
+
+        RemoteFunction(foo)
+
+        core = Core(raw=False)
+        plug = Plugin("foo", "bar", "bob", "alice", core)
+        mocks.core_rpc_send(core)
+
+        call = ApiRun("id", "foo", ["h\u00e4", b'hi'])
+        call.msg.arguments[0][0] = None  # remove plugin_id
+        call.msg.arguments[0][1] = 123  # set some call id
+        core._rpc._message_callback(call.msg.pack())
+
+        plug.wait_for_calls()
+        mock_foo.assert_called_with("h\u00e4", b'hi')
@@ -47,7 +47,7 @@ class RemoteCallTest(unittest.TestCase):
         mock_send = mocks.rpc_connection_send(core._rpc)
 
         plug.register(blocking=False)
-        outgoing = msgpack.unpackb(mock_send.call_args[0][0])
+        outgoing = msgpack.unpackb(mock_send.call_args[0][0], raw=True)
 
         self.assertEqual(0, outgoing[0])
         self.assertEqual(b'register', outgoing[2])
@@ -61,7 +61,7 @@ class RemoteCallTest(unittest.TestCase):
         mock_send = mocks.rpc_connection_send(core._rpc)
 
         rplug.run("function", [1, "hi", 42.317, b'hi'])
-        outgoing = msgpack.unpackb(mock_send.call_args[0][0])
+        outgoing = msgpack.unpackb(mock_send.call_args[0][0], raw=True)
 
         self.assertEqual(0, outgoing[0])
         self.assertEqual(b'run', outgoing[2])
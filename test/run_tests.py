@@ -29,6 +29,17 @@ from test.unit import test_message
 from test.unit import test_msgpackrpc
 from test.unit import test_connection
 from test.unit import test_crypto
+from test.unit import test_dispatchpool
+from test.unit import test_stream
+from test.unit import test_compression
+from test.unit import test_arrays
+from test.unit import test_sharedmem
+from test.unit import test_runpool
+from test.unit import test_runloop
+from test.unit import test_batcher
+from test.unit import test_cancellation
+from test.unit import test_resultstore
+from test.unit import test_asynccore
 
 from test.functional import test_remote_calls
 from test.functional import test_local_call
@@ -48,6 +59,17 @@ suite.addTests([
     loader.loadTestsFromModule(test_msgpackrpc),
     loader.loadTestsFromModule(test_connection),
     loader.loadTestsFromModule(test_crypto),
+    loader.loadTestsFromModule(test_dispatchpool),
+    loader.loadTestsFromModule(test_stream),
+    loader.loadTestsFromModule(test_compression),
+    loader.loadTestsFromModule(test_arrays),
+    loader.loadTestsFromModule(test_sharedmem),
+    loader.loadTestsFromModule(test_runpool),
+    loader.loadTestsFromModule(test_runloop),
+    loader.loadTestsFromModule(test_batcher),
+    loader.loadTestsFromModule(test_cancellation),
+    loader.loadTestsFromModule(test_resultstore),
+    loader.loadTestsFromModule(test_asynccore),
     loader.loadTestsFromModule(test_remote_calls),
     loader.loadTestsFromModule(test_local_call),
     loader.loadTestsFromModule(test_complete_call),
@@ -20,9 +20,13 @@ see <http://www.gnu.org/licenses/>.
 
 import unittest
 
+import msgpack
+
 
 from splonebox.api.apicall import InvalidApiCallError, ApiRun, ApiRegister,\
-    ApiResult
+    ApiResult, ApiCancel
+from splonebox.api.compression import Compression, is_compressed, \
+    COMPRESSED_EXT
 
 from splonebox.rpc.message import MRequest, InvalidMessageError
 
@@ -99,7 +103,7 @@ class ApiCallTest(unittest.TestCase):
             ApiRun(plugin_id, function_name, [None])
 
         with self.assertRaises(InvalidApiCallError):
-            ApiRun(plugin_id, function_name, [[]])
+            ApiRun(plugin_id, function_name, [[object()]])
 
         with self.assertRaises(InvalidApiCallError):
             ApiRun(plugin_id, function_name, [object()])
@@ -114,6 +118,16 @@ class ApiCallTest(unittest.TestCase):
         self.assertEqual(call.msg.arguments[1],
                          msg.arguments[1].decode('ascii'))
 
+        # arguments are not copied and the request is left untouched
+        payload = b'x' * 1024
+        msg.arguments = [[None, 123], b'fun', [payload]]
+        call = ApiRun.from_msgpack_request(msg)
+        self.assertIs(call.get_method_args(), msg.arguments[2])
+        self.assertIs(call.get_method_args()[0], payload)
+        self.assertEqual(msg.arguments[1], b'fun')
+        self.assertEqual(call.msg.get_msgid(), msg.get_msgid())
+        self.assertEqual(call.msg.arguments[0], [None, 123])
+
         msg.function = None
         with self.assertRaises(InvalidMessageError):
             ApiRun.from_msgpack_request(msg)
@@ -155,9 +169,157 @@ class ApiCallTest(unittest.TestCase):
         with self.assertRaises(InvalidMessageError):
             ApiRun.from_msgpack_request(msg)
 
+    def test_31_run_from_decoded_msgpack_request(self):
+        msg = MRequest()
+        msg.function = "run"
+
+        msg.arguments = [[None, 123], 'f\u00fcn', ["arg"]]
+        call = ApiRun.from_msgpack_request(msg, raw=False)
+        self.assertEqual(call.get_method_name(), 'f\u00fcn')
+        self.assertEqual(call.get_method_args(), ["arg"])
+
+        msg.arguments = [[None, 123], b'fun', []]
+        with self.assertRaises(InvalidMessageError):
+            ApiRun.from_msgpack_request(msg, raw=False)
+
+    def test_32_run_from_trusted_msgpack_request(self):
+        msg = MRequest()
+        msg.function = "run"
+        msg.arguments = [[None, 123], b'fun', [1, b'arg']]
+
+        call = ApiRun.from_msgpack_request(msg, trusted=True)
+        strict = ApiRun.from_msgpack_request(msg)
+        self.assertEqual(call.get_method_args(), strict.get_method_args())
+        self.assertEqual(call.msg.get_msgid(), msg.get_msgid())
+        self.assertEqual(call.get_method_name(), "fun")
+
+        msg.arguments = [[None, 123], 'fun', []]
+        call = ApiRun.from_msgpack_request(msg, raw=False, trusted=True)
+        self.assertEqual(call.get_method_name(), "fun")
+
+        for invalid in [123, [], [None, b'fun', []], [[None], b'fun', []],
+                        [[None, 123], 5, []]]:
+            msg.arguments = invalid
+            with self.assertRaises(InvalidMessageError):
+                ApiRun.from_msgpack_request(msg, trusted=True)
+
+    def test_33_result_from_trusted_msgpack_request(self):
+        msg = ApiResult(1234, [1, 2]).msg
+
+        call = ApiResult.from_msgpack_request(msg, trusted=True)
+        self.assertEqual(call.get_call_id(), 1234)
+        self.assertEqual(call.get_result(), [1, 2])
+        self.assertEqual(call.msg.get_msgid(), msg.get_msgid())
+
+        for invalid in [123, [1, 2, 3], [1234, [1]], [[1234], [1, 2]]]:
+            msg.arguments = invalid
+            with self.assertRaises(InvalidMessageError):
+                ApiResult.from_msgpack_request(msg, trusted=True)
+
+    def test_34_compressed_run(self):
+        compression = Compression(threshold=100)
+        blob = b"x" * 1000
+        text = "y" * 1000
+
+        call = ApiRun("id", "fun", [blob, text, b"short", 1], compression)
+        args = call.get_method_args()
+        self.assertTrue(is_compressed(args[0]))
+        self.assertTrue(is_compressed(args[1]))
+        self.assertEqual(args[2:], [b"short", 1])
+
+        # the receiver gets the original arguments
+        call.msg.arguments[0] = [None, 123]
+        for trusted in [False, True]:
+            received = ApiRun.from_msgpack_request(
+                call.msg, raw=False, trusted=trusted, compression=compression)
+            self.assertEqual(received.get_method_args(),
+                             [blob, text, b"short", 1])
+
+            # compressed values are rejected if compression isn't enabled
+            # or they are too large
+            for receiver in [None, Compression(max_size=999)]:
+                with self.assertRaises(InvalidMessageError):
+                    ApiRun.from_msgpack_request(call.msg, raw=False,
+                                                trusted=trusted,
+                                                compression=receiver)
+
+        call.msg.arguments[2][0] = msgpack.ExtType(COMPRESSED_EXT,
+                                                   b"\x00invalid")
+        for trusted in [False, True]:
+            with self.assertRaises(InvalidMessageError):
+                ApiRun.from_msgpack_request(call.msg, raw=False,
+                                            trusted=trusted,
+                                            compression=compression)
+
+    def test_35_compressed_result(self):
+        call = ApiResult(1, b"x" * 1000, Compression(threshold=100))
+        self.assertTrue(is_compressed(call.get_result()))
+
+        call = ApiResult(1, [b"x" * 1000], Compression(threshold=100))
+        self.assertEqual(call.get_result(), [b"x" * 1000])
+
+    def test_36_structured_args(self):
+        args = [[1, [b"a", "b"]], {"key": [1.0, {2: True}]}, [], {},
+                [None, {"key": None}]]
+        call = ApiRun("id", "fun", args)
+        self.assertEqual(call.get_method_args(), args)
+
+        for invalid in [[object()], {None: 1}, {1.0: 1},
+                        {(1, 2): 1}, [[[set()]]]]:
+            with self.assertRaises(InvalidApiCallError):
+                ApiRun("id", "fun", [invalid])
+
+        # received values are validated once
+        msg = MRequest()
+        msg.function = "run"
+        msg.arguments = [[None, 123], b'fun', args]
+        call = ApiRun.from_msgpack_request(msg)
+        self.assertIs(call.get_method_args(), args)
+
+        msg.arguments = [[None, 123], b'fun', [[1, {1.0: None}]]]
+        with self.assertRaises(InvalidMessageError):
+            ApiRun.from_msgpack_request(msg)
+
+        # deeply nested values don't hit the recursion limit
+        deep = []
+        for _ in range(10000):
+            deep = [deep]
+        ApiRun("id", "fun", [deep])
+
+    def test_37_run_timeout(self):
+        call = ApiRun("plugin_id", "fun", [1], timeout=2.5)
+        self.assertEqual(call.get_timeout(), 2.5)
+        self.assertEqual(call.msg.arguments, [["plugin_id", None], "fun", [1],
+                                              2.5])
+        # without a timeout the body is unchanged
+        self.assertIsNone(ApiRun("plugin_id", "fun", [1]).get_timeout())
+        self.assertEqual(len(ApiRun("plugin_id", "fun", [1]).msg.arguments),
+                         3)
+
+        for invalid in [-1, "1", True]:
+            with self.assertRaises(InvalidApiCallError):
+                ApiRun("plugin_id", "fun", [1], timeout=invalid)
+
+        msg = MRequest()
+        msg.function = "run"
+        for trusted in [False, True]:
+            msg.arguments = [[None, 123], b'fun', [], 0.5]
+            call = ApiRun.from_msgpack_request(msg, trusted=trusted)
+            self.assertEqual(call.get_timeout(), 0.5)
+            self.assertEqual(call.get_method_name(), "fun")
+
+        for invalid in [-1, "1", [1]]:
+            msg.arguments = [[None, 123], b'fun', [], invalid]
+            with self.assertRaises(InvalidMessageError):
+                ApiRun.from_msgpack_request(msg)
+
+        msg.arguments = [[None, 123], b'fun', [], 1, 2]
+        with self.assertRaises(InvalidMessageError):
+            ApiRun.from_msgpack_request(msg)
+
     def test_40_apiregister(self):
         metadata = ["plugin_id", "plugin_name", "description", "MIT", "Guy"]
-        functions = [["foo", "do_foo", [3, -1, 2.0, "", False, b'']]]
+        functions = [["foo", "do_foo", [3, -1, 2.0, "", False, b'', [], {}]]]
         call = ApiRegister(metadata, functions)
 
         self.assertEqual(call.msg.function, "register")
@@ -182,7 +344,7 @@ class ApiCallTest(unittest.TestCase):
         with self.assertRaises(InvalidApiCallError):
             ApiRegister(metadata, None)
 
-        invalid = [1.2, 800, -92, b'hi', True, "something"]
+        invalid = [1.2, 800, -92, b'hi', True, "something", [1], {1: 2}]
         for inv in invalid:
             with self.assertRaises(InvalidApiCallError):
                 ApiRegister(metadata, [["a", "b", [inv]]])
@@ -222,7 +384,37 @@ class ApiCallTest(unittest.TestCase):
             ApiRun(plugin_id, function_name, [None])
 
         with self.assertRaises(InvalidApiCallError):
-            ApiRun(plugin_id, function_name, [[]])
+            ApiRun(plugin_id, function_name, [[object()]])
 
         with self.assertRaises(InvalidApiCallError):
             ApiRun(plugin_id, function_name, [object()])
+
+    def test_60_apicancel(self):
+        call = ApiCancel("plugin_id", 123)
+        self.assertEqual(call.msg.function, "cancel")
+        self.assertEqual(call.msg.arguments, [["plugin_id", 123]])
+
+        with self.assertRaises(InvalidApiCallError):
+            ApiCancel(None, 123)
+
+        with self.assertRaises(InvalidApiCallError):
+            ApiCancel("plugin_id", "123")
+
+    def test_61_cancel_from_msgpack_request(self):
+        msg = MRequest()
+        msg.function = "cancel"
+        msg.arguments = [[None, 123]]
+        self.assertEqual(ApiCancel.from_msgpack_request(msg).get_call_id(),
+                         123)
+
+        for arguments in [[], [None], [[None]], [["plugin_id", 123]],
+                          [[None, "123"]], [[None, True]],
+                          [[None, 123], None]]:
+            msg.arguments = arguments
+            with self.assertRaises(InvalidMessageError):
+                ApiCancel.from_msgpack_request(msg)
+
+        msg.function = "run"
+        msg.arguments = [[None, 123]]
+        with self.assertRaises(InvalidMessageError):
+            ApiCancel.from_msgpack_request(msg)
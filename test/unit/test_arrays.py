@@ -0,0 +1,122 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import ctypes
+import unittest
+
+import msgpack
+
+from splonebox.api import arrays
+from splonebox.api.apicall import ApiRun, ApiResult, InvalidApiCallError
+from splonebox.api.remotefunction import RemoteFunction
+from splonebox.rpc.message import InvalidMessageError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class ArraysTest(unittest.TestCase):
+    def setUp(self):
+        # cleanup remote_functions
+        RemoteFunction.remote_functions = []
+
+    def test_array_roundtrip(self):
+        for array in [numpy.arange(12, dtype='<f4').reshape(3, 4),
+                      numpy.arange(10, dtype='>i8')[::3],
+                      numpy.zeros((0, 3)),
+                      numpy.array(5, dtype=numpy.uint8)]:
+            ext = arrays.pack_array(array)
+            self.assertTrue(arrays.is_array(ext))
+
+            # survives packing
+            ext = msgpack.unpackb(msgpack.packb(ext, use_bin_type=True))
+            received = arrays.unpack_array(ext)
+            self.assertEqual(received.dtype, array.dtype)
+            self.assertTrue(numpy.array_equal(received, array))
+
+        with self.assertRaises(ValueError):
+            arrays.pack_array(numpy.array([object()]))
+
+    def test_unpack_is_view(self):
+        ext = arrays.pack_array(numpy.arange(1000, dtype=numpy.int32))
+        received = arrays.unpack_array(ext)
+        self.assertFalse(received.flags.writeable)
+        self.assertFalse(received.flags.owndata)
+
+    def test_unpack_checks(self):
+        ext = arrays.pack_array(numpy.arange(4, dtype=numpy.float64))
+
+        arrays.unpack_array(ext, numpy.dtype(numpy.float64), 4)
+        with self.assertRaises(ValueError):
+            arrays.unpack_array(ext, numpy.dtype(numpy.int64))
+        with self.assertRaises(ValueError):
+            arrays.unpack_array(ext, length=3)
+
+        for invalid in [b"", b"\x03<f8", ext.data[:-1], b"\x02|O\x00"]:
+            with self.assertRaises(ValueError):
+                arrays.unpack_array(msgpack.ExtType(arrays.ARRAY_EXT,
+                                                    invalid))
+
+    def test_annotation(self):
+        @RemoteFunction
+        def fun(a: ctypes.c_double * 3, b: numpy.dtype(numpy.uint16),
+                c: ctypes.c_int64 * 0, d: ctypes.c_int64):
+            pass
+
+        self.assertEqual(fun.args, [b'', b'', b'', -1])
+
+        fun.fun = lambda a, b, c, d: (a, b, c, d)
+        a, b, c, d = fun([arrays.pack_array(numpy.ones(3)),
+                          arrays.pack_array(numpy.ones(2, numpy.uint16)),
+                          arrays.pack_array(numpy.ones(7, numpy.int64)), 1])
+        self.assertEqual(a.tolist(), [1.0] * 3)
+        self.assertEqual(b.dtype, numpy.uint16)
+        self.assertEqual(len(c), 7)
+
+        # local calls may pass arrays directly
+        self.assertIs(fun([a, b, c, 1])[0], a)
+
+        for args in [[arrays.pack_array(numpy.ones(4)), b, c, 1],
+                     [arrays.pack_array(numpy.ones(3, numpy.float32)), b, c,
+                      1],
+                     [b'', b, c, 1]]:
+            with self.assertRaises(TypeError):
+                fun(args)
+
+    def test_apicalls(self):
+        array = numpy.arange(6, dtype=numpy.float64).reshape(2, 3)
+        call = ApiRun("id", "fun", [array, 1])
+        self.assertTrue(arrays.is_array(call.get_method_args()[0]))
+
+        call.msg.arguments[0] = [None, 123]
+        received = ApiRun.from_msgpack_request(call.msg, raw=False)
+        self.assertTrue(arrays.is_array(received.get_method_args()[0]))
+
+        result = ApiResult(123, array)
+        self.assertTrue(arrays.is_array(result.get_result()))
+
+        with self.assertRaises(InvalidApiCallError):
+            ApiRun("id", "fun", [numpy.array([object()])])
+
+        call.msg.arguments[2] = [msgpack.ExtType(42, b"")]
+        with self.assertRaises(InvalidMessageError):
+            ApiRun.from_msgpack_request(call.msg, raw=False)
@@ -0,0 +1,153 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import asyncio
+import threading
+import unittest
+import msgpack
+
+from splonebox.api.asynccore import AsyncCore
+from splonebox.api.apicall import ApiResult
+from splonebox.api.core import Core
+from splonebox.api.response import Response, RemoteError
+from splonebox.rpc.message import MResponse, MNotify
+from test import mocks
+
+
+class AsyncCoreTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.core = AsyncCore(Core())
+        self.send = mocks.rpc_connection_send(self.core.core._rpc)
+
+    def receive(self, data: bytes):
+        # incoming messages are dispatched on another thread
+        rpc = self.core.core._rpc
+        threading.Thread(target=rpc._message_callback, args=(data, )).start()
+
+    def sent(self, index: int=-1) -> []:
+        return msgpack.unpackb(self.send.call_args_list[index][0][0],
+                               raw=True)
+
+    def respond(self, response=None, error=None):
+        msg = MResponse(self.sent()[1])
+        msg.response = response
+        msg.error = error
+        self.receive(msg.pack())
+
+    async def answer(self, result):
+        # wait until the run call was sent, then answer it on another thread
+        while self.send.call_count == 0:
+            await asyncio.sleep(0.001)
+        self.respond([42])
+        await asyncio.sleep(0.01)
+        self.receive(ApiResult(42, result).msg.pack())
+
+    def test_run(self):
+        async def main():
+            run = asyncio.ensure_future(self.core.run("id", "add", [1, 2],
+                                                      timeout=5))
+            await self.answer(3)
+            return await run
+
+        self.assertEqual(self.loop.run_until_complete(main()), 3)
+        request = self.sent(0)
+        self.assertEqual(request[2], b"run")
+        self.assertEqual(request[3][1:], [b"add", [1, 2], 5])
+
+    def test_run_error(self):
+        async def main():
+            run = asyncio.ensure_future(self.core.run("id", "fail"))
+            while self.send.call_count == 0:
+                await asyncio.sleep(0.001)
+            self.respond(error=[404, "Function does not exist!"])
+            await run
+
+        with self.assertRaises(RemoteError) as cm:
+            self.loop.run_until_complete(main())
+        self.assertEqual(cm.exception.errno, 404)
+
+    def test_run_timeout(self):
+        async def main():
+            await self.core.run("id", "slow", timeout=0.05)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(main())
+
+        # the call was cancelled once its call id arrived
+        self.respond([7])
+        for _ in range(100):
+            if self.send.call_count == 2:
+                break
+            self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(self.sent()[2], b"cancel")
+        self.assertEqual(self.sent()[3], [[b"id", 7]])
+
+    def test_many_runs(self):
+        async def main():
+            runs = [asyncio.ensure_future(self.core.run("id", "f", [i]))
+                    for i in range(10)]
+            while self.send.call_count < 10:
+                await asyncio.sleep(0.001)
+            for i, (args, _) in enumerate(self.send.call_args_list):
+                msg = MResponse(msgpack.unpackb(args[0], raw=True)[1])
+                msg.response = [100 + i]
+                self.receive(msg.pack())
+            await asyncio.sleep(0.01)
+            for i in reversed(range(10)):
+                self.receive(ApiResult(100 + i, i * i).msg.pack())
+            return await asyncio.gather(*runs)
+
+        self.assertEqual(self.loop.run_until_complete(main()),
+                         [i * i for i in range(10)])
+
+    def test_subscribe(self):
+        core = self.core.core
+
+        async def main():
+            subscribe = asyncio.ensure_future(self.core.subscribe("event"))
+            while self.send.call_count == 0:
+                await asyncio.sleep(0.001)
+            self.respond([])
+            sub = await subscribe
+
+            for i in range(3):
+                threading.Thread(target=core._handle_broadcast, args=(
+                    MNotify("event", [i]), )).start()
+                await asyncio.sleep(0.01)
+
+            events = []
+            async for args in sub:
+                events.append(args)
+                if len(events) == 3:
+                    break
+
+            with self.assertRaises(asyncio.TimeoutError):
+                await sub.wait(timeout=0.01)
+            return events
+
+        self.assertEqual(self.loop.run_until_complete(main()),
+                         [[0], [1], [2]])
+        self.assertEqual(self.sent(0)[2], b"subscribe")
+
+    def test_await_compatibility(self):
+        response = Response()
+        response.success()
+        getattr(response, "await")(timeout=0)
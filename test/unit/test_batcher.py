@@ -0,0 +1,102 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+import threading
+import time
+import unittest
+
+from splonebox.api.batcher import Batcher
+
+
+class BatcherTest(unittest.TestCase):
+    def test_full_batches(self):
+        batches = []
+        batcher = Batcher(batches.append, max_size=3, max_wait=10)
+        for i in range(6):
+            batcher.submit(i, (i, ))
+
+        # full batches don't wait for max_wait
+        self.assertTrue(batcher.wait(5))
+        self.assertEqual(batches, [[(0, (0, )), (1, (1, )), (2, (2, ))],
+                                   [(3, (3, )), (4, (4, )), (5, (5, ))]])
+        self.assertEqual(batcher.active_calls(), [])
+
+    def test_max_wait(self):
+        batches = []
+        batcher = Batcher(batches.append, max_size=100, max_wait=0.05)
+        start = time.monotonic()
+        batcher.submit(1, ())
+        batcher.submit(2, ())
+
+        self.assertTrue(batcher.wait(5))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(batches, [[(1, ()), (2, ())]])
+
+    def test_active_calls(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def execute(batch):
+            started.set()
+            release.wait()
+
+        batcher = Batcher(execute, max_size=1, max_wait=0)
+        batcher.submit(1, ())
+        self.assertTrue(started.wait(5))
+        batcher.submit(2, ())
+
+        self.assertEqual(sorted(batcher.active_calls()), [1, 2])
+        self.assertFalse(batcher.wait(0.01))
+        release.set()
+        self.assertTrue(batcher.wait(5))
+        self.assertEqual(batcher.active_calls(), [])
+
+    def test_failing_batch(self):
+        batches = []
+
+        def execute(batch):
+            batches.append(batch)
+            raise ValueError("failed")
+
+        batcher = Batcher(execute, max_size=1, max_wait=0)
+        batcher.submit(1, ())
+        batcher.submit(2, ())
+        # the batcher keeps working
+        self.assertTrue(batcher.wait(5))
+        self.assertEqual(len(batches), 2)
+
+    def test_cancel(self):
+        batches = []
+        batcher = Batcher(batches.append, max_size=100, max_wait=0.05)
+        batcher.submit(1, ())
+        batcher.submit(2, ())
+        self.assertTrue(batcher.cancel(1))
+        self.assertFalse(batcher.cancel(3))
+        self.assertTrue(batcher.wait(5))
+        self.assertEqual(batches, [[(2, ())]])
+
+        # a batch of cancelled calls isn't executed
+        batcher.submit(3, ())
+        self.assertTrue(batcher.cancel(3))
+        self.assertTrue(batcher.wait(5))
+        time.sleep(0.1)
+        self.assertEqual(len(batches), 1)
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            Batcher(lambda batch: None, max_size=0, max_wait=0)
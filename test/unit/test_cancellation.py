@@ -0,0 +1,73 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+import threading
+import time
+import unittest
+from concurrent.futures import CancelledError
+
+from splonebox.api.cancellation import CancellationToken
+
+
+class CancellationTokenTest(unittest.TestCase):
+    def test_cancel(self):
+        token = CancellationToken()
+        self.assertFalse(token.is_cancelled())
+        token.raise_if_cancelled()
+        self.assertFalse(token.wait(0.01))
+
+        threading.Timer(0.01, token.cancel).start()
+        self.assertTrue(token.wait(5))
+        self.assertTrue(token.is_cancelled())
+        with self.assertRaises(CancelledError):
+            token.raise_if_cancelled()
+
+    def test_callbacks(self):
+        token = CancellationToken()
+        called = []
+
+        def fail():
+            raise ValueError("failed")
+
+        token.add_callback(lambda: called.append(1))
+        token.add_callback(fail)
+        token.add_callback(lambda: called.append(2))
+        self.assertEqual(called, [])
+
+        # failing callbacks don't stop the others
+        token.cancel()
+        token.cancel()
+        self.assertEqual(called, [1, 2])
+
+        # called at once after the call was cancelled
+        token.add_callback(lambda: called.append(3))
+        self.assertEqual(called, [1, 2, 3])
+
+    def test_deadline(self):
+        self.assertIsNone(CancellationToken().remaining())
+
+        token = CancellationToken(time.monotonic() + 0.05)
+        self.assertFalse(token.is_cancelled())
+        self.assertLessEqual(token.remaining(), 0.05)
+
+        # waiting ends at the deadline
+        self.assertTrue(token.wait())
+        self.assertTrue(token.is_cancelled())
+        self.assertEqual(token.remaining(), 0)
+        with self.assertRaises(CancelledError):
+            token.raise_if_cancelled()
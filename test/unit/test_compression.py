@@ -0,0 +1,84 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import os
+import unittest
+
+import msgpack
+
+from splonebox.api.compression import Compression, decompress, \
+    decompress_args, is_compressed, COMPRESSED_EXT
+
+
+class CompressionTest(unittest.TestCase):
+    def test_compress_roundtrip(self):
+        compression = Compression(threshold=10, level=9)
+        for value in [b"a" * 100, "ä" * 100]:
+            compressed = compression.compress(value)
+            self.assertTrue(is_compressed(compressed))
+            self.assertEqual(compressed.code, COMPRESSED_EXT)
+
+            # survives packing
+            packed = msgpack.packb(compressed, use_bin_type=True)
+            self.assertLess(len(packed), 100)
+            self.assertEqual(decompress(msgpack.unpackb(packed, raw=True)),
+                             value)
+
+    def test_compress_skipped(self):
+        compression = Compression(threshold=10)
+
+        # too small, wrong type or incompressible
+        for value in [b"a" * 9, "a" * 9, 12345678901, [b"a" * 100],
+                      os.urandom(100)]:
+            self.assertIs(compression.compress(value), value)
+            self.assertIs(decompress(value), value)
+
+        with self.assertRaises(ValueError):
+            Compression(level=10)
+
+    def test_decompress_args(self):
+        compression = Compression(threshold=10)
+        args = [b"a" * 100, 1, "b"]
+
+        self.assertIs(decompress_args(args), args)
+        self.assertEqual(decompress_args(compression.compress_args(args)),
+                         args)
+
+        with self.assertRaises(ValueError):
+            decompress(msgpack.ExtType(COMPRESSED_EXT, b"\x00invalid"))
+        with self.assertRaises(ValueError):
+            decompress(msgpack.ExtType(COMPRESSED_EXT, b"\x07"))
+
+    def test_decompress_max_size(self):
+        compression = Compression(threshold=10, max_size=1000)
+        compressed = compression.compress(b"a" * 1000)
+        self.assertEqual(compression.decompress(compressed), b"a" * 1000)
+
+        # a small value expanding beyond the limit is rejected
+        bomb = Compression(threshold=10).compress(b"\x00" * 10 ** 7)
+        self.assertLess(len(bomb.data), 20000)
+        with self.assertRaises(ValueError):
+            compression.decompress(bomb)
+        with self.assertRaises(ValueError):
+            decompress(bomb, max_size=10 ** 7 - 1)
+        self.assertEqual(len(decompress(bomb, max_size=10 ** 7)), 10 ** 7)
+
+        # truncated data
+        with self.assertRaises(ValueError):
+            decompress(msgpack.ExtType(COMPRESSED_EXT, compressed.data[:-4]))
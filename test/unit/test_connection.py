@@ -2,6 +2,9 @@ from unittest import mock
 import unittest
 import libnacl
 import socket
+import logging
+import threading
+import time
 
 from test import mocks
 from splonebox.rpc.connection import Connection
@@ -50,6 +53,21 @@ class ConnectionTest(unittest.TestCase):
         with self.assertRaises(BrokenPipeError):
             self.con.send_message(b'foo')
 
+    def test_021_send_messages(self):
+        """ Verify that all boxes are sent with a single sendall. """
+        self.con.crypto_context.crypto_established.set()
+        self.con._disconnected.clear()
+        self.con.crypto_context.crypto_write = mock.Mock(
+            side_effect=lambda data: b"boxed" + data)
+
+        self.con.send_messages([b"foo", b"bar"])
+        self.con._socket.sendall.assert_called_once_with(b"boxedfooboxedbar")
+
+        # test send while disconnected
+        self.con._disconnected.set()
+        with self.assertRaises(BrokenPipeError):
+            self.con.send_messages([b'foo'])
+
     def test_030_listen_one_packet(self):
         """
         Verify segmentation handling by method '_listen' with one
@@ -201,6 +219,55 @@ class ConnectionTest(unittest.TestCase):
         # verify that callback is called
         callback.assert_has_calls([mock.call(data)])
 
+    def test_052_listen_large_packet(self):
+        """ A packet spread over many network packets is only verified
+        again once it is complete """
+        con = self.con
+        con._disconnected.clear()
+        buf = mocks.connection_socket_fake_recv(con)
+
+        chunks = [libnacl.randombytes(64) for _ in range(10)]
+        data = b''.join(chunks)
+        callback = mock.Mock()
+
+        crypto_verify = mock.Mock(return_value=len(data))
+        con.crypto_context.crypto_verify_length = crypto_verify
+
+        crypto_read = mock.Mock(return_value=b'plain')
+        con.crypto_context.crypto_read = crypto_read
+
+        buf.extend(chunks)
+        con._listen(callback)
+
+        crypto_verify.assert_has_calls([mock.call(chunks[0]),
+                                        mock.call(data)])
+        self.assertEqual(crypto_verify.call_count, 2)
+        crypto_read.assert_called_once_with(data)
+        callback.assert_called_once_with(b'plain')
+
+    def test_053_listen_packets_with_remainder(self):
+        """ Complete packets are handled, the start of the next one is
+        kept until the rest arrives """
+        con = self.con
+        con._disconnected.clear()
+        buf = mocks.connection_socket_fake_recv(con)
+
+        packets = [libnacl.randombytes(40 + i) for i in range(3)]
+        data = b''.join(packets)
+        callback = mock.Mock()
+
+        con.crypto_context.crypto_verify_length = mock.Mock(
+            side_effect=[40, 41, 42, 42])
+        con.crypto_context.crypto_read = mock.Mock(side_effect=packets)
+
+        buf.append(data[:100])
+        buf.append(data[100:])
+        con._listen(callback)
+
+        con.crypto_context.crypto_read.assert_has_calls(
+            [mock.call(p) for p in packets])
+        callback.assert_has_calls([mock.call(p) for p in packets])
+
     def test_060_listen_failures(self):
         """ Test error handling during listen """
         con = self.con
@@ -281,6 +348,64 @@ class ConnectionTest(unittest.TestCase):
         callback.assert_called_once_with(data)
         # put data on to mocked socket
 
+    def test_070_disconnect(self):
+        con = self.con
+        con._disconnected.clear()
+        con.disconnect()
+        con._socket.shutdown.assert_called_once_with(socket.SHUT_RDWR)
+        con._socket.close.assert_called_once_with()
+
+        # the socket may already be closed by the server
+        con._socket.shutdown.side_effect = OSError
+        con.disconnect()
+
+    def test_071_disconnect_flush(self):
+        """ Verify that the connection is closed after the server closed
+        its side. """
+        con = self.con
+        con.crypto_context.crypto_established.set()
+        con.crypto_context.crypto_write = lambda data: data
+        con._disconnected.clear()
+
+        # the server closes the connection once it received everything
+        server_closed = threading.Event()
+        con._socket.shutdown.side_effect = \
+            lambda how: how == socket.SHUT_WR and server_closed.set()
+        con._socket.recv.side_effect = \
+            lambda size: server_closed.wait(5) and b''
+        con.listen(mock.Mock(), new_thread=True)
+
+        con.send_message(b"foo")
+        with self.assertLogs(level="WARNING") as logs:
+            con.disconnect(flush_timeout=5)
+            logging.warning("no warning about the closed connection")
+        self.assertEqual(len(logs.output), 1)
+
+        self.assertEqual(con._socket.shutdown.call_args_list,
+                         [mock.call(socket.SHUT_WR),
+                          mock.call(socket.SHUT_RDWR)])
+        con._socket.sendall.assert_called_once_with(b"foo")
+        self.assertFalse(con._listen_thread.is_alive())
+
+    def test_072_disconnect_flush_timeout(self):
+        con = self.con
+        con.crypto_context.crypto_established.set()
+        con._disconnected.clear()
+
+        # the server doesn't close its side
+        start = time.monotonic()
+        con.disconnect(flush_timeout=0.05)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertTrue(con._disconnected.is_set())
+
+        # nothing is sent while flushing
+        con._disconnected.clear()
+        con._flushing = True
+        with self.assertRaises(BrokenPipeError):
+            con.send_message(b"foo")
+        with self.assertRaises(BrokenPipeError):
+            con.send_messages([b"foo"])
+
     def test_080_listen_wrapper(self):
         con = self.con
         callback = mock.Mock()
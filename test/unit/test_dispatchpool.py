@@ -0,0 +1,92 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import threading
+import unittest
+
+from splonebox.rpc.dispatchpool import DispatchPool
+
+
+class DispatchPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = DispatchPool(4, queue_size=8)
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def test_order_per_key(self):
+        results = {0: [], 1: [], 2: []}
+
+        for i in range(100):
+            self.pool.submit(i % 3, results[i % 3].append, i)
+
+        self.pool.stop()
+        for key, values in results.items():
+            self.assertEqual(values, list(range(key, 100, 3)))
+
+    def test_slow_job_does_not_block_other_keys(self):
+        release = threading.Event()
+        done = threading.Event()
+
+        # find a key that is handled by a different worker than "slow"
+        other = next(k for k in range(100)
+                     if hash(k) % 4 != hash("slow") % 4)
+
+        self.pool.submit("slow", release.wait)
+        self.pool.submit(other, done.set)
+
+        self.assertTrue(done.wait(timeout=5))
+        release.set()
+
+    def test_failing_job(self):
+        done = threading.Event()
+
+        def fail():
+            raise TypeError()
+
+        self.pool.submit(1, fail)
+        self.pool.submit(1, done.set)
+        self.assertTrue(done.wait(timeout=5))
+
+    def test_stop_from_full_worker(self):
+        pool = DispatchPool(1, queue_size=2)
+        pool.start()
+        worker = pool._threads[0]
+        release = threading.Event()
+        handled = []
+
+        def disconnect():
+            release.wait()
+            pool.stop()
+
+        # the handler stops the pool while its own queue is full
+        pool.submit(1, disconnect)
+        for i in range(2):
+            pool.submit(1, handled.append, i)
+        release.set()
+
+        # the worker handles its pending jobs and stops
+        worker.join(timeout=5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(handled, [0, 1])
+
+    def test_invalid_worker_count(self):
+        with self.assertRaises(ValueError):
+            DispatchPool(0)
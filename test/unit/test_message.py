@@ -22,7 +22,7 @@ import unittest
 import msgpack
 
 from splonebox.rpc.message import MRequest, Message, MResponse, MNotify, \
- InvalidMessageError
+ InvalidMessageError, MessageIdAllocator
 
 
 class MessageTest(unittest.TestCase):
@@ -46,6 +46,11 @@ class MessageTest(unittest.TestCase):
         self.assertEqual(unpacked._type, 2)
         self.assertEqual(unpacked.function, 'Testfunction')
         self.assertEqual(unpacked.arguments, ['hi'])
+        self.assertIsNone(unpacked.get_msgid())
+
+        # messages don't carry a __dict__
+        for msg in [msg_request, msg_response, msg_notify]:
+            self.assertFalse(hasattr(Message.from_unpacked(msg), '__dict__'))
 
         with self.assertRaises(InvalidMessageError):
             Message.from_unpacked([])
@@ -93,6 +98,57 @@ class MessageTest(unittest.TestCase):
             Message.from_unpacked([1, b'test', "notalist"])
 
 
+    def test_unpack_form(self):
+        # requests and responses have 4 fields, notifications 3
+        for invalid in [[0, 1, b'run'], [1, 1, None], [2, b'x', [], []]]:
+            with self.assertRaises(InvalidMessageError):
+                Message.from_unpacked(invalid)
+
+        with self.assertRaises(InvalidMessageError):
+            Message.from_unpacked([1.0, 1, [], []])
+
+    def test_unpack_trusted(self):
+        for raw, method in [(True, b'run'), (False, 'run')]:
+            unpacked = Message.from_unpacked([0, 1, method, [b'hi']], raw,
+                                             trusted=True)
+            self.assertEqual(unpacked,
+                             Message.from_unpacked([0, 1, method, [b'hi']],
+                                                   raw))
+            self.assertEqual(unpacked.function, 'run')
+
+            unpacked = Message.from_unpacked([2, method, []], raw, True)
+            self.assertEqual(unpacked.function, 'run')
+            self.assertEqual(unpacked.get_type(), 2)
+
+        unpacked = Message.from_unpacked([1, 1, None, ['res']], trusted=True)
+        self.assertEqual(unpacked.get_type(), 1)
+        self.assertEqual(unpacked.response, ['res'])
+
+        # only the form is verified
+        for invalid in [[], None, 5, [5, 1, None, []], [0, 1, b'run'],
+                        [2, 1, 2, 3], [0, 1, 5, []], [[], 1, 2]]:
+            with self.assertRaises(InvalidMessageError):
+                Message.from_unpacked(invalid, trusted=True)
+
+    def test_unpack_decoded(self):
+        unpacked = Message.from_unpacked([0, 1, 'r\u00fcn', ['hi']],
+                                         raw=False)
+        self.assertEqual(unpacked.function, 'r\u00fcn')
+        self.assertEqual(unpacked.arguments, ['hi'])
+
+        unpacked = Message.from_unpacked([2, 'event', ['hi']], raw=False)
+        self.assertEqual(unpacked.function, 'event')
+
+        # strings are decoded as UTF-8 in raw mode as well
+        unpacked = Message.from_unpacked([0, 1, 'r\u00fcn'.encode(), []])
+        self.assertEqual(unpacked.function, 'r\u00fcn')
+
+        with self.assertRaises(InvalidMessageError):
+            Message.from_unpacked([0, 1, b'run', []], raw=False)
+
+        with self.assertRaises(InvalidMessageError):
+            Message.from_unpacked([2, b'event', []], raw=False)
+
     def test_MRequest(self):
         msg = MRequest()
         msg.function = "foo"
@@ -147,3 +203,49 @@ class MessageTest(unittest.TestCase):
         with self.assertRaises(InvalidMessageError):
             msg = MNotify("test", 123)
             msg.pack()
+
+    def test_pack_matches_packb(self):
+        args = [b'bytes', "str", 1, -1, 2.0, True, None, [1, [2]],
+                {"a": b'b'}, pow(2, 40)]
+
+        for function in ["run", "result", "broadcast", "unicode \u00e4"]:
+            msg = MRequest()
+            msg.function = function
+            msg.arguments = args
+            self.assertEqual(msg.pack(), msgpack.packb(
+                [0, msg.get_msgid(), function, args], use_bin_type=True))
+
+            msg = MNotify(function, args)
+            self.assertEqual(msg.pack(), msgpack.packb(
+                [2, function, args], use_bin_type=True))
+
+        for msgid in [0, 127, 128, pow(2, 16), Message._max_message_id]:
+            msg = MResponse(msgid)
+            msg.error = [400, "error"]
+            msg.response = args
+            self.assertEqual(msg.pack(), msgpack.packb(
+                [1, msgid, [400, "error"], args], use_bin_type=True))
+
+        # a failed pack must not leave data in the packer
+        msg = MNotify("run", [object()])
+        with self.assertRaises(TypeError):
+            msg.pack()
+        msg.arguments = []
+        self.assertEqual(msg.pack(), msgpack.packb([2, "run", []]))
+
+    def test_msgid_allocator(self):
+        allocator = MessageIdAllocator()
+        self.assertEqual(allocator.allocate({}), 0)
+        self.assertEqual(allocator.allocate({}), 1)
+
+        # ids in flight are skipped
+        self.assertEqual(allocator.allocate({2: None, 3: None}), 4)
+
+        # wrap around at the maximum message id
+        allocator = MessageIdAllocator(Message._max_message_id)
+        self.assertEqual(allocator.allocate({}), Message._max_message_id)
+        self.assertEqual(allocator.allocate({0: None}), 1)
+
+        allocator = MessageIdAllocator(Message._max_message_id)
+        in_flight = {Message._max_message_id: None, 0: None}
+        self.assertEqual(allocator.allocate(in_flight), 1)
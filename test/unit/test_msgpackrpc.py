@@ -19,9 +19,10 @@ see <http://www.gnu.org/licenses/>.
 
 import unittest
 import msgpack
+import threading
 from unittest.mock import Mock
 from splonebox.rpc.message import MRequest, InvalidMessageError, MNotify, \
- MResponse
+ MResponse, Message
 from splonebox.rpc.msgpackrpc import MsgpackRpc
 from test import mocks
 
@@ -35,6 +36,11 @@ class MsgpackRpcTest(unittest.TestCase):
         with self.assertRaises(InvalidMessageError):
             rpc.send(m1)
 
+        # the callback is dropped again if packing fails
+        with self.assertRaises(InvalidMessageError):
+            rpc.send(m1, lambda msg: None)
+        self.assertEqual(rpc._response_callbacks, {})
+
         m1.function = "run"
         m1.arguments = []
 
@@ -57,6 +63,46 @@ class MsgpackRpcTest(unittest.TestCase):
         with self.assertRaises(InvalidMessageError):
             rpc.send(None)
 
+    def test_send_many(self):
+        rpc = MsgpackRpc()
+        rpc._connection.send_messages = Mock()
+        con_send_mock = rpc._connection.send_messages
+
+        msgs = []
+        for i in range(3):
+            m = MRequest()
+            m.function = "run"
+            m.arguments = [i]
+            msgs.append(m)
+        m_not = MNotify("broadcast", ["event", []])
+
+        def r_cb():
+            pass
+
+        rpc.send_many(msgs + [m_not], [r_cb, None, r_cb, None])
+        con_send_mock.assert_called_once_with(
+            [m.pack() for m in msgs + [m_not]])
+
+        self.assertEqual(rpc._response_callbacks,
+                         {msgs[0].get_msgid(): r_cb,
+                          msgs[2].get_msgid(): r_cb})
+        self.assertNotEqual(msgs[0].get_msgid(), msgs[2].get_msgid())
+
+        # callbacks are dropped again if packing fails
+        invalid = MRequest()
+        with self.assertRaises(InvalidMessageError):
+            rpc.send_many([msgs[1], invalid], [r_cb, r_cb])
+        self.assertEqual(len(rpc._response_callbacks), 2)
+
+        with self.assertRaises(InvalidMessageError):
+            rpc.send_many(msgs, [r_cb])
+
+        with self.assertRaises(InvalidMessageError):
+            rpc.send_many([m_not], [r_cb])
+
+        with self.assertRaises(InvalidMessageError):
+            rpc.send_many([None])
+
     # noinspection PyProtectedMember
     def test_message_callback(self):
         rpc = MsgpackRpc()
@@ -121,3 +167,190 @@ class MsgpackRpcTest(unittest.TestCase):
         response.error = [404, "Unrelated"]
         with self.assertRaises(KeyError):
             rpc._handle_response(response)
+
+    def test_send_concurrent_no_lost_responses(self):
+        rpc = MsgpackRpc()
+        con_send_mock = mocks.rpc_connection_send(rpc)
+        # start close to the wrap around to make sure it is handled
+        rpc._msgids._next = MRequest._max_message_id - 100
+
+        threads = 16
+        calls = 500
+        received = []
+        received_lock = threading.Lock()
+
+        def callback(msg):
+            with received_lock:
+                received.append(msg.response[0])
+
+        # half of the requests are answered while others are still sent
+        def respond(data):
+            unpacked = msgpack.unpackb(data, raw=True)
+            if unpacked[3][0] % 2 == 0:
+                rsp = MResponse(unpacked[1])
+                rsp.response = unpacked[3]
+                rpc._message_callback(rsp.pack())
+
+        con_send_mock.side_effect = respond
+
+        def send_many(offset):
+            for i in range(calls):
+                msg = MRequest()
+                msg.function = "run"
+                msg.arguments = [offset * calls + i]
+                rpc.send(msg, callback)
+
+        workers = [threading.Thread(target=send_many, args=(t, ))
+                   for t in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+        # every outstanding request has its own id
+        self.assertEqual(len(rpc._response_callbacks), threads * calls // 2)
+
+        for data in [c[0][0] for c in con_send_mock.call_args_list]:
+            unpacked = msgpack.unpackb(data, raw=True)
+            if unpacked[3][0] % 2 == 1:
+                rsp = MResponse(unpacked[1])
+                rsp.response = unpacked[3]
+                rpc._message_callback(rsp.pack())
+
+        self.assertEqual(sorted(received), list(range(threads * calls)))
+        self.assertEqual(rpc._response_callbacks, {})
+
+    def test_message_callback_dispatch_pool(self):
+        rpc = MsgpackRpc(dispatch_workers=2, dispatch_queue_size=16)
+        rpc._dispatch_pool.start()
+        mock_send = mocks.rpc_send(rpc)
+
+        release = threading.Event()
+        handled = []
+
+        def slow_run(msg):
+            release.wait()
+            handled.append(msg.arguments)
+            return None, []
+
+        rpc.register_function(slow_run, "run")
+
+        m_req = MRequest()
+        m_req.function = "run"
+        m_req.arguments = [1]
+
+        # the listener returns while the request is still being handled
+        rpc._message_callback(m_req.pack())
+        self.assertEqual(handled, [])
+
+        notified = threading.Event()
+        rpc.register_function(lambda msg: notified.set(), "broadcast")
+
+        def worker(msg):
+            received = Message.from_unpacked(
+                msgpack.unpackb(msg.pack(), raw=True))
+            return hash(rpc._dispatch_key(received)) % 2
+
+        # notifications are still handled by the other worker
+        m_not = next(m for m in (MNotify("event" + str(i), [[], {}])
+                                 for i in range(100))
+                     if worker(m) != worker(m_req))
+        rpc._message_callback(m_not.pack())
+        self.assertTrue(notified.wait(timeout=5))
+
+        release.set()
+        rpc._dispatch_pool.stop()
+        self.assertEqual(handled, [[1]])
+        self.assertEqual(mock_send.call_args[0][0].get_msgid(),
+                         m_req.get_msgid())
+
+    def test_message_callback_dispatch_pool_event_order(self):
+        rpc = MsgpackRpc(dispatch_workers=4, dispatch_queue_size=16)
+        rpc._dispatch_pool.start()
+
+        events = []
+        rpc.register_function(lambda msg: events.append(msg.arguments[0]),
+                              "broadcast")
+
+        # events with the same name are handled in order, whatever their
+        # arguments are
+        rpc._message_callback(b"".join(MNotify("myevent", [i, []]).pack()
+                                       for i in range(8)))
+        rpc._dispatch_pool.stop()
+        self.assertEqual(events, list(range(8)))
+
+    def test_message_callback_dispatch_pool_response_lane(self):
+        rpc = MsgpackRpc(dispatch_workers=4, dispatch_queue_size=16)
+        rpc._dispatch_pool.start()
+        mocks.rpc_send(rpc)
+
+        handled = []
+        rpc.register_function(
+            lambda msg: handled.append("result") or (None, []), "result",
+            with_responses=True)
+
+        m_req = MRequest()
+        m_req.function = "run"
+        m_req.arguments = []
+        msgid = rpc.register_response_callback(
+            m_req, lambda msg: handled.append("response"))
+
+        def worker(key):
+            return hash(key) % 4
+
+        # a slow callback keeps the workers of the response busy
+        release = threading.Event()
+        for key in [msgid, MsgpackRpc._response_lane]:
+            rpc._dispatch_pool.submit(key, release.wait)
+
+        m_rsp = MResponse(msgid)
+        m_rsp.response = [1]
+        m_res = MRequest()
+        m_res.function = "result"
+        m_res.arguments = [[1], [42]]
+        m_res._msgid = next(
+            i for i in range(100) if worker(i) not in
+            [worker(msgid), worker(MsgpackRpc._response_lane)])
+
+        # the result request doesn't overtake the response it refers to
+        rpc._message_callback(m_rsp.pack() + m_res.pack())
+        release.set()
+        rpc._dispatch_pool.stop()
+        self.assertEqual(handled, ["response", "result"])
+
+    def test_message_callback_while_closing(self):
+        rpc = MsgpackRpc()
+        con_send_mock = mocks.rpc_connection_send(rpc)
+        con_send_mock.side_effect = BrokenPipeError("Connection is closing")
+
+        m_req = MRequest()
+        m_req.function = "run"
+        m_req.arguments = []
+
+        # responses are dropped, the listener keeps running
+        for handler in [lambda msg: (None, []), Mock(side_effect=Exception)]:
+            rpc.register_function(handler, "run")
+            rpc._message_callback(m_req.pack())
+        rpc._message_callback(b"\x93\x00\x01\x02")  # invalid message
+        self.assertEqual(con_send_mock.call_count, 3)
+
+    def test_message_callback_decoded(self):
+        rpc = MsgpackRpc(raw=False)
+        mocks.rpc_send(rpc)
+
+        dispatch = mocks.rpc_dispatch(rpc, "r\u00fcn")
+        dispatch.return_value = (None, [])
+        m_req = MRequest()
+        m_req.function = "r\u00fcn"
+        m_req.arguments = ["str", b'bytes']
+
+        rpc._message_callback(m_req.pack())
+        dispatch.assert_called_once_with(m_req)
+        self.assertEqual(dispatch.call_args[0][0].arguments, ["str", b'bytes'])
+
+        # invalid UTF-8 does not break the following messages
+        handle_notify = mocks.rpc_handle_notify(rpc)
+        m_not = MNotify("test", [])
+        rpc._message_callback(b'\x93\x02\xa2\xff\xfe\x90' + m_not.pack())
+        self.assertEqual(handle_notify.call_count, 2)
+        handle_notify.assert_called_with(m_not)
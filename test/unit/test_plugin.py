@@ -17,13 +17,19 @@ see <http://www.gnu.org/licenses/>.
 
 """
 
+import asyncio
+import ctypes
+import threading
+import time
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, ANY
 
 import test.mocks as mocks
 from splonebox.api.plugin import Plugin
-from splonebox.api.core import Core
+from splonebox.api.core import Core, CoreError
+from splonebox.api.response import Response
 from splonebox.api.remotefunction import RemoteFunction
+from splonebox.api.cancellation import CancellationToken
 from splonebox.rpc.message import MRequest
 
 
@@ -60,7 +66,10 @@ class PluginTest(unittest.TestCase):
 
         mock = Mock()
         mock.__name__ = "foo"
-        mock.return_value = "return"
+        mock.convert.side_effect = tuple
+        mock.call_converted.return_value = "return"
+        mock.is_coroutine = False
+        mock.batch_size = None
         plug.functions["foo"] = mock
         plug.function_meta["foo"] = (["", []])
 
@@ -69,10 +78,10 @@ class PluginTest(unittest.TestCase):
         msg.arguments = [[None, 123], b'foo', [1, 1.1, "hi"]]
 
         error, response = plug._handle_run(msg)
-        self.assertIsNotNone(plug._active_threads.get(123))
-
-        plug._active_threads.pop(123).join()
-        mock.assert_called_with([1, 1.1, "hi"])
+        self.assertTrue(plug.wait_for_calls(5))
+        # finished calls are not tracked
+        self.assertEqual(plug.active_calls(), [])
+        mock.call_converted.assert_called_with((1, 1.1, "hi"), token=ANY)
         # request was valid  + 1x result
         self.assertEqual(send.call_count, 1)
         self.assertEqual(send.call_args_list[0][0][0].arguments[0][0], 123)
@@ -89,8 +98,7 @@ class PluginTest(unittest.TestCase):
         # request was invalid -> error response
         self.assertEqual(error, [404, "Function does not exist!"])
         self.assertIsNone(response)
-        with self.assertRaises(KeyError):
-            plug._active_threads[123]
+        self.assertEqual(plug.active_calls(), [])
 
         send.reset_mock()  # reset call count
         msg.arguments = [None, b'mock', [1, 1.1, "hi"]]
@@ -98,6 +106,305 @@ class PluginTest(unittest.TestCase):
         # request was invalid -> error response
         self.assertEqual(error, [400, "Message is not a valid run call"])
         self.assertIsNone(response)
+        self.assertEqual(plug.active_calls(), [])
+
+    def test_10_handle_run_type_error(self):
+        @RemoteFunction
+        def add(a: ctypes.c_int64, b: ctypes.c_int64):
+            return a + b
+
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core)
+        send = mocks.core_rpc_send(core)
+
+        # type mismatches are reported to the caller instead of a log
+        msg = MRequest()
+        msg.function = "run"
+        msg.arguments = [[None, 123], b'add', [1, b"2"]]
+        error, response = plug._handle_run(msg)
+        self.assertEqual(error[0], 400)
+        self.assertIn("argument 1 (b)", error[1])
+        self.assertIsNone(response)
+        self.assertEqual(plug.active_calls(), [])
+        self.assertEqual(send.call_count, 0)
+
+    def test_11_handle_run_in_process(self):
+        @RemoteFunction.in_process(processes=1)
+        def square(x: ctypes.c_int64):
+            return x * x
+
+        self.addCleanup(square.close_pool)
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core)
+        send = mocks.core_rpc_send(core)
+
+        msg = MRequest()
+        msg.function = "run"
+        msg.arguments = [[None, 123], b'square', [7]]
+        self.assertEqual(plug._handle_run(msg), (None, [123]))
+        self.assertTrue(plug.wait_for_calls(10))
+
+        # the result is sent by the plugin's process
+        self.assertEqual(send.call_args[0][0].arguments, [[123], [49]])
+
+    def test_12_handle_run_coroutine(self):
+        @RemoteFunction
+        async def fetch(x: ctypes.c_int64):
+            await asyncio.sleep(0.01)
+            return x + 1
+
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core, max_workers=1)
+        send = mocks.core_rpc_send(core)
+
+        msg = MRequest()
+        msg.function = "run"
+        for call_id in range(100):
+            msg.arguments = [[None, call_id], b'fetch', [call_id]]
+            self.assertEqual(plug._handle_run(msg), (None, [call_id]))
+
+        self.assertTrue(plug.wait_for_calls(10))
+        # coroutines don't occupy the workers of the run pool
+        self.assertEqual(plug._pool._threads, [])
+        results = sorted(c[0][0].arguments for c in send.call_args_list)
+        self.assertEqual(results, [[[i], [i + 1]] for i in range(100)])
+
+    def test_12_coroutine_result_sent_off_loop(self):
+        @RemoteFunction
+        async def fetch(x: ctypes.c_int64):
+            await asyncio.sleep(0.01 * x)
+            return x
+
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core)
+        release = threading.Event()
+        sent = []
+
+        def send(msg, response_callback=None):
+            # the first result is stuck in a slow socket write
+            if msg.arguments[0] == [1]:
+                release.wait(5)
+            sent.append(msg.arguments[0][0])
+
+        core._rpc.send = send
+
+        msg = MRequest()
+        msg.function = "run"
+        for call_id in [1, 2]:
+            msg.arguments = [[None, call_id], b'fetch', [call_id]]
+            plug._handle_run(msg)
+
+        # the other coroutine isn't blocked by the write
+        for _ in range(500):
+            if sent:
+                break
+            time.sleep(0.01)
+        self.assertEqual(sent, [2])
+        release.set()
+        self.assertTrue(plug.wait_for_calls(5))
+        self.assertEqual(sent, [2, 1])
+
+    def test_13_handle_run_batched(self):
+        batches = []
+
+        @RemoteFunction.batched(max_size=4, max_wait=0.5)
+        def double(x: ctypes.c_int64, name: ctypes.c_char_p):
+            batches.append(list(x))
+            return [[n, i * 2] for i, n in zip(x, name)]
+
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core)
+        send = mocks.core_rpc_send(core)
+
+        msg = MRequest()
+        msg.function = "run"
+        for call_id in range(10):
+            msg.arguments = [[None, call_id], b'double', [call_id, b"x"]]
+            self.assertEqual(plug._handle_run(msg), (None, [call_id]))
+
+        # invalid arguments are rejected before batching
+        msg.arguments = [[None, 10], b'double', ["1", b"x"]]
+        error, response = plug._handle_run(msg)
+        self.assertEqual(error[0], 400)
+        self.assertIn("argument 0 (x)", error[1])
+
+        self.assertTrue(plug.wait_for_calls(5))
+        self.assertEqual(plug.active_calls(), [])
+        # two full batches, the rest is sent after max_wait
+        self.assertEqual(batches, [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]])
+        results = sorted(c[0][0].arguments for c in send.call_args_list)
+        self.assertEqual(results, [[[i], [["x", i * 2]]] for i in range(10)])
+
+    def test_14_handle_cancel(self):
+        started = threading.Event()
+        calls = []
+
+        @RemoteFunction
+        def scan(n: ctypes.c_int64, *, cancel: CancellationToken):
+            calls.append(n)
+            started.set()
+            while True:
+                cancel.raise_if_cancelled()
+                cancel.wait(0.01)
+
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core, max_workers=1)
+        send = mocks.core_rpc_send(core)
+
+        msg = MRequest()
+        msg.function = "run"
+        msg.arguments = [[None, 1], b'scan', [1]]
+        plug._handle_run(msg)
+        self.assertTrue(started.wait(5))
+        msg.arguments = [[None, 2], b'scan', [2]]
+        plug._handle_run(msg)  # waits for the worker
+
+        cancel = MRequest()
+        cancel.function = "cancel"
+        cancel.arguments = [[None, 2]]
+        self.assertEqual(plug._handle_cancel(cancel), (None, []))
+        cancel.arguments = [[None, 1]]
+        self.assertEqual(plug._handle_cancel(cancel), (None, []))
+
+        self.assertTrue(plug.wait_for_calls(5))
+        # the waiting call never ran, no results were sent
+        self.assertEqual(calls, [1])
+        send.assert_not_called()
+        self.assertEqual(plug._tokens, {})
+
+        self.assertEqual(plug._handle_cancel(cancel),
+                         ([404, "Call id does not match any call"], None))
+        cancel.arguments = [[None, "1"]]
+        self.assertEqual(plug._handle_cancel(cancel),
+                         ([400, "Message is not a valid cancel call"], None))
+
+    def test_15_handle_run_deadline(self):
+        calls = []
+        remaining = []
+
+        @RemoteFunction
+        def fun(n: ctypes.c_int64, *, cancel: CancellationToken):
+            calls.append(n)
+            remaining.append(cancel.remaining())
+            return n
+
+        @RemoteFunction
+        async def slow(n: ctypes.c_int64):
+            calls.append(n)
+            await asyncio.sleep(10)
+
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core)
+        send = mocks.core_rpc_send(core)
+
+        msg = MRequest()
+        msg.function = "run"
+        # the caller doesn't wait anymore, the call isn't executed
+        msg.arguments = [[None, 1], b'fun', [1], 0]
+        self.assertEqual(plug._handle_run(msg), (None, [1]))
+        msg.arguments = [[None, 2], b'fun', [2], 10]
+        self.assertEqual(plug._handle_run(msg), (None, [2]))
+        # coroutines are cancelled at the deadline
+        msg.arguments = [[None, 3], b'slow', [3], 0.05]
+        self.assertEqual(plug._handle_run(msg), (None, [3]))
+
+        self.assertTrue(plug.wait_for_calls(5))
+        self.assertEqual(sorted(calls), [2, 3])
+        self.assertTrue(0 < remaining[0] <= 10)
+        self.assertEqual([c[0][0].arguments for c in send.call_args_list],
+                         [[[2], [2]]])
+        self.assertEqual(plug._tokens, {})
+
+    def test_16_drain(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        @RemoteFunction
+        def work(n: ctypes.c_int64):
+            started.set()
+            release.wait(5)
+            return n
+
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core)
+        send = mocks.core_rpc_send(core)
+        core._rpc.disconnect = Mock()
+
+        msg = MRequest()
+        msg.function = "run"
+        msg.arguments = [[None, 1], b'work', [1]]
+        plug._handle_run(msg)
+        self.assertTrue(started.wait(5))
+
+        # the call is still running
+        self.assertFalse(plug.drain(0.01))
+        # new calls are rejected
+        msg.arguments = [[None, 2], b'work', [2]]
+        self.assertEqual(plug._handle_run(msg),
+                         ([503, "Plugin is shutting down"], None))
+
+        threading.Timer(0.05, release.set).start()
+        core.disconnect(drain_timeout=5)
+
+        # the result was sent before the connection was closed
+        send.assert_called_once()
+        self.assertEqual(send.call_args[0][0].arguments, [[1], [1]])
+        flush_timeout = core._rpc.disconnect.call_args[0][0]
+        self.assertTrue(0 < flush_timeout < 5)
+        self.assertFalse(core.connected)
+
+        # draining is terminal
+        connect = mocks.core_rpc_connect(core)
+        with self.assertRaises(CoreError):
+            core.connect("localhost", 6666)
+        connect.assert_not_called()
+
+    def test_17_drain_pending_requests(self):
+        core = Core()
+        core._rpc.disconnect = Mock()
+        mocks.core_rpc_send(core)
+
+        # a request of the core that is never answered
+        response = Response()
+        core._responses_pending[1] = response
+        start = time.monotonic()
+        with self.assertLogs(level="WARNING"):
+            core.disconnect(drain_timeout=0.05)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        core._rpc.disconnect.assert_called_once_with(0)
+
+        # without a timeout the connection is closed at once
+        core._rpc.disconnect.reset_mock()
+        core.disconnect()
+        core._rpc.disconnect.assert_called_once_with()
+
+    def test_20_handle_run_queue_full(self):
+        core = Core()
+        plug = Plugin("foo", "bar", "bob", "alice", core, max_workers=1,
+                      queue_size=1)
+        mocks.core_rpc_send(core)
+
+        started = threading.Event()
+        release = threading.Event()
+        plug.functions["foo"] = Mock(is_coroutine=False, batch_size=None)
+        plug.functions["foo"].convert.side_effect = tuple
+        plug.functions["foo"].call_converted.side_effect = \
+            lambda args, token: started.set() or release.wait()
+
+        msg = MRequest()
+        msg.function = "run"
+        msg.arguments = [[None, 1], b'foo', []]
+        self.assertEqual(plug._handle_run(msg), (None, [1]))
+        self.assertTrue(started.wait(5))
+
+        # the worker is busy, one call may wait
+        msg.arguments = [[None, 2], b'foo', []]
+        self.assertEqual(plug._handle_run(msg), (None, [2]))
+
+        msg.arguments = [[None, 3], b'foo', []]
+        self.assertEqual(plug._handle_run(msg),
+                         ([503, "Too many pending run calls"], None))
+        self.assertEqual(sorted(plug.active_calls()), [1, 2])
 
-        with self.assertRaises(KeyError):
-            plug._active_threads[123]
+        release.set()
+        self.assertTrue(plug.wait_for_calls(5))
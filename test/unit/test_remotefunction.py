@@ -18,10 +18,14 @@ see <http://www.gnu.org/licenses/>.
 """
 
 import ctypes
+import os
 import unittest
 from unittest.mock import Mock
 
-from splonebox.api.remotefunction import RemoteFunction
+from splonebox.api.core import Core
+from splonebox.api.plugin import Plugin
+from splonebox.api.remotefunction import RemoteFunction, _run_imported
+from splonebox.api.cancellation import CancellationToken
 
 
 class RemoteFunctionTest(unittest.TestCase):
@@ -45,6 +49,10 @@ class RemoteFunctionTest(unittest.TestCase):
             """Some Docstring"""
             pass
 
+        @RemoteFunction
+        def fun6(a: list, b: dict):
+            pass
+
         with self.assertRaises(TypeError):
             @RemoteFunction
             def fun4(a, b):
@@ -69,6 +77,8 @@ class RemoteFunctionTest(unittest.TestCase):
         self.assertEqual(fun3.__doc__, "Some Docstring")
         self.assertEqual(fun3.args, [])
 
+        self.assertEqual(fun6.args, [[], {}])
+
     def test_call(self):
         @RemoteFunction
         def fun2(a: ctypes.c_bool, b: ctypes.c_byte, c: ctypes.c_uint64, d:
@@ -82,3 +92,196 @@ class RemoteFunctionTest(unittest.TestCase):
 
         with self.assertRaises(TypeError):
             fun2([0])
+
+        # strings decoded by the unpacker are passed on
+        fun2([True, b'', 0, -1, 0.0, '\u00e4', -1])
+        fun2.fun.assert_called_with(True, b'', 0, -1, 0.0, '\u00e4', -1)
+
+    def test_call_does_not_modify_args(self):
+        @RemoteFunction
+        def fun(a: ctypes.c_char_p, b: ctypes.c_double):
+            pass
+
+        fun.fun = Mock()
+        args = [b'foo', 1]
+        fun(args)
+        fun.fun.assert_called_with("foo", 1.0)
+        self.assertEqual(args, [b'foo', 1])
+
+    def test_call_type_errors(self):
+        @RemoteFunction
+        def fun(a: ctypes.c_int64, b: ctypes.c_char_p, c: list):
+            pass
+
+        fun.fun = Mock()
+
+        # subclasses are accepted
+        class Int(int):
+            pass
+
+        fun([Int(1), "b", []])
+        fun.fun.assert_called_with(1, "b", [])
+
+        for args, message in [([1, "b"], "fun() takes 3 arguments (2 given)"),
+                              ([True, "b", []], "argument 0 (a)"),
+                              ([1.0, "b", []], "argument 0 (a)"),
+                              ([1, 2, []], "argument 1 (b)"),
+                              ([1, b"\xff", []], "argument 1 (b)"),
+                              ([1, "b", {}], "argument 2 (c)")]:
+            with self.assertRaises(TypeError) as cm:
+                fun(args)
+            self.assertIn(message, str(cm.exception))
+
+    def test_coroutine(self):
+        @RemoteFunction
+        async def fun(a: ctypes.c_char_p):
+            return a
+
+        @RemoteFunction
+        def sync():
+            pass
+
+        self.assertTrue(fun.is_coroutine)
+        self.assertFalse(sync.is_coroutine)
+
+        coroutine = fun([b"foo"])
+        with self.assertRaises(StopIteration) as cm:
+            coroutine.send(None)
+        self.assertEqual(cm.exception.value, "foo")
+
+        with self.assertRaises(TypeError):
+            @RemoteFunction.in_process()
+            async def fun2():
+                pass
+
+    def test_call_without_args(self):
+        @RemoteFunction
+        def fun():
+            return 42
+
+        self.assertEqual(fun([]), 42)
+        with self.assertRaises(TypeError):
+            fun([1])
+
+    def test_batched(self):
+        @RemoteFunction.batched(max_size=8, max_wait=0.1)
+        def add(a: ctypes.c_int64, b: ctypes.c_double):
+            return [x + y for x, y in zip(a, b)]
+
+        self.assertEqual((add.batch_size, add.batch_wait), (8, 0.1))
+        self.assertEqual(add.args, [-1, 2.0])
+
+        calls = [add.convert([1, 2]), add.convert([3, 4.5])]
+        self.assertEqual(calls, [(1, 2.0), (3, 4.5)])
+        self.assertEqual(add.call_batch(calls), [3.0, 7.5])
+
+        @RemoteFunction.batched(max_size=8)
+        def wrong(a: ctypes.c_int64):
+            return a[1:]
+
+        with self.assertRaises(ValueError):
+            wrong.call_batch([(1, ), (2, )])
+
+        with self.assertRaises(TypeError):
+            @RemoteFunction.batched(max_size=8)
+            async def fun():
+                pass
+
+        with self.assertRaises(ValueError):
+            RemoteFunction.batched(max_size=0)(lambda: None)
+
+    def test_cancellation_token(self):
+        @RemoteFunction
+        def fun(a: ctypes.c_int64, *, cancel: CancellationToken):
+            return a, cancel
+
+        # the token isn't a registered argument
+        self.assertEqual(fun.args, [-1])
+
+        token = CancellationToken()
+        self.assertEqual(fun([1], token=token), (1, token))
+        self.assertIsInstance(fun([1])[1], CancellationToken)
+
+        with self.assertRaises(TypeError):
+            @RemoteFunction.batched(max_size=2)
+            def fun2(*, cancel: CancellationToken):
+                pass
+
+        with self.assertRaises(TypeError):
+            @RemoteFunction.in_process()
+            def fun3(*, cancel: CancellationToken):
+                pass
+
+
+_warm_state = {}
+
+
+def _warm_up(value):
+    _warm_state["value"] = value
+
+
+class ProcessPoolTest(unittest.TestCase):
+    def setUp(self):
+        # cleanup remote_functions
+        RemoteFunction.remote_functions = []
+
+    def test_in_process(self):
+        @RemoteFunction.in_process(processes=2, initializer=_warm_up,
+                                   initargs=(42, ))
+        def fun(a: ctypes.c_int64, b: ctypes.c_char_p):
+            return [os.getpid(), _warm_state.get("value"), a, b]
+
+        self.addCleanup(fun.close_pool)
+        self.assertTrue(fun.process_pool)
+        self.assertIn(fun, RemoteFunction.remote_functions)
+        self.assertEqual(fun.args, [-1, ""])
+
+        pid, value, a, b = fun([1, b"foo"])
+        self.assertNotEqual(pid, os.getpid())
+        self.assertEqual([value, a, b], [42, 1, "foo"])
+
+        # arguments are checked before they are sent to the process
+        with self.assertRaises(TypeError):
+            fun(["a", b"foo"])
+
+    def test_in_process_memoryview(self):
+        def fun(data: ctypes.c_byte):
+            return data
+
+        fun = RemoteFunction(fun, True, processes=1)
+        self.addCleanup(fun.close_pool)
+
+        # arguments attached from shared memory are copied to the process
+        self.assertEqual(fun([memoryview(b"data")]), b"data")
+        self.assertEqual(fun.call_batch([(memoryview(b"a"), ),
+                                         (b"b", )]), [b"a", b"b"])
+
+    def test_pool_started_by_plugin(self):
+        @RemoteFunction.in_process(processes=1)
+        def fun():
+            return os.getpid()
+
+        self.addCleanup(fun.close_pool)
+        self.assertIsNone(fun._pool)
+
+        # workers are forked before the plugin's threads exist
+        Plugin("foo", "bar", "bob", "alice", Core())
+        self.assertIsNotNone(fun._pool)
+        self.assertNotEqual(fun([]), os.getpid())
+
+    def test_run_imported(self):
+        # spawned workers import the function
+        _run_imported(__name__, "_warm_up", (7, ))
+        self.assertEqual(_warm_state["value"], 7)
+
+    def test_in_process_exception(self):
+        @RemoteFunction.in_process(processes=1)
+        def fail():
+            raise ValueError("failed")
+
+        self.addCleanup(fail.close_pool)
+        with self.assertRaises(ValueError):
+            fail([])
+
+        fail.close_pool()
+        self.assertIsNone(fail._pool)
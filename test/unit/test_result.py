@@ -17,8 +17,13 @@ see <http://www.gnu.org/licenses/>.
 
 """
 
+import concurrent.futures
+import threading
+import time
 import unittest
 
+from splonebox.api.response import Response, wait, as_completed, \
+    FIRST_COMPLETED, FIRST_EXCEPTION
 from splonebox.api.result import RemoteError, RunResult
 
 
@@ -50,3 +55,139 @@ class ResultTest(unittest.TestCase):
         self.assertEqual(res.get_status(), -1)
 
         pass
+
+    def test_cancel(self):
+        cancelled = []
+
+        # cancelled before the response arrived
+        res = RunResult(cancelled.append)
+        self.assertTrue(res.cancel())
+        self.assertTrue(res.cancelled())
+        self.assertEqual(res.get_status(), -1)
+        with self.assertRaises(RemoteError) as cm:
+            res.get_result()
+        self.assertEqual(cm.exception.errno, 499)
+        self.assertEqual(cancelled, [res])
+
+        # the canceller is called again once the call id is known
+        res.set_id(1)
+        self.assertEqual(cancelled, [res, res])
+        self.assertFalse(res.cancel())
+
+        # a result can't be cancelled
+        res = RunResult(cancelled.append)
+        res.set_id(2)
+        res.set_result([0])
+        self.assertFalse(res.cancel())
+        self.assertFalse(res.cancelled())
+        self.assertEqual(res.get_result(), [0])
+
+    def test_timeout(self):
+        res = RunResult()
+        with self.assertRaises(TimeoutError):
+            res.get_result(timeout=0.01)
+        with self.assertRaises(TimeoutError):
+            res.get_result(deadline=time.monotonic() - 1)
+
+        # the deadline of the call ends waiting
+        res.deadline = time.monotonic() + 0.01
+        with self.assertRaises(TimeoutError):
+            res.get_result()
+        with self.assertRaises(TimeoutError):
+            res.get_result(timeout=10)
+
+        res.set_result([1])
+        self.assertEqual(res.get_result(timeout=0), [1])
+
+        response = Response()
+        with self.assertRaises(TimeoutError):
+            response.await_response(timeout=0.01)
+        with self.assertRaises(TimeoutError):
+            response.await_response(deadline=time.monotonic() + 0.01)
+        response.success()
+        response.await_response(timeout=0)
+
+    def test_done_callbacks(self):
+        res = RunResult()
+        done = []
+        res.add_done_callback(done.append)
+        res.add_done_callback(lambda r: 1 / 0)  # failures are logged
+        self.assertFalse(res.done())
+
+        res.set_result([1])
+        res.set_result([2])  # callbacks are only called once
+        self.assertTrue(res.done())
+        self.assertEqual(done, [res])
+
+        # called at once on completed results
+        res.add_done_callback(done.append)
+        self.assertEqual(done, [res, res])
+
+        response = Response()
+        response.add_done_callback(done.append)
+        response.set_error([404, "not found"])
+        self.assertEqual(done[-1], response)
+
+    def test_future(self):
+        res = RunResult()
+        future = res.future()
+        self.assertIs(res.future(), future)
+        self.assertFalse(future.done())
+        res.set_result([1])
+        self.assertEqual(future.result(0), [1])
+
+        res = RunResult()
+        res.set_error([404, "not found"])
+        self.assertIsInstance(res.future().exception(0), RemoteError)
+
+        response = Response()
+        response.success()
+        self.assertIsNone(response.future().result(0))
+
+        # cancelling the future cancels the call
+        cancelled = []
+        res = RunResult(cancelled.append)
+        self.assertTrue(res.future().cancel())
+        self.assertTrue(res.cancelled())
+        self.assertEqual(cancelled, [res])
+
+    def test_wait(self):
+        results = [RunResult() for _ in range(1000)]
+
+        def complete():
+            for i, res in enumerate(results):
+                if i == 500:
+                    res.set_error([500, "failed"])
+                else:
+                    res.set_result(i)
+
+        threading.Thread(target=complete).start()
+        done, not_done = wait(results, timeout=10)
+        self.assertEqual(len(done), 1000)
+        self.assertEqual(not_done, set())
+
+        pending = RunResult()
+        done, not_done = wait(results[:10] + [pending],
+                              return_when=FIRST_COMPLETED)
+        self.assertEqual(not_done, {pending})
+        done, not_done = wait(results[495:505] + [pending],
+                              return_when=FIRST_EXCEPTION)
+        self.assertIn(results[500], done)
+        self.assertEqual(not_done, {pending})
+
+        done, not_done = wait([pending], timeout=0.01)
+        self.assertEqual(not_done, {pending})
+
+    def test_as_completed(self):
+        results = [RunResult() for _ in range(3)]
+        results[1].set_result(1)
+
+        completed = as_completed(results, timeout=10)
+        self.assertIs(next(completed), results[1])
+        threading.Thread(target=results[2].set_result, args=(2, )).start()
+        self.assertIs(next(completed), results[2])
+        results[0].set_result(0)
+        self.assertEqual(list(completed), [results[0]])
+
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            list(as_completed([RunResult()], timeout=0.01))
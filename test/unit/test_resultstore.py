@@ -0,0 +1,181 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+import gc
+import time
+import unittest
+
+from splonebox.api.apicall import ApiResult
+from splonebox.api.core import Core
+from splonebox.api.result import RunResult
+from splonebox.api.resultstore import ResultStore
+from splonebox.api.response import RemoteError
+from splonebox.api.stream import pack_chunk
+from splonebox.rpc.message import MResponse
+from test import mocks
+
+
+class ResultStoreTest(unittest.TestCase):
+    def test_add_get_pop(self):
+        store = ResultStore()
+        result = RunResult()
+        store.add(1, result)
+        self.assertIs(store.get(1), result)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.values(), [result])
+
+        self.assertIs(store.pop(1), result)
+        self.assertIsNone(store.pop(1))
+        with self.assertRaises(KeyError):
+            store.get(1)
+
+    def test_max_size(self):
+        store = ResultStore(max_size=2)
+        results = [RunResult() for _ in range(3)]
+        for call_id, result in enumerate(results):
+            store.add(call_id, result)
+
+        # the oldest result was evicted, its caller doesn't wait forever
+        self.assertEqual(len(store), 2)
+        with self.assertRaises(KeyError):
+            store.get(0)
+        with self.assertRaises(RemoteError) as cm:
+            results[0].get_result()
+        self.assertEqual(cm.exception.errno, 408)
+        self.assertEqual(store.stats()["evicted_full"], 1)
+
+        with self.assertRaises(ValueError):
+            ResultStore(max_size=0)
+
+    def test_ttl(self):
+        store = ResultStore(ttl=0.05)
+        old = RunResult()
+        store.add(1, old)
+        time.sleep(0.06)
+
+        # expired results are evicted on access and when adding
+        with self.assertRaises(KeyError):
+            store.get(1)
+        store.add(2, RunResult())
+        store.add(3, RunResult())
+        time.sleep(0.06)
+        store.add(4, RunResult())
+
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.stats(), {"size": 1, "evicted_expired": 3,
+                                         "evicted_full": 0, "collected": 0})
+        self.assertEqual(old.get_status(), -1)
+
+    def test_ttl_timer(self):
+        store = ResultStore(ttl=0.05)
+        result = RunResult()
+        store.add(1, result)
+
+        # the waiting caller is released without further calls
+        with self.assertRaises(RemoteError) as cm:
+            result.get_result(timeout=5)
+        self.assertEqual(cm.exception.errno, 408)
+        self.assertEqual(len(store), 0)
+
+        # a stream evicted while it is received fails
+        result = RunResult()
+        store.add(2, result)
+        result.feed_chunk(0, b"a", False)
+        stream = result.get_result()
+        self.assertEqual(stream.read(1), b"a")
+        with self.assertRaises(RemoteError):
+            stream.read(1)
+
+    def test_ttl_sweeper(self):
+        store = ResultStore(ttl=0.01)
+        results = []
+        sweepers = set()
+        for call_id in range(100):
+            results.append(RunResult())
+            store.add(call_id, results[-1])
+            sweepers.add(store._sweeper)
+            time.sleep(0.001)
+
+        # one thread evicts all of them
+        self.assertEqual(len(sweepers), 1)
+        with self.assertRaises(RemoteError):
+            results[-1].get_result(timeout=5)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.stats()["evicted_expired"], 100)
+
+        # it waits for results added to the empty store
+        result = RunResult()
+        store.add(100, result)
+        with self.assertRaises(RemoteError):
+            result.get_result(timeout=5)
+        self.assertEqual(store._sweeper, sweepers.pop())
+
+    def test_weak(self):
+        store = ResultStore(weak=True)
+        kept = RunResult()
+        store.add(1, RunResult())
+        store.add(2, kept)
+        gc.collect()
+
+        self.assertIs(store.get(2), kept)
+        self.assertEqual(store.values(), [kept])
+        with self.assertRaises(KeyError):
+            store.get(1)
+        self.assertEqual(store.stats()["collected"], 1)
+
+    def test_weak_stream(self):
+        core = Core(weak_results=True)
+        result = RunResult()
+        core.result_store.add(1, result)
+        core._handle_result(ApiResult(1, pack_chunk(0, b"a", False)).msg)
+
+        # the caller only keeps the stream
+        stream = result.get_result()
+        del result
+        gc.collect()
+        self.assertEqual(core._handle_result(
+            ApiResult(1, pack_chunk(1, b"b", True)).msg), (None, [1]))
+        self.assertEqual(stream.read(), b"ab")
+        self.assertEqual(len(core.result_store), 0)
+
+    def test_core_forgets_received_results(self):
+        core = Core()
+        mocks.core_rpc_send(core)
+
+        for call_id in range(2):
+            result = RunResult()
+            core._responses_pending[call_id] = result
+            response = MResponse(call_id)
+            response.response = [call_id]
+            core._handle_run_response(response)
+        self.assertEqual(len(core.result_store), 2)
+
+        core._handle_result(ApiResult(0, 42).msg)
+        self.assertEqual(result.get_status(), 1)
+        self.assertEqual(len(core.result_store), 1)
+
+        # streamed results are kept until the last chunk arrived
+        core._handle_result(ApiResult(1, pack_chunk(0, b"a", False)).msg)
+        self.assertEqual(len(core.result_store), 1)
+        core._handle_result(ApiResult(1, pack_chunk(1, b"b", True)).msg)
+        self.assertEqual(len(core.result_store), 0)
+        self.assertEqual(result.get_result().read(), b"ab")
+
+        # results of forgotten calls are rejected
+        self.assertEqual(core._handle_result(ApiResult(0, 42).msg),
+                         ([404, "Call id does not match any call"], None))
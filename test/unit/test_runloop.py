@@ -0,0 +1,107 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from splonebox.api.runloop import RunLoop
+
+
+class RunLoopTest(unittest.TestCase):
+    def test_concurrent_calls(self):
+        runner = RunLoop()
+        results = []
+        threads = threading.active_count()
+
+        async def fun(i):
+            await asyncio.sleep(0.05)
+            results.append(i)
+
+        start = time.monotonic()
+        for i in range(1000):
+            runner.submit(i, "fun", fun, i)
+
+        self.assertTrue(runner.wait(10))
+        # the calls waited at the same time on one thread
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(sorted(results), list(range(1000)))
+        self.assertEqual(threading.active_count(), threads + 1)
+        self.assertEqual(runner.active_calls(), [])
+
+    def test_function_limits(self):
+        runner = RunLoop({"limited": 2})
+        running = [0, 0]  # current, maximum
+
+        async def fun():
+            running[0] += 1
+            running[1] = max(running)
+            await asyncio.sleep(0.01)
+            running[0] -= 1
+
+        for i in range(10):
+            runner.submit(i, "limited", fun)
+
+        self.assertTrue(runner.wait(5))
+        self.assertEqual(running[1], 2)
+
+    def test_failing_call(self):
+        runner = RunLoop()
+
+        async def fail():
+            raise RuntimeError()
+
+        runner.submit(0, "fail", fail)
+        self.assertTrue(runner.wait(5))
+        self.assertEqual(runner.active_calls(), [])
+
+    def test_wait_timeout(self):
+        runner = RunLoop()
+        release = threading.Event()
+
+        async def fun():
+            while not release.is_set():
+                await asyncio.sleep(0.01)
+
+        runner.submit(0, "fun", fun)
+        self.assertFalse(runner.wait(0.05))
+        self.assertEqual(runner.active_calls(), [0])
+        release.set()
+        self.assertTrue(runner.wait(5))
+
+    def test_cancel(self):
+        runner = RunLoop()
+        started = threading.Event()
+        cancelled = threading.Event()
+
+        async def fun():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        runner.submit(1, "fun", fun)
+        self.assertTrue(started.wait(5))
+        self.assertTrue(runner.cancel(1))
+        self.assertTrue(runner.wait(5))
+        self.assertTrue(cancelled.is_set())
+        self.assertFalse(runner.cancel(1))
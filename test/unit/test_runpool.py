@@ -0,0 +1,143 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import threading
+import time
+import unittest
+
+from splonebox.api.runpool import RunPool
+
+
+class RunPoolTest(unittest.TestCase):
+    def test_runs_calls(self):
+        pool = RunPool(max_workers=4)
+        results = []
+        for i in range(100):
+            self.assertTrue(pool.submit(i, "fun", results.append, i))
+
+        self.assertTrue(pool.wait(5))
+        self.assertEqual(sorted(results), list(range(100)))
+        self.assertEqual(pool.active_calls(), [])
+        self.assertLessEqual(len(pool._threads), 4)
+
+    def test_max_workers(self):
+        pool = RunPool(max_workers=2)
+        lock = threading.Lock()
+        running = [0, 0]  # current, maximum
+
+        def fun():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        for i in range(10):
+            pool.submit(i, "fun", fun)
+
+        self.assertTrue(pool.wait(5))
+        self.assertEqual(running[1], 2)
+
+    def test_queue_size(self):
+        pool = RunPool(max_workers=1, queue_size=2)
+        release = threading.Event()
+
+        self.assertTrue(pool.submit(0, "fun", release.wait))
+        # wait until the worker picked the first call
+        while pool._running == 0:
+            time.sleep(0.001)
+
+        self.assertTrue(pool.submit(1, "fun", release.wait))
+        self.assertTrue(pool.submit(2, "fun", release.wait))
+        self.assertFalse(pool.submit(3, "fun", release.wait))
+        self.assertEqual(sorted(pool.active_calls()), [0, 1, 2])
+
+        release.set()
+        self.assertTrue(pool.wait(5))
+        self.assertTrue(pool.submit(4, "fun", release.wait))
+        self.assertTrue(pool.wait(5))
+
+    def test_function_limits(self):
+        pool = RunPool(max_workers=4, function_limits={"slow": 1})
+        release = threading.Event()
+        order = []
+
+        def slow(i):
+            release.wait()
+            order.append(i)
+
+        pool.submit(0, "slow", slow, 0)
+        pool.submit(1, "slow", slow, 1)
+        pool.submit(2, "fast", order.append, 2)
+
+        # the second slow call is held back, the fast one isn't blocked
+        self.assertFalse(pool.wait(0.1))
+        self.assertEqual(order, [2])
+        self.assertEqual(pool._scheduled, {"slow": 1})
+
+        release.set()
+        self.assertTrue(pool.wait(5))
+        self.assertEqual(order, [2, 0, 1])
+        self.assertEqual(pool._held, {})
+
+    def test_failing_call(self):
+        pool = RunPool(max_workers=1)
+
+        def fail():
+            raise RuntimeError()
+
+        pool.submit(0, "fail", fail)
+        self.assertTrue(pool.wait(5))
+        results = []
+        pool.submit(1, "fun", results.append, 1)
+        self.assertTrue(pool.wait(5))
+        self.assertEqual(results, [1])
+
+    def test_cancel(self):
+        pool = RunPool(max_workers=1, function_limits={"limited": 1})
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def block():
+            started.set()
+            release.wait()
+
+        self.assertTrue(pool.submit(1, "limited", block))
+        self.assertTrue(started.wait(5))
+        pool.submit(2, "fun", results.append, 2)  # queued
+        pool.submit(3, "limited", results.append, 3)  # held back
+        pool.submit(4, "fun", results.append, 4)
+
+        self.assertFalse(pool.cancel(1))  # running
+        self.assertTrue(pool.cancel(2))
+        self.assertTrue(pool.cancel(3))
+        self.assertFalse(pool.cancel(3))
+        self.assertEqual(sorted(pool.active_calls()), [1, 4])
+
+        release.set()
+        self.assertTrue(pool.wait(5))
+        self.assertEqual(results, [4])
+        self.assertEqual(pool._scheduled, {})
+        self.assertEqual(pool._held, {})
+
+    def test_invalid_workers(self):
+        with self.assertRaises(ValueError):
+            RunPool(max_workers=0)
@@ -0,0 +1,174 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import os
+import time
+import unittest
+
+import msgpack
+
+from splonebox.api import sharedmem
+from splonebox.api.apicall import ApiRun, ApiResult, unwrap_value
+from splonebox.api.core import Core
+from splonebox.api.plugin import Plugin
+from splonebox.api.sharedmem import SharedMemory, attach, is_shared
+from splonebox.rpc.message import InvalidMessageError
+
+
+def segments() -> set:
+    return {f for f in os.listdir(sharedmem.DIRECTORY)
+            if f.startswith("splonebox-")}
+
+
+class SharedMemoryTest(unittest.TestCase):
+    def test_share_attach(self):
+        before = segments()
+        payload = os.urandom(4096)
+        handle = SharedMemory(threshold=1024).share(payload)
+        self.assertTrue(is_shared(handle))
+        self.assertEqual(len(segments() - before), 1)
+
+        # the handle is small and survives packing
+        packed = msgpack.packb(handle, use_bin_type=True)
+        self.assertLess(len(packed), 100)
+
+        view = attach(msgpack.unpackb(packed, raw=True))
+        self.assertTrue(view.readonly)
+        self.assertEqual(view, payload)
+
+        # the segment is removed once it is attached
+        self.assertEqual(segments(), before)
+        with self.assertRaises(ValueError):
+            attach(handle)
+
+    def test_share_skipped(self):
+        shm = SharedMemory(threshold=1024)
+        for value in [b"a" * 1023, "a" * 2048, 1, [b"a" * 2048]]:
+            self.assertIs(shm.share(value), value)
+
+    def test_invalid_handles(self):
+        handle = SharedMemory(threshold=1).share(b"data")
+        size_crc = handle.data[:12]
+
+        for data in [b"", size_crc, size_crc + b"../../etc/passwd",
+                     size_crc + b"splonebox-" + b"0" * 32]:
+            with self.assertRaises(ValueError):
+                attach(msgpack.ExtType(sharedmem.SHARED_EXT, data))
+
+        # wrong checksum
+        corrupted = msgpack.ExtType(sharedmem.SHARED_EXT,
+                                    size_crc[:8] + b"\0\0\0\0" +
+                                    handle.data[12:])
+        with self.assertRaises(ValueError):
+            attach(corrupted)
+
+    def test_apicalls(self):
+        shm = SharedMemory(threshold=1024)
+        payload = b"x" * 4096
+
+        call = ApiRun("id", "fun", [payload, b"small"], shared_memory=shm)
+        self.assertTrue(is_shared(call.get_method_args()[0]))
+
+        call.msg.arguments[0] = [None, 123]
+        received = ApiRun.from_msgpack_request(call.msg, raw=False,
+                                               shared_memory=shm)
+        self.assertEqual(received.get_method_args(), [payload, b"small"])
+
+        # the segment is gone
+        with self.assertRaises(InvalidMessageError):
+            ApiRun.from_msgpack_request(call.msg, raw=False,
+                                        shared_memory=shm)
+
+        result = ApiResult(123, payload, shared_memory=shm)
+        self.assertEqual(unwrap_value(result.get_result(), shared_memory=shm),
+                         payload)
+
+    def test_rejected_handles_are_removed(self):
+        before = segments()
+        shm = SharedMemory(threshold=1024)
+        payload = b"x" * 4096
+
+        # the receiver didn't enable shared memory
+        call = ApiRun("id", "fun", [payload, payload], shared_memory=shm)
+        call.msg.arguments[0] = [None, 123]
+        for trusted in [False, True]:
+            with self.assertRaises(InvalidMessageError):
+                ApiRun.from_msgpack_request(call.msg, raw=False,
+                                            trusted=trusted)
+            self.assertEqual(segments(), before)
+
+        # the message is invalid
+        call = ApiRun("id", "fun", [payload], shared_memory=shm)
+        with self.assertRaises(InvalidMessageError):
+            ApiRun.from_msgpack_request(call.msg, raw=False,
+                                        shared_memory=shm)
+        self.assertEqual(segments(), before)
+
+        # sending failed
+        call = ApiResult(123, payload, shared_memory=shm)
+        call.release()
+        self.assertEqual(segments(), before)
+
+        # a result for an unknown call
+        core = Core(shared_memory=shm)
+        call = ApiResult(123, payload, shared_memory=shm)
+        call.msg._msgid = 1
+        error, _ = core._handle_result(call.msg)
+        self.assertEqual(error[0], 404)
+        self.assertEqual(segments(), before)
+
+        # a run call sent to a draining plugin
+        plugin = Plugin("foo", "bar", "bob", "alice", core)
+        plugin.drain(0)
+        call = ApiRun("id", "fun", [payload], shared_memory=shm)
+        call.msg.arguments[0] = [None, 123]
+        error, _ = plugin._handle_run(call.msg)
+        self.assertEqual(error[0], 503)
+        self.assertEqual(segments(), before)
+
+    def test_sender_removes_unattached_segments(self):
+        before = segments()
+        shm = SharedMemory(threshold=1, ttl=0.05)
+        handles = [shm.share(b"data"), shm.share(b"more")]
+        attach(handles[0])
+        self.assertEqual(len(segments() - before), 1)
+
+        for _ in range(100):
+            if segments() == before:
+                break
+            time.sleep(0.01)
+        self.assertEqual(segments(), before)
+        with self.assertRaises(ValueError):
+            attach(handles[1])
+
+        # the same thread removes segments shared later
+        sweeper = shm._sweeper
+        shm.share(b"later")
+        for _ in range(100):
+            if segments() == before:
+                break
+            time.sleep(0.01)
+        self.assertEqual(segments(), before)
+        self.assertIs(shm._sweeper, sweeper)
+
+        shm = SharedMemory(threshold=1)
+        shm.share(b"data")
+        self.assertEqual(shm.cleanup(), 0)
+        self.assertEqual(shm.cleanup(expired_only=False), 1)
+        self.assertEqual(segments(), before)
@@ -0,0 +1,235 @@
+"""
+This file is part of the splonebox python client library.
+
+The splonebox python client library is free software: you can
+redistribute it and/or modify it under the terms of the GNU Lesser
+General Public License as published by the Free Software Foundation,
+either version 3 of the License or any later version.
+
+It is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this splonebox python client library.  If not,
+see <http://www.gnu.org/licenses/>.
+
+"""
+
+import io
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+import msgpack
+
+from splonebox.api.core import Core
+from splonebox.api.result import RunResult, RemoteError
+from splonebox.api.stream import ResultStream, iter_chunks, pack_chunk, \
+    unpack_chunk, is_chunk, STREAM_CHUNK_EXT, ResultItems, pack_item, \
+    unpack_item, is_item, STREAM_ITEM_EXT
+
+
+class StreamTest(unittest.TestCase):
+    def test_chunk_roundtrip(self):
+        chunk = pack_chunk(7, b"data", True)
+        self.assertTrue(is_chunk(chunk))
+        self.assertEqual(chunk.code, STREAM_CHUNK_EXT)
+
+        # survives packing
+        unpacked = msgpack.unpackb(msgpack.packb(chunk, use_bin_type=True))
+        self.assertEqual(unpack_chunk(unpacked), (7, b"data", True))
+
+        self.assertFalse(is_chunk(b"data"))
+        with self.assertRaises(ValueError):
+            unpack_chunk(msgpack.ExtType(STREAM_CHUNK_EXT, b"12"))
+        with self.assertRaises(ValueError):
+            unpack_chunk(b"data")
+
+    def test_iter_chunks(self):
+        chunks = list(iter_chunks(io.BytesIO(b"abcdefg"), 3))
+        self.assertEqual(chunks, [(0, b"abc", False), (1, b"def", False),
+                                  (2, b"g", True)])
+
+        # size is a multiple of the chunk size
+        chunks = list(iter_chunks(io.BytesIO(b"abcdef"), 3))
+        self.assertEqual(chunks, [(0, b"abc", False), (1, b"def", True)])
+
+        # empty source still sends the last chunk
+        self.assertEqual(list(iter_chunks(io.BytesIO(b""), 3)),
+                         [(0, b"", True)])
+
+    def test_result_stream_reorders(self):
+        stream = ResultStream()
+        stream.feed(2, b"ghi", True)
+        stream.feed(0, b"abc", False)
+        self.assertFalse(stream.finished())
+        self.assertEqual(stream.read(2), b"ab")
+        stream.feed(1, b"def", False)
+        stream.feed(1, b"xxx", False)  # duplicate is ignored
+
+        self.assertTrue(stream.finished())
+        self.assertEqual(stream.read(), b"cdefghi")
+        self.assertEqual(stream.read(), b"")
+
+    def test_result_stream_iter_blocks(self):
+        stream = ResultStream()
+        received = []
+
+        def consume():
+            for chunk in stream:
+                received.append(chunk)
+
+        t = threading.Thread(target=consume)
+        t.start()
+        stream.feed(0, b"foo", False)
+        stream.feed(1, b"bar", True)
+        t.join(5)
+
+        self.assertFalse(t.is_alive())
+        self.assertEqual(received, [b"foo", b"bar"])
+
+    def test_result_stream_fail(self):
+        stream = ResultStream()
+        stream.feed(0, b"foo", False)
+        stream.fail(RemoteError(503, "Connection was closed"))
+        stream.feed(1, b"bar", True)  # ignored
+
+        # the received data is passed on before the error
+        self.assertEqual(stream.read(3), b"foo")
+        with self.assertRaises(RemoteError):
+            stream.read()
+        self.assertTrue(stream.finished())
+
+        items = ResultItems()
+        received = []
+
+        def consume():
+            try:
+                for item in items:
+                    received.append(item)
+            except RemoteError as e:
+                received.append(e.errno)
+
+        t = threading.Thread(target=consume)
+        t.start()
+        items.feed(0, 1, False)
+        items.fail(RemoteError(408, "Result was evicted"))
+        t.join(5)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(received, [1, 408])
+
+    def test_result_stream_deadline(self):
+        stream = ResultStream(deadline=time.monotonic() + 0.05)
+        stream.feed(0, b"foo", False)
+        self.assertEqual(stream.read(3), b"foo")
+        with self.assertRaises(TimeoutError):
+            stream.read()
+
+        res = RunResult()
+        res.deadline = time.monotonic()
+        res.feed_item(0, 1, False)
+        with self.assertRaises(TimeoutError):
+            list(res.items())
+
+        # an aborted result fails its stream
+        res = RunResult()
+        res.feed_chunk(0, b"foo", False)
+        stream = res.get_result()
+        res.abort([503, "Connection was closed"])
+        self.assertEqual(stream.read(3), b"foo")
+        with self.assertRaises(RemoteError):
+            stream.read()
+
+        res = RunResult()
+        res.abort([503, "Connection was closed"])
+        with self.assertRaises(RemoteError):
+            res.get_result()
+
+    def test_core_disconnect_fails_streams(self):
+        core = Core()
+        core._rpc.disconnect = Mock()
+        res = RunResult()
+        core.result_store.add(1, res)
+        res.feed_chunk(0, b"foo", False)
+        waiting = RunResult()
+        core.result_store.add(2, waiting)
+
+        core.disconnect()
+        stream = res.get_result()
+        self.assertEqual(stream.read(3), b"foo")
+        with self.assertRaises(RemoteError):
+            stream.read(3)
+        with self.assertRaises(RemoteError) as cm:
+            waiting.get_result()
+        self.assertEqual(cm.exception.errno, 503)
+
+    def test_run_result_feed_chunk(self):
+        res = RunResult()
+        res.set_id(1)
+        res.feed_chunk(1, b"bar", True)
+
+        # the stream is available before all chunks were received
+        stream = res.get_result(blocking=False)
+        self.assertIsInstance(stream, ResultStream)
+        self.assertEqual(res.get_status(), 2)
+
+        res.feed_chunk(0, b"foo", False)
+        self.assertIs(res.get_result(), stream)
+        self.assertEqual(stream.read(), b"foobar")
+
+    def test_item_roundtrip(self):
+        item = pack_item(3, ["foo", {"a": 1}])
+        self.assertTrue(is_item(item))
+        self.assertFalse(is_chunk(item))
+
+        unpacked = msgpack.unpackb(msgpack.packb(item, use_bin_type=True))
+        self.assertEqual(unpack_item(unpacked, raw=False),
+                         (3, ["foo", {"a": 1}], False, False))
+        self.assertEqual(unpack_item(unpacked, raw=True),
+                         (3, [b"foo", {b"a": 1}], False, False))
+
+        self.assertEqual(unpack_item(pack_item(4, None, True)),
+                         (4, None, True, True))
+
+        for invalid in [b"", b"\x00\x00\x00\x00\x00\xc1"]:
+            with self.assertRaises(ValueError):
+                unpack_item(msgpack.ExtType(STREAM_ITEM_EXT, invalid))
+
+    def test_result_items(self):
+        items = ResultItems()
+        items.feed(1, "b", False)
+        items.feed(0, "a", False)
+        items.feed(0, "x", False)  # duplicate is ignored
+        self.assertEqual(next(items), "a")
+        self.assertEqual(next(items), "b")
+
+        items.feed(3, None, True, True)
+        self.assertFalse(items.finished())
+        items.feed(2, None, False)  # None is a valid item
+        self.assertTrue(items.finished())
+        self.assertEqual(list(items), [None])
+
+    def test_run_result_items(self):
+        res = RunResult()
+        res.set_id(1)
+        res.feed_item(0, "a", False)
+
+        iterator = res.items()
+        self.assertEqual(next(iterator), "a")
+
+        def feed():
+            res.feed_item(1, "b", False)
+            res.feed_item(2, None, True, True)
+
+        t = threading.Thread(target=feed)
+        t.start()
+        self.assertEqual(list(iterator), ["b"])
+        t.join()
+
+        # a single result is yielded once
+        res = RunResult()
+        res.set_result([1, 2])
+        self.assertEqual(list(res.items()), [[1, 2]])